@@ -4,10 +4,13 @@ from fastapi.responses import JSONResponse
 from fastapi.staticfiles import StaticFiles
 from views import static_pages
 from controllers import user_controller, diary_controller, pic_controller, match_controller
+from dependencies import async_db, pool
+from services.diary_keywords import ensure_keywords_schema
 import logging
 import traceback
 import threading
 import time
+import asyncio
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -35,6 +38,28 @@ app.include_router(match_controller.router)
 # print(f"Current root_path: {root_path}")
 
 
+# 背景工作：asyncio 資料庫連線池、到期的配對請求、配對索引、跨 worker 的 WebSocket 轉送、PDF 匯出行程池、快取失效訂閱
+# 開始接受請求前先確認資料表結構（diary_entries.keywords）
+@app.on_event("startup")
+async def start_background_tasks():
+    await asyncio.to_thread(ensure_keywords_schema, pool)
+    await async_db.start()
+    match_controller.expiry_scheduler.start()
+    match_controller.partner_index_updater.start()
+    await match_controller.manager.start()
+    await diary_controller.pdf_exporter.start()
+    await match_controller.hot_cache.start()
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    await match_controller.expiry_scheduler.stop()
+    await match_controller.partner_index_updater.stop()
+    await match_controller.manager.stop()
+    await diary_controller.pdf_exporter.stop()
+    await match_controller.hot_cache.stop()
+    await async_db.stop()
+
+
 # 清理連接的線程
 # def cleanup_connections():
 #     while True:
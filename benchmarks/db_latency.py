@@ -0,0 +1,223 @@
+import argparse
+import asyncio
+import json
+import platform
+import time
+from contextlib import closing
+from datetime import datetime
+from typing import Dict, List
+import numpy as np
+from services.async_db import AsyncDatabase
+
+
+# 同一個 event loop 上混合快查詢與慢查詢，量測快查詢的延遲分佈：
+# 同步驅動（原本 async handler 裡直接呼叫 mysql.connector）執行慢查詢時整個 loop 停住，快查詢只能排隊
+# 預設以模擬的連線池執行（查詢照樣經過 AsyncDatabase）；--live 時連線到資料庫
+DEFAULTS = {
+    "fast_requests": 2000,
+    "fast_interval": 0.002,
+    "fast_query": 0.002,
+    "slow_every": 50,
+    "slow_query": 0.5,
+    "pool_size": 15,
+}
+
+
+class SimulatedSyncPool:
+    # 沒有資料庫時代替 mysql.connector 連線池：SELECT SLEEP 以 time.sleep 模擬，查詢期間佔住執行緒
+    def get_connection(self):
+        return _SimulatedSyncConnection()
+
+
+class _SimulatedSyncConnection:
+    def cursor(self, dictionary=False):
+        return _SimulatedSyncCursor()
+
+    def close(self):
+        pass
+
+
+class _SimulatedSyncCursor:
+    def execute(self, query, params=()):
+        time.sleep(params[0])
+
+    def fetchall(self):
+        return [(0,)]
+
+    def close(self):
+        pass
+
+
+class SimulatedAsyncPool:
+    # 沒有資料庫時代替 aiomysql 連線池，讓查詢照樣經過 AsyncDatabase：
+    # 連線數以 maxsize 限制，SELECT SLEEP 以 asyncio.sleep 模擬
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.slots = asyncio.Semaphore(maxsize)
+        self.acquired = 0
+        self.released = 0
+
+    async def acquire(self):
+        await self.slots.acquire()
+        self.acquired += 1
+        return _SimulatedAsyncConnection()
+
+    def release(self, raw):
+        self.released += 1
+        self.slots.release()
+
+    def close(self):
+        pass
+
+    async def wait_closed(self):
+        pass
+
+
+class _SimulatedAsyncConnection:
+    def cursor(self, cursor_class=None):
+        return _SimulatedAsyncCursor()
+
+    async def commit(self):
+        pass
+
+    async def rollback(self):
+        pass
+
+
+class _SimulatedAsyncCursor:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        pass
+
+    async def execute(self, query, params=()):
+        await asyncio.sleep(params[0])
+
+    async def fetchall(self):
+        return [(0,)]
+
+
+def simulated_database(pool_size: int) -> AsyncDatabase:
+    database = AsyncDatabase({}, maxsize=pool_size)
+    database.pool = SimulatedAsyncPool(pool_size)
+    return database
+
+
+class BlockingDriver:
+    # 原本的做法：async handler 裡直接以同步連線池查詢，查詢期間佔住 event loop
+    name = "blocking"
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    async def query(self, seconds: float):
+        with closing(self.pool.get_connection()) as db:
+            cursor = db.cursor()
+            cursor.execute("SELECT SLEEP(%s)", (seconds,))
+            cursor.fetchall()
+            cursor.close()
+
+
+class AsyncDriver:
+    # 控制器現在的做法：經過 AsyncDatabase 取得連線，等待資料庫時讓出 event loop
+    name = "async"
+
+    def __init__(self, database: AsyncDatabase):
+        self.database = database
+
+    async def query(self, seconds: float):
+        async with self.database.connection() as db:
+            async with db.cursor() as cursor:
+                await cursor.execute("SELECT SLEEP(%s)", (seconds,))
+                await cursor.fetchall()
+
+
+def _percentiles(latencies: List[float]) -> Dict:
+    ms = np.array(latencies) * 1000
+    return {
+        "count": len(latencies),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "max_ms": float(ms.max()),
+    }
+
+
+async def run_workload(driver, fast_requests: int, fast_interval: float, fast_query: float,
+                       slow_every: int, slow_query: float) -> Dict:
+    # 開放式負載：快請求依固定間隔到達，延遲從預定到達時間算起（loop 被卡住時的排隊時間也算進去）
+    fast_latencies, slow_latencies = [], []
+
+    async def request(seconds: float, scheduled: float, latencies: List[float]):
+        await driver.query(seconds)
+        latencies.append(time.perf_counter() - scheduled)
+
+    tasks = []
+    started = time.perf_counter()
+    for i in range(fast_requests):
+        scheduled = started + i * fast_interval
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if i % slow_every == 0:
+            tasks.append(asyncio.create_task(request(slow_query, scheduled, slow_latencies)))
+        tasks.append(asyncio.create_task(request(fast_query, scheduled, fast_latencies)))
+    await asyncio.gather(*tasks)
+    return {
+        "driver": driver.name,
+        "seconds": time.perf_counter() - started,
+        "fast": _percentiles(fast_latencies),
+        "slow": _percentiles(slow_latencies),
+    }
+
+
+def run_benchmarks(fast_requests: int = DEFAULTS["fast_requests"], fast_interval: float = DEFAULTS["fast_interval"],
+                   fast_query: float = DEFAULTS["fast_query"], slow_every: int = DEFAULTS["slow_every"],
+                   slow_query: float = DEFAULTS["slow_query"], pool_size: int = DEFAULTS["pool_size"],
+                   live: bool = False) -> Dict:
+    workload = (fast_requests, fast_interval, fast_query, slow_every, slow_query)
+
+    async def run():
+        if live:
+            from dependencies import pool, async_db
+            database = async_db
+        else:
+            pool, database = SimulatedSyncPool(), simulated_database(pool_size)
+        try:
+            return [await run_workload(driver, *workload) for driver in (BlockingDriver(pool), AsyncDriver(database))]
+        finally:
+            await database.stop()
+
+    return {
+        "benchmark": "db_latency",
+        "created_at": datetime.utcnow().isoformat(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "mode": "live" if live else "simulated",
+        "workload": dict(zip(["fast_requests", "fast_interval", "fast_query", "slow_every", "slow_query"], workload),
+                         pool_size=pool_size),
+        "results": asyncio.run(run())
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="量測慢查詢同時進行時快查詢的 p99 延遲（同步驅動 vs asyncio 驅動），輸出 JSON")
+    for name, value in DEFAULTS.items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=type(value), default=value)
+    parser.add_argument("--live", action="store_true", help="連線到 .env 設定的資料庫，以 SELECT SLEEP 產生查詢延遲")
+    parser.add_argument("--output", default=None, help="寫入檔案，預設輸出到 stdout")
+    args = parser.parse_args(argv)
+
+    report = run_benchmarks(args.fast_requests, args.fast_interval, args.fast_query, args.slow_every,
+                            args.slow_query, args.pool_size, args.live)
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+import argparse
+import json
+import multiprocessing
+import platform
+import random
+import resource
+import sys
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+import numpy as np
+from benchmarks.synthetic import make_population
+from services.matching import calculate_similarity, match_users
+from services.tokenizer import tokenize
+
+
+# 各規模的配對設定：小規模用原本的 greedy，100k 改用 LSH 候選 + sorted_edge（greedy 需要數分鐘）
+PRESETS = {
+    "1k": {"users": 1000, "pairing": "greedy", "candidate_k": None},
+    "10k": {"users": 10000, "pairing": "greedy", "candidate_k": None},
+    "100k": {"users": 100000, "pairing": "sorted_edge", "candidate_k": 10},
+}
+SIMILARITY_SAMPLE_PAIRS = 20000
+
+
+def _peak_rss_mb() -> float:
+    # Linux 的 ru_maxrss 單位是 KB，macOS 是 bytes
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def run_size(name: str, users: int, pairing: str = "greedy", candidate_k: Optional[int] = None,
+             seed: int = 0, target_keyword: str = None) -> Dict:
+    population = make_population(users, seed=seed)
+    rss_after_population = _peak_rss_mb()
+    result = {"name": name, "users": users, "pairing": pairing, "candidate_k": candidate_k,
+              "diary_entries": sum(len(user.diary_entries) for user in population)}
+
+    # 關鍵字擷取：寫入日記時每篇斷詞一次，之後配對讀取預先斷好的關鍵字
+    started = time.perf_counter()
+    for user in population:
+        user.diary_entries = [entry._replace(keywords=tokenize(entry.content)) for entry in user.diary_entries]
+    elapsed = time.perf_counter() - started
+    result["keyword_extraction"] = {
+        "seconds": elapsed,
+        "entries_per_second": result["diary_entries"] / elapsed
+    }
+    started = time.perf_counter()
+    keyword_count = sum(len(user.get_all_keywords()) for user in population)
+    elapsed = time.perf_counter() - started
+    result["keyword_union"] = {
+        "seconds": elapsed,
+        "users_per_second": users / elapsed,
+        "mean_keywords_per_user": keyword_count / users
+    }
+
+    # 逐對呼叫 calculate_similarity（隨機抽樣的用戶對）
+    rng = random.Random(seed)
+    pairs = [tuple(rng.sample(population, 2)) for _ in range(SIMILARITY_SAMPLE_PAIRS)]
+    started = time.perf_counter()
+    scores = [calculate_similarity(user1, user2, target_keyword) for user1, user2 in pairs]
+    elapsed = time.perf_counter() - started
+    result["calculate_similarity"] = {
+        "pairs": len(pairs),
+        "seconds": elapsed,
+        "pairs_per_second": len(pairs) / elapsed,
+        "random_pair_mean": float(np.mean(scores))
+    }
+
+    # 完整配對流程（資料已在記憶體中，不含資料庫寫入）
+    started = time.perf_counter()
+    matches, pairing_result = match_users(population, target_keyword, candidate_k=candidate_k, pairing=pairing)
+    elapsed = time.perf_counter() - started
+    result["daily_matching"] = {
+        "strategy": pairing_result.strategy,
+        "seconds": elapsed,
+        "users_per_second": users / elapsed,
+        "pairs": len(matches),
+        "matched_fraction": 2 * len(matches) / users,
+        "total_similarity": pairing_result.total_similarity,
+        "mean_pair_similarity": pairing_result.total_similarity / len(matches) if matches else 0.0
+    }
+    result["memory"] = {
+        "population_rss_mb": rss_after_population,
+        "peak_rss_mb": _peak_rss_mb()
+    }
+    return result
+
+
+def _run_in_child(args, queue):
+    queue.put(run_size(*args))
+
+
+def run_benchmarks(sizes: List[str], seed: int = 0, target_keyword: str = None, isolate: bool = True) -> Dict:
+    results = []
+    for name in sizes:
+        preset = PRESETS[name]
+        args = (name, preset["users"], preset["pairing"], preset["candidate_k"], seed, target_keyword)
+        if isolate:
+            # 每個規模在獨立的 process 執行，peak_rss_mb 才不會被前一個規模影響
+            ctx = multiprocessing.get_context("fork")
+            queue = ctx.Queue()
+            process = ctx.Process(target=_run_in_child, args=(args, queue))
+            process.start()
+            results.append(queue.get())
+            process.join()
+        else:
+            results.append(run_size(*args))
+    return {
+        "benchmark": "matching",
+        "created_at": datetime.utcnow().isoformat(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "seed": seed,
+        "target_keyword": target_keyword,
+        "results": results
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="以合成用戶資料量測配對效能，輸出 JSON")
+    parser.add_argument("--sizes", nargs="+", choices=list(PRESETS), default=list(PRESETS))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--keyword", default=None)
+    parser.add_argument("--output", default=None, help="寫入檔案，預設輸出到 stdout")
+    args = parser.parse_args(argv)
+
+    report = run_benchmarks(args.sizes, args.seed, args.keyword)
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+import argparse
+import json
+import platform
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List
+import pydantic
+from fastapi.responses import JSONResponse
+from models.diary import DiaryEntryResponse, MoodData
+from services.response_cache import DIARY_LIST_ADAPTER, dump_entries, json_response
+
+
+# 以 100 篇日記的列表量測每個請求在快取命中／未命中時花掉的 CPU 時間
+# 舊的做法：命中時 json.loads，再由 FastAPI 依 response_model 驗證、轉成 JSON 相容物件、以 json.dumps 輸出
+# 新的做法：命中時原樣回傳快取的 bytes；未命中時整批驗證與序列化一次
+ENTRIES = 100
+ITERATIONS = 500
+
+
+def make_entries(count: int = ENTRIES) -> List[Dict]:
+    start = datetime(2024, 1, 1, 8)
+    return [{
+        "id": i,
+        "user_id": 1,
+        "title": f"第 {i} 天",
+        "content": "今天去海邊散步，天氣很好，心情也跟著明亮起來。" * 6,
+        "image_url": f"https://cdn.example.com/{i}.jpg" if i % 3 == 0 else None,
+        "is_public": i % 2,
+        "date": (start + timedelta(days=i)).date().isoformat(),
+        "created_at": (start + timedelta(days=i)).isoformat(),
+        "updated_at": (start + timedelta(days=i, hours=1)).isoformat(),
+        "email": "user@example.com",
+        "mood_data": MoodData(mood_score=i % 5 + 1, weather="sunny"),
+    } for i in range(count)]
+
+
+def _fastapi_render(content) -> bytes:
+    # 與 FastAPI 處理 response_model 相同：驗證、轉成 JSON 相容物件、JSONResponse 以 json.dumps 輸出
+    validated = DIARY_LIST_ADAPTER.validate_python(content)
+    return JSONResponse(DIARY_LIST_ADAPTER.dump_python(validated, mode="json")).body
+
+
+def legacy_hit(cached: str) -> bytes:
+    return _fastapi_render(json.loads(cached))
+
+
+def legacy_miss(rows: List[Dict]) -> bytes:
+    entries = [DiaryEntryResponse(**row) for row in rows]
+    json.dumps([entry.dict() for entry in entries])
+    return _fastapi_render(entries)
+
+
+def fast_hit(cached: str) -> bytes:
+    return json_response(cached).body
+
+
+def fast_miss(rows: List[Dict]) -> bytes:
+    return json_response(dump_entries(rows)).body
+
+
+def _measure(func: Callable, arg, iterations: int) -> Dict:
+    func(arg)
+    cpu_started, wall_started = time.process_time(), time.perf_counter()
+    for _ in range(iterations):
+        func(arg)
+    cpu, wall = time.process_time() - cpu_started, time.perf_counter() - wall_started
+    return {"iterations": iterations, "cpu_us_per_request": cpu / iterations * 1e6,
+            "wall_us_per_request": wall / iterations * 1e6}
+
+
+def run_benchmarks(entries: int = ENTRIES, iterations: int = ITERATIONS) -> Dict:
+    rows = make_entries(entries)
+    # 兩種做法存進 Redis 的內容（decode_responses=True 讀回來是 str）
+    legacy_cached = json.dumps([DiaryEntryResponse(**row).dict() for row in rows])
+    fast_cached = dump_entries(rows).decode()
+    assert json.loads(fast_hit(fast_cached)) == json.loads(legacy_hit(legacy_cached))
+
+    results = {
+        "legacy_hit": _measure(legacy_hit, legacy_cached, iterations),
+        "fast_hit": _measure(fast_hit, fast_cached, iterations),
+        "legacy_miss": _measure(legacy_miss, rows, iterations),
+        "fast_miss": _measure(fast_miss, rows, iterations),
+    }
+    for path in ("hit", "miss"):
+        results[f"{path}_speedup"] = (results[f"legacy_{path}"]["cpu_us_per_request"]
+                                      / max(results[f"fast_{path}"]["cpu_us_per_request"], 1e-9))
+    return {
+        "benchmark": "response_cache",
+        "created_at": datetime.utcnow().isoformat(),
+        "python": platform.python_version(),
+        "pydantic": pydantic.VERSION,
+        "machine": platform.machine(),
+        "entries": entries,
+        "response_bytes": len(fast_cached.encode()),
+        "results": results
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="量測日記列表快取回應每個請求的 CPU 時間，輸出 JSON")
+    parser.add_argument("--entries", type=int, default=ENTRIES)
+    parser.add_argument("--iterations", type=int, default=ITERATIONS)
+    parser.add_argument("--output", default=None, help="寫入檔案，預設輸出到 stdout")
+    args = parser.parse_args(argv)
+
+    report = run_benchmarks(args.entries, args.iterations)
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+from datetime import date, timedelta
+from typing import List
+import numpy as np
+from services.diary_loader import MatchDiaryEntry
+from services.match_snapshot import WEATHER_TYPES
+from services.matching import User
+
+
+# 合成的詞彙：英文與中文詞彙混合，依 Zipf 分布抽樣（少數常見詞、大量長尾詞）
+_EN_SYLLABLES = np.array(["ka", "lo", "mi", "ra", "su", "te", "no", "vi", "da", "pe", "zo", "ul", "an", "or", "ex", "ti"])
+_CJK_CHARS = np.array(list("天氣心情咖啡跑步旅行音樂家人朋友工作學習下雨晴朗電影散步早餐晚餐週末開心難過累了想念海邊公園書店貓狗考試加班"))
+
+
+def make_vocabulary(size: int, seed: int = 0, cjk_ratio: float = 0.5) -> List[str]:
+    rng = np.random.default_rng(seed)
+    vocabulary = {}
+    while len(vocabulary) < size:
+        n = size - len(vocabulary)
+        is_cjk = rng.random(n) < cjk_ratio
+        lengths = np.where(is_cjk, rng.integers(2, 4, n), rng.integers(2, 5, n))
+        cjk = _CJK_CHARS[rng.integers(0, len(_CJK_CHARS), (n, 3))]
+        en = _EN_SYLLABLES[rng.integers(0, len(_EN_SYLLABLES), (n, 4))]
+        for i in range(n):
+            parts = cjk[i] if is_cjk[i] else en[i]
+            vocabulary.setdefault("".join(parts[:lengths[i]]), None)
+    # 打亂順序，讓 Zipf 排名與字母順序無關
+    words = list(vocabulary)[:size]
+    return [words[i] for i in rng.permutation(size)]
+
+
+def make_population(count: int, seed: int = 0, vocabulary_size: int = 20000, zipf_a: float = 1.2,
+                    mean_entries: float = 8.0, words_per_entry: int = 24, days: int = 30) -> List[User]:
+    # 每位用戶：日記數 ~ Poisson、每篇日記的詞 ~ Zipf、心情分數有個人偏差、天氣有個人偏好
+    rng = np.random.default_rng(seed)
+    vocabulary = np.array(make_vocabulary(vocabulary_size, seed))
+    today = date(2024, 9, 1)
+    dates = [(today - timedelta(days=d)).isoformat() for d in range(days)]
+
+    entry_counts = np.minimum(rng.poisson(mean_entries, count), days)
+    like_counts = np.minimum(rng.zipf(1.8, count) - 1, 500)
+    # 每位用戶隨機挑 entry_counts 天寫日記
+    entry_days = np.argsort(rng.random((count, days)), axis=1)
+
+    total_words = int(entry_counts.sum()) * words_per_entry
+    # Zipf 排名超出詞彙量的折回長尾
+    words = vocabulary[(rng.zipf(zipf_a, total_words) - 1) % vocabulary_size]
+
+    mood_counts = np.maximum(entry_counts, 1)
+    mood_scores = np.clip(np.rint(rng.normal(np.repeat(rng.normal(3.0, 0.8, count), mood_counts), 1.0)), 1, 5)
+    mood_offsets = np.concatenate([[0], np.cumsum(mood_counts)])
+    weather = rng.multinomial(mood_counts, rng.dirichlet(np.ones(len(WEATHER_TYPES)), count))
+
+    users = []
+    offset = 0
+    for i in range(count):
+        user = User(i + 1)
+        n_entries = int(entry_counts[i])
+        chosen = np.sort(entry_days[i, :n_entries])[::-1]
+        entries = []
+        for d in chosen:
+            entries.append(MatchDiaryEntry(dates[d], " ".join(words[offset:offset + words_per_entry])))
+            offset += words_per_entry
+        user.diary_entries = entries
+        # 等同 calculate_posting_frequency，直接以天數索引計算以免逐篇解析日期
+        user.posting_frequency = n_entries / (int(chosen[0] - chosen[-1]) + 1) if n_entries else 0.0
+        user.like_count = int(like_counts[i])
+        user.mood_scores = mood_scores[mood_offsets[i]:mood_offsets[i + 1]].tolist()
+        user.calculate_avg_mood_score()
+        user.weather_counts = dict(zip(WEATHER_TYPES, weather[i].tolist()))
+        users.append(user)
+    return users
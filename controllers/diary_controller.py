@@ -1,8 +1,6 @@
 from fastapi import FastAPI, HTTPException, APIRouter, Depends, Query
 from fastapi.responses import JSONResponse, StreamingResponse, FileResponse
 from pydantic import BaseModel
-import mysql.connector
-from mysql.connector import Error
 import boto3
 import uuid
 from dotenv import load_dotenv
@@ -11,21 +9,25 @@ from botocore.config import Config
 from fastapi.encoders import jsonable_encoder
 from datetime import datetime, date
 from typing import List, Dict, Union
-from models.diary import PresigneUrlRequest, DiaryEntryResponse, DiaryEntryRequest, MoodEntryRequest, MoodEntryResponse, MoodData, ProfileUpdateRequest
-from dependencies import get_db, get_current_user
+from models.diary import PresigneUrlRequest, DiaryEntryResponse, DiaryEntryRequest, DiaryEntryPage, MoodEntryRequest, MoodEntryResponse, MoodData, ProfileUpdateRequest
+from dependencies import get_db, get_current_user, async_db
+from controllers.match_controller import notify_partner_diary_updated, partner_index_updater, hot_cache
+from services.diary_keywords import keywords_for
+from services.diary_pages import MAX_PAGE_SIZE, PAGE_CACHE_TTL, InvalidCursor, load_diary_page
+from services.diary_export import STREAM_FORMATS, stream_export
+from services.pdf_export import PdfExporter
+from services.async_db import AsyncConnection, DatabaseError
+from services.response_cache import dump_entry, dump_entries, json_response
+from services.user_batch import (
+    AVATAR_CACHE_TTL, AVATAR_COLUMNS, PROFILE_CACHE_TTL, PROFILE_COLUMNS, avatar_key, profile_key, parse_ids, load_users_batch,
+    forbidden_profile_ids
+)
+from services.diary_cache import (
+    get_generation, bump_generation, diary_list_key, diary_page_key, diary_entry_key, diary_date_key
+)
 import pytz
 import redis.asyncio as redis
 import json
-import io
-import csv
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter
-from reportlab.lib import colors
-from reportlab.pdfbase.ttfonts import TTFont
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.cidfonts import UnicodeCIDFont
 
 
 
@@ -35,6 +37,8 @@ from reportlab.pdfbase.cidfonts import UnicodeCIDFont
 
 
 redis_client = redis.Redis(host='redis', port=6379, decode_responses=True)
+# 由 app.py 在啟動時建立行程池、關閉時停止
+pdf_exporter = PdfExporter(redis_client, async_db)
 
 # 設置日誌記錄
 import logging
@@ -56,175 +60,138 @@ async def get_diary_entries(
     skip: int = 0,
     limit: int = 100,
     current_user: Dict = Depends(get_current_user),
-    db: mysql.connector.connection.MySQLConnection = Depends(get_db)
+    db: AsyncConnection = Depends(get_db)
 ):
 
-    cache_key = f"diary_entries:{current_user['id']}"
+    # 每個 skip/limit 組合各自快取，第二頁不會拿到第一頁的資料；寫入後世代改變，舊的快取不會再被讀到
+    generation = await get_generation(redis_client, current_user['id'])
+    cache_key = diary_list_key(current_user['id'], generation, skip, limit)
+    cached_entries = await redis_client.get(cache_key)
+    if cached_entries:
+        return json_response(cached_entries)
+
     cursor = None
     try:
-        # 首先檢查是否有新的日記條目
         cursor = db.cursor(dictionary=True)
-        check_query = "SELECT MAX(id) as last_id FROM diary_entries WHERE user_id = %s"
-        cursor.execute(check_query, (current_user["id"],))
-        last_id = cursor.fetchone()['last_id']
-
-        cached_last_id = await redis_client.get(f"{cache_key}:last_id")
+        query = "SELECT * FROM diary_entries WHERE user_id = %s ORDER BY date DESC LIMIT %s OFFSET %s"
+        await cursor.execute(query, (current_user["id"], limit, skip))
+        entries = await cursor.fetchall()
 
-        # 如果沒有緩存或者有新的更新，則查詢數據庫
-        if not cached_last_id or (last_id and str(last_id) > cached_last_id):
-            query = "SELECT * FROM diary_entries WHERE user_id = %s ORDER BY date DESC LIMIT %s OFFSET %s"
-            cursor.execute(query, (current_user["id"], limit, skip))
-            entries = cursor.fetchall()
-
-            for entry in entries:
-                entry['date'] = entry['date'].isoformat() 
-                entry['created_at'] = datetime.now().isoformat()
-                entry['updated_at'] = datetime.now().isoformat()
-            
-            entries_response = [DiaryEntryResponse(**entry) for entry in entries]
-
-            await redis_client.set(cache_key, json.dumps([entry.dict() for entry in entries_response]), ex=300)  # 設置5分鐘過期
-            if last_id:
-                await redis_client.set(f"{cache_key}:last_id", str(last_id), ex=300)
-                
-            return entries_response
-        else:
-            # 如果沒有新的更新，使用緩存的數據
-            cached_entries = await redis_client.get(cache_key)
+        for entry in entries:
+            entry['date'] = entry['date'].isoformat() 
+            entry['created_at'] = datetime.now().isoformat()
+            entry['updated_at'] = datetime.now().isoformat()
+        
+        body = dump_entries(entries)
 
-            return json.loads(cached_entries)
+        await redis_client.set(cache_key, body, ex=300)  # 設置5分鐘過期
+        return json_response(body)
 
-    except mysql.connector.Error as e:
+    except DatabaseError as e:
         raise HTTPException(status_code=500, detail=f"資料庫錯誤: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"發生意外錯誤: {str(e)}")
     finally:
         if cursor:
-            cursor.close()
+            await cursor.close()
 
-@router.get("/api/v1/diary_entries/export")
-async def download_moods(
-    format: str = Query(..., regex="^(json|csv|pdf)$"),
-    current_user: dict = Depends(get_current_user),
-    db: mysql.connector.connection.MySQLConnection = Depends(get_db)
+@router.get("/api/v1/diary_entries/page", response_model=DiaryEntryPage)
+async def get_diary_page(
+    cursor: str = None,
+    limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE),
+    current_user: Dict = Depends(get_current_user),
+    db: AsyncConnection = Depends(get_db)
 ):
+    # 以 (date, id) 游標分頁：每一頁的成本都與第一頁相同，快取鍵包含游標與頁面大小
+    generation = await get_generation(redis_client, current_user['id'])
+    cache_key = diary_page_key(current_user['id'], generation, limit, cursor)
+    cached_page = await redis_client.get(cache_key)
+    if cached_page:
+        return json.loads(cached_page)
+
     try:
-        cursor = db.cursor(dictionary=True)
-        query = "SELECT * FROM diary_entries WHERE user_id = %s ORDER BY date DESC"
-        cursor.execute(query, (current_user["id"],))
-        entries = cursor.fetchall()
+        entries, next_cursor = await load_diary_page(db, current_user['id'], limit, cursor)
+    except InvalidCursor:
+        raise HTTPException(status_code=400, detail="無效的分頁游標")
+    except DatabaseError as e:
+        raise HTTPException(status_code=500, detail=f"資料庫錯誤: {str(e)}")
 
-        for entry in entries:
-            entry['date'] = entry['date'].isoformat()
-            entry['created_at'] = entry['created_at'].isoformat()
-            entry['updated_at'] = entry['updated_at'].isoformat()
-
-        if format == 'json':
-            return create_json_response(entries)
-        elif format == 'csv':
-            return create_csv_response(entries)
-        elif format == 'pdf':
-            return await create_pdf_response(entries)
-
-    except mysql.connector.Error as e:
-        raise HTTPException(status_code=500, detail=f"Database Error: {str(e)}")
-    finally:
-        cursor.close()
-
-def create_json_response(entries):
-    json_data = json.dumps(entries, ensure_ascii=False, indent=2)
-    return StreamingResponse(
-        io.StringIO(json_data),
-        media_type="application/json",
-        headers={"Content-Disposition": "attachment; filename=my_moods.json"}
-    )
-
-def create_csv_response(entries):
-    output = io.StringIO()
-    writer = csv.DictWriter(output, fieldnames=entries[0].keys())
-    writer.writeheader()
-    for entry in entries:
-        writer.writerow(entry)
-    output.seek(0)
-    return StreamingResponse(
-        io.StringIO(output.getvalue()),
-        media_type="text/csv",
-        headers={"Content-Disposition": "attachment; filename=my_moods.csv"}
-    )
-
-async def create_pdf_response(entries):
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter)
-    elements = []
-
-    # 註冊 CID 字體
-    pdfmetrics.registerFont(UnicodeCIDFont("STSong-Light"))
-
-    styles = getSampleStyleSheet()
-    # 修改 Chinese 樣式使用 CID 字體
-    styles.add(ParagraphStyle(name='Chinese', fontName='STSong-Light', fontSize=12))
-
-    title = Paragraph("My Mood Diary", styles['Title'])
-    elements.append(title)
-
-    data = [['Date', 'Content']]
     for entry in entries:
-        data.append([
-            entry['date'],
-            Paragraph(entry['content'], styles['Chinese'])
-        ])
-
-    page_width = letter[0]
-    col_widths = [page_width * 0.25, page_width * 0.75]  # 25% 給日期，75% 給內容
-
-    table = Table(data, colWidths=col_widths)
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),  # 改為左對齊
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 14),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-        ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 1), (-1, -1), 'STSong-Light'),  # 使用 CID 字體
-        ('FONTSIZE', (0, 1), (-1, -1), 12),
-        ('TOPPADDING', (0, 1), (-1, -1), 6),
-        ('BOTTOMPADDING', (0, 1), (-1, -1), 6),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ('VALIGN', (0, 0), (-1, -1), 'TOP'),  # 垂直對齊頂部
-        ('WORDWRAP', (0, 0), (-1, -1), True),  # 自動換行
-    ]))
-    elements.append(table)
-
-    doc.build(elements)
-    buffer.seek(0)
-    return StreamingResponse(
-        buffer,
-        media_type="application/pdf",
-        headers={"Content-Disposition": "attachment; filename=my_moods.pdf"}
-    )
+        entry['date'] = entry['date'].isoformat()
+        entry['created_at'] = entry['created_at'].isoformat()
+        entry['updated_at'] = entry['updated_at'].isoformat()
+    page = DiaryEntryPage(entries=[DiaryEntryResponse(**entry) for entry in entries], next_cursor=next_cursor)
 
+    await redis_client.set(cache_key, json.dumps(page.dict()), ex=PAGE_CACHE_TTL)
+    return page
+
+@router.get("/api/v1/diary_entries/export")
+async def download_moods(
+    format: str = Query(..., regex="^(json|ndjson|csv|pdf)$"),
+    start: date = None,
+    end: date = None,
+    gzip: bool = False,
+    current_user: dict = Depends(get_current_user)
+):
+    if start and end and start > end:
+        raise HTTPException(status_code=400, detail="start must not be after end")
+
+    if format in STREAM_FORMATS:
+        # JSON / NDJSON / CSV 邊讀邊送，不在記憶體中組出整份檔案
+        chunks, media_type, filename = stream_export(async_db, current_user["id"], format, start, end, gzip)
+        return StreamingResponse(chunks, media_type=media_type,
+                                 headers={"Content-Disposition": f"attachment; filename={filename}"})
+
+    # PDF 在行程池中產生，先回傳 job id，完成後由下載端點取得檔案
+    job = await pdf_exporter.submit(current_user["id"], start, end)
+    return JSONResponse(status_code=202, content=_pdf_job_response(job))
+
+def _pdf_job_response(job):
+    response = {"job_id": job["job_id"], "status": job["status"]}
+    if job["status"] == "done":
+        response["download_url"] = f"/api/v1/diary_entries/export/jobs/{job['job_id']}/download"
+    if job.get("error"):
+        response["error"] = job["error"]
+    return response
+
+@router.get("/api/v1/diary_entries/export/jobs/{job_id}")
+async def get_pdf_export_job(job_id: str, current_user: dict = Depends(get_current_user)):
+    job = await pdf_exporter.get_status(job_id, current_user["id"])
+    if not job:
+        raise HTTPException(status_code=404, detail="Export job not found")
+    return _pdf_job_response(job)
+
+@router.get("/api/v1/diary_entries/export/jobs/{job_id}/download")
+async def download_pdf_export(job_id: str, current_user: dict = Depends(get_current_user)):
+    job = await pdf_exporter.get_status(job_id, current_user["id"])
+    if not job:
+        raise HTTPException(status_code=404, detail="Export job not found")
+    if job["status"] != "done":
+        raise HTTPException(status_code=409, detail=f"Export job is {job['status']}")
+    path = pdf_exporter.file_path(job_id)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Export file expired")
+    return FileResponse(path, media_type="application/pdf", filename="my_moods.pdf")
 
 @router.get("/api/v1/diary_entries/{param}", response_model=Union[List[DiaryEntryResponse], DiaryEntryResponse])
 async def get_diary_entry(
     param: str,
     current_user: Dict = Depends(get_current_user),
-    db: mysql.connector.connection.MySQLConnection = Depends(get_db)
+    db: AsyncConnection = Depends(get_db)
 ):
+    generation = await get_generation(redis_client, current_user['id'])
     try:
         entry_id = int(param)
-        cache_key = f"diary_entry:{current_user['id']}:{entry_id}"
+        cache_key = diary_entry_key(current_user['id'], generation, entry_id)
     except ValueError:
-        cache_key = f"diary_entries_date:{current_user['id']}:{param}"
+        cache_key = diary_date_key(current_user['id'], generation, param)
 
     logger.debug(f"Checking cache with key: {cache_key}")
 
     cached_entry = await redis_client.get(cache_key)
     if cached_entry:
         logger.info(f"Cache hit for key: {cache_key}")        
-        return json.loads(cached_entry)
+        return json_response(cached_entry)
     else:
         logger.info(f"Cache miss for key: {cache_key}")
 
@@ -259,8 +226,8 @@ async def get_diary_entry(
             WHERE 
                 diary_entries.id = %s AND diary_entries.user_id = %s
             """
-            cursor.execute(query, (entry_id, current_user["id"]))
-            entry = cursor.fetchone()
+            await cursor.execute(query, (entry_id, current_user["id"]))
+            entry = await cursor.fetchone()
             
             if not entry:
                 raise HTTPException(status_code=404, detail="未找到指定 ID 的日記條目")
@@ -274,10 +241,10 @@ async def get_diary_entry(
             weather = entry.pop('weather')
             entry['mood_data'] = MoodData(mood_score=mood_score, weather=weather) if mood_score is not None or weather is not None else None
 
-            response = DiaryEntryResponse(**entry)
+            body = dump_entry(entry)
 
-            await redis_client.set(cache_key, json.dumps(response.dict()), ex=3600)
-            return response
+            await redis_client.set(cache_key, body, ex=3600)
+            return json_response(body)
         
         except ValueError:
             # 如果不是 ID，則按原來的方式處理日期查詢
@@ -310,8 +277,8 @@ async def get_diary_entry(
                 diary_entries.date DESC
             """
             
-            cursor.execute(query, (current_user["id"], query_date))
-            entries = cursor.fetchall()
+            await cursor.execute(query, (current_user["id"], query_date))
+            entries = await cursor.fetchall()
             
             if not entries:
                 return []
@@ -324,18 +291,18 @@ async def get_diary_entry(
                 weather = entry.pop('weather')
                 entry['mood_data'] = MoodData(mood_score=mood_score, weather=weather) if mood_score is not None or weather is not None else None
 
-            response = [DiaryEntryResponse(**entry) for entry in entries]
+            body = dump_entries(entries)
 
-            await redis_client.set(cache_key, json.dumps([entry.dict() for entry in response]), ex=3600)
-            return response
+            await redis_client.set(cache_key, body, ex=3600)
+            return json_response(body)
         
-    except mysql.connector.Error as e:
+    except DatabaseError as e:
         raise HTTPException(status_code=500, detail=f"資料庫錯誤: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"發生意外錯誤: {str(e)}")
     finally:
         if cursor:
-            cursor.close()
+            await cursor.close()
 
 # 新增：在函數結束前添加一個緩存驗證步驟
     try:
@@ -348,17 +315,16 @@ async def get_diary_entry(
         logger.error(f"Error during cache verification: {str(e)}")
 
 
-# 新增: 在寫入操作後清除緩存的函數
-async def clear_diary_cache(user_id: int, date: str):
-    cache_key = f"diary_entries_date:{user_id}:{date}"
-    await redis_client.delete(cache_key)
+# 在寫入操作後清除緩存的函數：一次 INCR 讓此用戶所有日記與心情快取失效
+async def clear_diary_cache(user_id: int):
+    await bump_generation(redis_client, user_id)
 
 
 @router.post("/api/v1/diary_entries", response_model=DiaryEntryResponse)
 async def create_diary_entry(
     entry: DiaryEntryRequest,
     current_user: Dict = Depends(get_current_user),
-    db: mysql.connector.connection.MySQLConnection = Depends(get_db)
+    db: AsyncConnection = Depends(get_db)
 ):
     cursor = None
     try:
@@ -382,17 +348,18 @@ async def create_diary_entry(
         now_iso = datetime.now().isoformat()
 
         query = """
-        INSERT INTO diary_entries(user_id, title, content, date, is_public, image_url)
-        VALUES (%s, %s, %s, %s, %s, %s)
+        INSERT INTO diary_entries(user_id, title, content, date, is_public, image_url, keywords)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
         """
 
-        cursor.execute(query, (current_user["id"], entry.title, entry.content, entry_date,
-                                entry.is_public, entry.image_url))
-        db.commit()
+        # 寫入時就斷好關鍵字，配對時不必再處理原文
+        await cursor.execute(query, (current_user["id"], entry.title, entry.content, entry_date,
+                                entry.is_public, entry.image_url, keywords_for(entry.content)))
+        await db.commit()
         new_id = cursor.lastrowid
 
-        cursor.execute("SELECT * FROM diary_entries WHERE id = %s", (new_id,))
-        new_entry = cursor.fetchone()
+        await cursor.execute("SELECT * FROM diary_entries WHERE id = %s", (new_id,))
+        new_entry = await cursor.fetchone()
 
         if new_entry:
             # 轉換日期時間字段
@@ -403,26 +370,27 @@ async def create_diary_entry(
             response = DiaryEntryResponse(**new_entry)
 
             # 清除日記列表的快取
-            await redis_client.delete(f"diary_entries:{current_user['id']}:*")
-            await redis_client.delete(f"diary_entry:{current_user['id']}:{new_id}")
+            await clear_diary_cache(current_user['id'])
+            await notify_partner_diary_updated(db, current_user['id'], new_id)
+            partner_index_updater.schedule_refresh(current_user['id'])
 
             return response
         else:
             raise HTTPException(status_code=404, detail="新創建的條目無法找到")
-    except mysql.connector.Error as e:
+    except DatabaseError as e:
         raise HTTPException(status_code=500, detail=f"資料庫錯誤: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"發生意外錯誤: {str(e)}")
     finally:
         if cursor:
-            cursor.close()
+            await cursor.close()
 
 @router.put("/api/v1/diary_entries/{entry_id}", response_model=DiaryEntryResponse)
 async def update_diary_entry(
     entry_id: int,
     entry: DiaryEntryRequest,
     current_user: Dict = Depends(get_current_user),
-    db: mysql.connector.connection.MySQLConnection = Depends(get_db)
+    db: AsyncConnection = Depends(get_db)
 ):
     cursor = None
     try:
@@ -430,8 +398,8 @@ async def update_diary_entry(
 
         # 檢查條目是否存在且屬於當前用戶
         check_query = "SELECT * FROM diary_entries WHERE id = %s AND user_id = %s"
-        cursor.execute(check_query, (entry_id, current_user["id"]))
-        existing_entry = cursor.fetchone()
+        await cursor.execute(check_query, (entry_id, current_user["id"]))
+        existing_entry = await cursor.fetchone()
         if not existing_entry:
             raise HTTPException(status_code=404, detail="日記條目未找到或不屬於當前用戶")
 
@@ -451,19 +419,20 @@ async def update_diary_entry(
 
         update_query = """
         UPDATE diary_entries 
-        SET title = %s, content = %s, date = %s, is_public = %s, image_url = %s, updated_at = %s
+        SET title = %s, content = %s, date = %s, is_public = %s, image_url = %s, updated_at = %s, keywords = %s
         WHERE id = %s AND user_id = %s
         """
-        params = (entry.title, entry.content, entry_date, entry.is_public, entry.image_url, now_iso, entry_id, current_user["id"])
+        params = (entry.title, entry.content, entry_date, entry.is_public, entry.image_url, now_iso,
+                  keywords_for(entry.content), entry_id, current_user["id"])
 
-        cursor.execute(update_query, params)
-        db.commit()
+        await cursor.execute(update_query, params)
+        await db.commit()
 
         if cursor.rowcount == 0:
             raise HTTPException(status_code=404, detail="未找到要更新的日記條目")
 
-        cursor.execute("SELECT * FROM diary_entries WHERE id = %s", (entry_id,))
-        updated_entry = cursor.fetchone()
+        await cursor.execute("SELECT * FROM diary_entries WHERE id = %s", (entry_id,))
+        updated_entry = await cursor.fetchone()
         
         if updated_entry:
             # 轉換日期時間字段
@@ -474,26 +443,27 @@ async def update_diary_entry(
             response = DiaryEntryResponse(**updated_entry)
 
             # 清除相關快取
-            await redis_client.delete(f"diary_entries:{current_user['id']}:*")
-            await redis_client.delete(f"diary_entry:{current_user['id']}:{entry_id}")
+            await clear_diary_cache(current_user['id'])
+            await notify_partner_diary_updated(db, current_user['id'], entry_id)
+            partner_index_updater.schedule_refresh(current_user['id'])
 
             return response
         else:
             raise HTTPException(status_code=404, detail="更新後的條目無法找到")
 
-    except mysql.connector.Error as e:
+    except DatabaseError as e:
         raise HTTPException(status_code=500, detail=f"資料庫錯誤: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"發生意外錯誤: {str(e)}")
     finally:
         if cursor:
-            cursor.close()
+            await cursor.close()
 
 @router.delete("/api/v1/diary_entries/{entry_id}", response_model=Dict[str, str])
 async def delete_diary_entry(
     entry_id: int,
     current_user: Dict = Depends(get_current_user),
-    db: mysql.connector.connection.MySQLConnection = Depends(get_db)
+    db: AsyncConnection = Depends(get_db)
 ):
     cursor = None
     try:
@@ -501,47 +471,40 @@ async def delete_diary_entry(
         
         # 首先獲取要刪除的日記條目信息
         check_query = "SELECT * FROM diary_entries WHERE id = %s AND user_id = %s"
-        cursor.execute(check_query, (entry_id, current_user["id"]))
-        entry_to_delete = cursor.fetchone()
+        await cursor.execute(check_query, (entry_id, current_user["id"]))
+        entry_to_delete = await cursor.fetchone()
         
         if not entry_to_delete:
             raise HTTPException(status_code=404, detail="日記條目未找到或不屬於當前用戶")
 
         # 執行刪除操作
         delete_query = "DELETE FROM diary_entries WHERE id = %s AND user_id = %s"
-        cursor.execute(delete_query, (entry_id, current_user["id"]))
-        db.commit()
+        await cursor.execute(delete_query, (entry_id, current_user["id"]))
+        await db.commit()
 
         if cursor.rowcount == 0:
             raise HTTPException(status_code=404, detail="未找到要刪除的日記條目")
         
         # 清除所有相關的緩存
-        cache_keys_to_delete = [
-            f"diary_entries:{current_user['id']}*",
-            f"diary_entry:{current_user['id']}:{entry_id}",
-            f"diary_entries_date:{current_user['id']}:*"
-        ]
-
-        for key_pattern in cache_keys_to_delete:
-            matching_keys = await redis_client.keys(key_pattern)
-            if matching_keys:
-                await redis_client.delete(*matching_keys)
+        await clear_diary_cache(current_user['id'])
+        # 刪除的日記關鍵字不再算進配對索引
+        partner_index_updater.schedule_refresh(current_user['id'])
 
         return {"message": "日記條目已成功刪除，相關緩存已清理"}
         
-    except mysql.connector.Error as e:
+    except DatabaseError as e:
         raise HTTPException(status_code=500, detail=f"資料庫錯誤: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"發生意外錯誤: {str(e)}")
     finally:
         if cursor:
-            cursor.close()
+            await cursor.close()
 
 @router.post("/api/v1/mood_entries", response_model=MoodEntryResponse)
 async def save_mood_entry(
     mood_entry: MoodEntryRequest,
     current_user: dict = Depends(get_current_user),
-    db: mysql.connector.connection.MySQLConnection = Depends(get_db)
+    db: AsyncConnection = Depends(get_db)
 ):
 
     if mood_entry.mood_score is not None and (mood_entry.mood_score < 1 or mood_entry.mood_score > 5):
@@ -553,8 +516,8 @@ async def save_mood_entry(
         now_iso = datetime.now().isoformat()
 
         check_query = "SELECT id FROM mood_entries WHERE user_id = %s AND date = %s"
-        cursor.execute(check_query, (current_user["id"], mood_entry.date))
-        existing_entry = cursor.fetchone()
+        await cursor.execute(check_query, (current_user["id"], mood_entry.date))
+        existing_entry = await cursor.fetchone()
 
         if existing_entry:
             # 更新現有記錄
@@ -563,7 +526,7 @@ async def save_mood_entry(
             SET mood_score = %s, weather = %s, note = %s
             WHERE id = %s AND user_id = %s
             """
-            cursor.execute(update_query, (
+            await cursor.execute(update_query, (
                 mood_entry.mood_score if mood_entry.mood_score is not None else None,
                 mood_entry.weather,
                 mood_entry.note,
@@ -576,7 +539,7 @@ async def save_mood_entry(
             INSERT INTO mood_entries (user_id, mood_score, date, weather, note)
             VALUES (%s, %s, %s, %s, %s)
             """
-            cursor.execute(insert_query, (
+            await cursor.execute(insert_query, (
                 current_user["id"],
                 mood_entry.mood_score if mood_entry.mood_score is not None else None,
                 mood_entry.date,
@@ -585,7 +548,7 @@ async def save_mood_entry(
             ))
             entry_id = cursor.lastrowid
 
-        db.commit()
+        await db.commit()
 
         if existing_entry:
             entry_id = existing_entry['id']
@@ -594,25 +557,25 @@ async def save_mood_entry(
 
         # 獲取保存的記錄
         select_query = "SELECT * FROM mood_entries WHERE id = %s"
-        cursor.execute(select_query, (entry_id,))
-        saved_entry = cursor.fetchone()
+        await cursor.execute(select_query, (entry_id,))
+        saved_entry = await cursor.fetchone()
 
         if saved_entry:
             # 清除相關的快取
-            await redis_client.delete(f"diary_entries:{current_user['id']}:*")
-            await redis_client.delete(f"diary_entries_date:{current_user['id']}:{mood_entry.date}")
-            await redis_client.delete(f"diary_entry:{current_user['id']}:*")  # 可能需要刪除所有相關的單個條目快取
+            await clear_diary_cache(current_user['id'])
+            # 心情與天氣是配對特徵，更新相似度索引
+            partner_index_updater.schedule_refresh(current_user['id'])
             return MoodEntryResponse(**saved_entry)
         else:
             raise HTTPException(status_code=404, detail="無法檢索保存的心情記錄")
 
-    except mysql.connector.Error as e:
+    except DatabaseError as e:
         raise HTTPException(status_code=500, detail=f"資料庫錯誤: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"發生意外錯誤: {str(e)}")
     finally:
         if cursor:
-            cursor.close()
+            await cursor.close()
 
 
 
@@ -620,7 +583,7 @@ async def save_mood_entry(
 async def update_profile(
     request: ProfileUpdateRequest,
     current_user: dict = Depends(get_current_user),
-    db: mysql.connector.connection.MySQLConnection = Depends(get_db)
+    db: AsyncConnection = Depends(get_db)
 ):
     cursor = None
     try:
@@ -641,8 +604,8 @@ async def update_profile(
             if not request.current_password:
                 raise HTTPException(status_code=400, detail="當前密碼必須提供")
 
-            cursor.execute("SELECT password FROM users WHERE id = %s", (current_user['id'],))
-            user = cursor.fetchone()
+            await cursor.execute("SELECT password FROM users WHERE id = %s", (current_user['id'],))
+            user = await cursor.fetchone()
             if not user:
                 raise HTTPException(status_code=404, detail="用戶不存在")
             
@@ -653,27 +616,28 @@ async def update_profile(
             update_values.append(request.new_password)
 
             if request.avatar_url:
-                # 如果更新了頭像，清除頭像快取
-                await redis_client.delete(f"user_avatar:{current_user['id']}")
                 update_fields.append("avatar_url = %s")
                 update_values.append(request.avatar_url)
         
         if update_fields:
             query = f"UPDATE users SET {', '.join(update_fields)} WHERE id = %s"
             update_values.append(current_user['id'])
-            cursor.execute(query, tuple(update_values))
-            db.commit()
+            await cursor.execute(query, tuple(update_values))
+            await db.commit()
 
-            cursor.execute("SELECT avatar_url, self_intro FROM users WHERE id = %s", (current_user['id'],))
-            updated_user = cursor.fetchone()
+            await cursor.execute("SELECT avatar_url, self_intro FROM users WHERE id = %s", (current_user['id'],))
+            updated_user = await cursor.fetchone()
 
             # 更新快取
-            cache_key = f"user_profile:{current_user['id']}"
+            cache_key = profile_key(current_user['id'])
             cache_data = {
                 "avatar_url": updated_user['avatar_url'],
                 "self_intro": updated_user['self_intro']
             }
-            await redis_client.set(cache_key, json.dumps(cache_data), ex=3600)  # 設置1小時過期
+            await hot_cache.set(cache_key, cache_data, ttl=PROFILE_CACHE_TTL)  # 其他 worker 的副本同時失效
+            if request.avatar_url:
+                # 如果更新了頭像，清除頭像快取
+                await hot_cache.invalidate(avatar_key(current_user['id']))
             
             return JSONResponse(content={
                 'success': True, 
@@ -684,7 +648,7 @@ async def update_profile(
         else:
             return JSONResponse(content={'success': True, 'message': '沒有需要更新的資料'})
 
-    except mysql.connector.Error as e:
+    except DatabaseError as e:
         raise HTTPException(status_code=500, detail=f"資料庫錯誤: {str(e)}")
     except HTTPException as he:
         return JSONResponse(status_code=he.status_code, content={"message": he.detail})        
@@ -692,51 +656,94 @@ async def update_profile(
         raise HTTPException(status_code=500, detail=f"發生意外錯誤: {str(e)}")
     finally:
         if cursor:
-            cursor.close()
+            await cursor.close()
+
+
+async def _users_batch(ids: str, db: AsyncConnection, columns: tuple, key_for, ttl: int):
+    try:
+        user_ids = parse_ids(ids)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"無效的用戶 ID: {str(e)}")
+    try:
+        users = await load_users_batch(hot_cache, db, user_ids, columns, key_for, ttl)
+    except DatabaseError as e:
+        raise HTTPException(status_code=500, detail=f"Database query failed: {str(e)}")
+    # 依請求的順序回傳，找不到的用戶為 null
+    return {str(user_id): users.get(user_id) for user_id in user_ids}
+
+
+@router.get("/api/v1/users/avatars")
+async def get_user_avatars(
+    ids: str = Query(..., description="以逗號分隔的用戶 ID"),
+    current_user: dict = Depends(get_current_user),
+    db: AsyncConnection = Depends(get_db)
+):
+    # 一頁上所有作者的頭像一次取回，取代每位作者各一次的 /api/v1/users/{user_id}/avatar
+    return await _users_batch(ids, db, AVATAR_COLUMNS, avatar_key, AVATAR_CACHE_TTL)
+
+
+@router.get("/api/v1/users/profiles")
+async def get_user_profiles(
+    ids: str = Query(..., description="以逗號分隔的用戶 ID"),
+    current_user: dict = Depends(get_current_user),
+    db: AsyncConnection = Depends(get_db)
+):
+    # self_intro 只給本人與目前配對中的夥伴看（與 get_partner_info 的權限相同），其他 ID 一律拒絕
+    try:
+        user_ids = parse_ids(ids)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"無效的用戶 ID: {str(e)}")
+    try:
+        forbidden = await forbidden_profile_ids(db, current_user['id'], user_ids)
+    except DatabaseError as e:
+        raise HTTPException(status_code=500, detail=f"Database query failed: {str(e)}")
+    if forbidden:
+        raise HTTPException(status_code=403, detail="你沒有權限查看此用戶的資料")
+    return await _users_batch(ids, db, PROFILE_COLUMNS, profile_key, PROFILE_CACHE_TTL)
 
 
 @router.get("/api/v1/users/{user_id}/avatar")
 async def get_user_avatar(
     user_id: int,
     current_user: dict = Depends(get_current_user),
-    db: mysql.connector.connection.MySQLConnection = Depends(get_db)
+    db: AsyncConnection = Depends(get_db)
 ):
 
-    cache_key = f"user_avatar:{user_id}"
-    cached_avatar = await redis_client.get(cache_key)
-    if cached_avatar:
-        return json.loads(cached_avatar)
+    cache_key = avatar_key(user_id)
+    cached_avatar = await hot_cache.get(cache_key)
+    if cached_avatar is not None:
+        return cached_avatar
 
     try:
         cursor = db.cursor(dictionary=True)
         query = "SELECT avatar_url FROM users WHERE id = %s"
         logging.info(f"Executing query: {query} with user ID: {user_id}")
-        cursor.execute(query, (user_id,))
-        result = cursor.fetchone()
+        await cursor.execute(query, (user_id,))
+        result = await cursor.fetchone()
 
         if not result:
             raise HTTPException(status_code=404, detail="User not found")
 
-        await redis_client.set(cache_key, json.dumps(result), ex=3600)  # 快取1小時
+        await hot_cache.set(cache_key, result, ttl=AVATAR_CACHE_TTL)  # 快取1小時
         logging.info(f"Query result: {result}")
         return result
-    except mysql.connector.Error as e:
+    except DatabaseError as e:
         raise HTTPException(status_code=500, detail=f"Database query failed: {str(e)}")
     finally:
-        cursor.close()
+        await cursor.close()
 
 
 
 @router.get("/api/v1/users/profile")
 async def get_user_profile(
     current_user: dict = Depends(get_current_user),
-    db: mysql.connector.connection.MySQLConnection = Depends(get_db)
+    db: AsyncConnection = Depends(get_db)
 ):
-    cache_key = f"user_profile:{current_user['id']}"
-    cached_profile = await redis_client.get(cache_key)
-    if cached_profile:
+    cache_key = profile_key(current_user['id'])
+    cached_profile = await hot_cache.get(cache_key)
+    if cached_profile is not None:
         logging.info(f"Cache hit for user {current_user['id']}: {cached_profile}")
-        return json.loads(cached_profile)
+        return cached_profile
 
     logging.info(f"Cache miss for user {current_user['id']}")
 
@@ -744,8 +751,8 @@ async def get_user_profile(
     try:
         cursor = db.cursor(dictionary=True)
         query = "SELECT avatar_url, self_intro FROM users WHERE id = %s"
-        cursor.execute(query, (current_user["id"],))
-        result = cursor.fetchone()
+        await cursor.execute(query, (current_user["id"],))
+        result = await cursor.fetchone()
 
         logging.info(f"Raw database result for user {current_user['id']}: {result}")
 
@@ -761,9 +768,9 @@ async def get_user_profile(
 
         logging.info(f"Processed result for user {current_user['id']}: {processed_result}")
       
-        await redis_client.set(cache_key, json.dumps(result), ex=300)
+        await hot_cache.set(cache_key, result, ttl=PROFILE_CACHE_TTL)
         return processed_result
-    except mysql.connector.Error as e:
+    except DatabaseError as e:
         logging.error(f"Database Error for user {current_user['id']}: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Database Error: {str(e)}")
     except Exception as e:
@@ -771,4 +778,4 @@ async def get_user_profile(
         raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
     finally:
         if cursor:
-            cursor.close()
\ No newline at end of file
+            await cursor.close()
\ No newline at end of file
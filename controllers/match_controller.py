@@ -1,10 +1,30 @@
 from fastapi import FastAPI, HTTPException, APIRouter, Depends, WebSocket, WebSocketDisconnect
 from datetime import datetime, date, timedelta
 from typing import List, Dict, Tuple, Set, Any
-from controllers.diary_controller import get_diary_entries
-from dependencies import get_db, get_current_user
+from dependencies import get_db, get_current_user, decode_access_token, pool, async_db
 from models.diary import PresigneUrlRequest, DiaryEntryResponse, DiaryEntryRequest
 from models.match import MatchResponse
+from services.matching import User, calculate_similarity, match_users
+from services.match_persistence import save_daily_matches
+from services.diary_loader import load_recent_diaries
+from services.matching_loader import DIARIES_PER_USER, iter_candidate_rows, mood_scores, weather_counts
+from services.matching_queue import DEFAULT_PAIRING, enqueue_matching_job, get_matching_job_status, make_job_id
+from services.availability_queue import mark_available, claim_partner, claim_specific_partner, ensure_availability_seeded
+from services.partner_index import PartnerIndex, PartnerIndexUpdater
+from services.match_history import load_recent_pairs, record_partners, recent_partners
+from services.diary_cache import get_generation, partner_diary_key
+from services.match_expiry import MatchExpiryScheduler, schedule_expiry, cancel_expiry
+from services.async_db import AsyncConnection, DatabaseError
+from services.two_tier_cache import TwoTierCache
+from services.response_cache import dump_entries, json_response
+from services.match_events import (
+    MatchEventPublisher, REQUEST_RECEIVED, REQUEST_ACCEPTED, REQUEST_REJECTED, REQUEST_EXPIRED, PARTNER_DIARY_UPDATED
+)
+from services.ws_manager import ConnectionManager
+from services.match_status import (
+    NONE, OUTGOING, INCOMING, ACCEPTED,
+    make_record, status_key, set_match_status, get_cached_match_status, refresh_match_status, to_response
+)
 from pydantic import BaseModel, Field
 import mysql.connector
 import pytz
@@ -14,6 +34,7 @@ from contextlib import closing
 from mysql.connector import pooling, Error
 import redis.asyncio as redis
 import json
+import asyncio
 
 
 
@@ -22,185 +43,117 @@ logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
 redis_client = redis.Redis(host='redis', port=6379, decode_responses=True)
+# 讀多寫少的熱門鍵（頭像、個人資料、夥伴日記）：worker 內的 LRU 在前，Redis 在後；由 app.py 啟動與停止
+hot_cache = TwoTierCache(redis_client)
 
 
 
-class User:
-    def __init__(self, id: int):
-        self.id = id
-        self.diary_entries: List[DiaryEntryResponse] = []
-        self.posting_frequency: float = 0.0
-        self.last_matched: Optional[date] = None
-        self.current_exchange_partner: Optional[int] = None
-        self.pending_requests: List[int] = []  # 新增：儲存待處理的請求ID
-        self.like_count: int = 0
-        self.weather_counts: Dict[str, int] = {
-                        'sunny': 0, 'cloudy': 0, 'rainy': 0, 'snowy': 0, 'windy': 0
-        }
-        self.mood_scores: List[float] = []
-        self.avg_mood_score: float = 0.0
-
-
-    def calculate_avg_mood_score(self):
-        if self.mood_scores:
-            self.avg_mood_score = sum(self.mood_scores) / len(self.mood_scores)
-        else:
-            self.avg_mood_score = 0.0
-
-    def calculate_posting_frequency(self):
-        if not self.diary_entries:
-            self.posting_frequency = 0.0
-            return
-
-        earliest_date = min(datetime.strptime(entry.date, "%Y-%m-%d").date() for entry in self.diary_entries)
-        latest_date = max(datetime.strptime(entry.date, "%Y-%m-%d").date() for entry in self.diary_entries)
-        date_range = (latest_date - earliest_date).days + 1
-        self.posting_frequency = len(self.diary_entries) / date_range if date_range > 0 else 0.0
-
-    def get_all_keywords(self) -> Set[str]:
-        all_content = " ".join([entry.content for entry in self.diary_entries])
-        words = all_content.lower().split()
-        return set(word for word in words if len(word) > 3 and word not in ['and', 'the', 'is', 'in', 'to', 'for'])
-
-
-
-async def daily_matching(db: mysql.connector.connection.MySQLConnection = Depends(get_db), target_keyword: str = None) -> List[Tuple[User, User]]:
-    cursor = db.cursor(dictionary=True)
-    today = datetime.now(pytz.utc).date()
-    cursor.execute("""
-        SELECT users.id,
-        user_matches.partner_id,
-        user_matches.match_date,
-        COUNT(likes.user_id) as like_count,
-        AVG(mood_entries.mood_score) as mood_score,
-        SUM(CASE WHEN mood_entries.weather = 'sunny' THEN 1 ELSE 0 END) as sunny_count,
-               SUM(CASE WHEN mood_entries.weather = 'cloudy' THEN 1 ELSE 0 END) as cloudy_count,
-               SUM(CASE WHEN mood_entries.weather = 'rainy' THEN 1 ELSE 0 END) as rainy_count,
-               SUM(CASE WHEN mood_entries.weather = 'snowy' THEN 1 ELSE 0 END) as snowy_count,
-               SUM(CASE WHEN mood_entries.weather = 'windy' THEN 1 ELSE 0 END) as windy_count
-        FROM users
-        LEFT JOIN user_matches ON users.id = user_matches.user_id AND user_matches.match_date = %s
-        LEFT JOIN likes ON likes.user_id = users.id
-        LEFT JOIN mood_entries ON mood_entries.user_id = users.id
-        WHERE mood_entries.date >= %s
-        GROUP BY users.id, user_matches.partner_id, user_matches.match_date
-    """, (today, today-timedelta(days=30)))
-
-    user_data = cursor.fetchall()
-    cursor.close()
-
+def load_matching_users(db: mysql.connector.connection.MySQLConnection, today: date, user_ids: List[int] = None) -> List[User]:
+    # 取出今天還沒有配對的用戶及其點讚、心情、天氣與最近的日記；user_ids 只載入指定的用戶
+    # 離線配對工作不需要 User 物件，改用 services.matching_loader.load_matching_snapshot
     users = []
-    for data in user_data:
+    for data in iter_candidate_rows(db, today, user_ids):
         user = User(data['id'])
         user.last_matched = data.get('match_date')
         user.current_exchange_partner = data.get('partner_id')
         user.like_count = data.get('like_count') or 0
-
-        mood_scores_str = data.get('mood_scores', '')
-        user.mood_scores = [float(score) for score in mood_scores_str.split(',') if score]
+        user.mood_scores = mood_scores(data)
         user.calculate_avg_mood_score()
-        
-        user.weather_counts = {
-            'sunny': data.get('sunny_count') or 0,
-            'cloudy': data.get('cloudy_count') or 0,
-            'rainy': data.get('rainy_count') or 0,
-            'snowy': data.get('snowy_count') or 0,
-            'windy': data.get('windy_count') or 0
-        }
-
+        user.weather_counts = weather_counts(data)
+        users.append(user)
 
-        if user.last_matched == today or user.current_exchange_partner is not None:
-            continue
-
-        diary_entries = await get_diary_entries(skip=0, limit=100, current_user={"id": user.id}, db=db)
-        for entry in diary_entries:
-            user.diary_entry.append(diary_entries)
+    # 一次（分段）取出所有候選人最近 100 篇日記的日期與內容
+    diaries = load_recent_diaries(db, [user.id for user in users], per_user_limit=DIARIES_PER_USER)
+    for user in users:
+        user.diary_entries = diaries[user.id]
         user.calculate_posting_frequency()
-        users.append(user)    
+    return users
+
 
-    matches = []
-    while len(users) >= 2:
-        user1 = users.pop()
-        best_match = max(users, key=lambda u: calculate_similarity(user1, u, target_keyword))
-        users.remove(best_match)
-        matches.append((user1, best_match))
+def _run_daily_matching(today: date, target_keyword: str = None, candidate_k: int = None, lsh_bands: int = 16,
+                        pairing: str = 'greedy', time_budget: float = None) -> List[Tuple[User, User]]:
+    with closing(pool.get_connection()) as db:
+        users = load_matching_users(db, today)
 
-        # 更新用戶的匹配狀態
-        update_user_match_status(db, user1.id, best_match.id, today)
-        update_user_match_status(db, best_match.id, user1.id, today)
+        # 冷卻期內配對過的組合不再配在一起
+        matches, _ = match_users(users, target_keyword, candidate_k, lsh_bands, pairing, time_budget,
+                                 history=load_recent_pairs(db, today))
 
+        # 批次、分段交易寫入 user_matches 並更新 is_matching，同一天重跑不會重複寫入
+        save_daily_matches(db, [(user1.id, user2.id) for user1, user2 in matches], today)
     return matches
 
-def calculate_similarity(user1: User, user2: User, target_keyword: str=None) -> float:
-    user1_keywords = user1.get_all_keywords()
-    user2_keywords = user2.get_all_keywords()
-    all_keywords = user1_keywords | user2_keywords
 
-    # target_keyword = "olympic"
-    if not all_keywords:
-        keyword_similarity = 0
-    else:
-        keyword_weights = { k:3 if k == target_keyword else 1 for k in all_keywords}
-        weighted_common_keywords = sum(keyword_weights[k] for k in user1_keywords & user2_keywords)
-        total_weighted_keywords = sum(keyword_weights.values())
-        keyword_similarity = (weighted_common_keywords/total_weighted_keywords) if total_weighted_keywords > 0 else 0
+async def daily_matching(target_keyword: str = None, candidate_k: int = None, lsh_bands: int = 16,
+                         pairing: str = 'greedy', time_budget: float = None) -> List[Tuple[User, User]]:
+    # 讀取、計算與寫入都是同步的長時間工作，放到執行緒中以同步連線池執行，不卡住 event loop
+    today = datetime.now(pytz.utc).date()
+    matches = await asyncio.to_thread(_run_daily_matching, today, target_keyword, candidate_k, lsh_bands,
+                                      pairing, time_budget)
+    await record_partners(redis_client, *[(user1.id, user2.id) for user1, user2 in matches])
 
-    # 計算發文頻率相似度
-    freq_diff = abs(user1.posting_frequency - user2.posting_frequency)
-    freq_similarity = 1 / (1 + freq_diff)  # 頻率差異越小，相似度越高
+    return matches
 
-    # 計算點讚數相似度（希望活潑的配對不那麼活潑的）
-    like_diff = abs(user1.like_count-user2.like_count)
-    like_similarity = 1/(like_diff + 1)
 
-    # 計算天氣偏好相似度（希望天氣相似的配對）
-    all_weather_types = set(user1.weather_counts.keys()) | set(user2.weather_counts.keys())
+# 即時交換用的相似度索引：每個 worker 一份，啟動時建立，用戶寫日記或心情時增量更新
+PARTNER_CANDIDATES = 5
+MAX_HISTORY_SKIPS = 5
+partner_index = PartnerIndex()
 
-    similarity = sum(min(user1.weather_counts.get(w, 0), user2.weather_counts.get(w, 0)) for w in all_weather_types)
-    total_weather = sum(user1.weather_counts.values()) + sum(user2.weather_counts.values())
 
-    weather_similarity = similarity / total_weather if total_weather > 0 else 0
+def _load_index_users(db: mysql.connector.connection.MySQLConnection, user_ids: List[int] = None) -> List[User]:
+    return load_matching_users(db, datetime.now(pytz.utc).date(), user_ids)
 
-    # 計算心情分數相似度（希望心情好的配對心情不好的）
-    mood_diff = abs(user1.avg_mood_score - user2.avg_mood_score)
-    mood_similarity = 1/(mood_diff + 1)
 
-    return (
-        0.25 * keyword_similarity +
-        0.20 * freq_similarity +
-        0.15 * like_similarity +
-        0.20 * weather_similarity +
-        0.20 * mood_similarity
-    )
+partner_index_updater = PartnerIndexUpdater(partner_index, redis_client, pool, _load_index_users)
 
 
 router = APIRouter()
 
-@router.get("/daily_matches", response_model=List[Dict[str, int]])
-async def get_daily_matches(
-    current_user: Dict = Depends(get_current_user),
-    db: mysql.connector.connection.MySQLConnection = Depends(get_db)
+@router.post("/daily_matches")
+async def enqueue_daily_matches(
+    target_keyword: str = None,
+    pairing: str = DEFAULT_PAIRING,
+    time_budget: float = None,
+    candidate_k: int = None,
+    current_user: Dict = Depends(get_current_user)
 ):
+    # 配對在離線工作（python -m services.matching_job worker）中執行，這裡只排入工作
+    # pairing：greedy、exact、sorted_edge、auto；time_budget 秒內 exact 沒有完成就改用 sorted_edge
+    today = datetime.now(pytz.utc).date()
     try:
-        matches = await daily_matching(db, target_keyword="olympic")  # 使用 "olympic" 作為示例
-        return [{"user1_id": match[0].id, "user2_id": match[1].id} for match in matches]
+        return await enqueue_matching_job(redis_client, today, target_keyword, pairing, time_budget, candidate_k)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"匹配過程中發生錯誤: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"排入配對工作時發生錯誤: {str(e)}")
+
+
+@router.get("/daily_matches")
+async def get_daily_matches(
+    match_date: date = None,
+    current_user: Dict = Depends(get_current_user)
+):
+    job_id = make_job_id(match_date or datetime.now(pytz.utc).date())
+    status = await get_matching_job_status(redis_client, job_id)
+    if not status:
+        raise HTTPException(status_code=404, detail="找不到這一天的配對工作")
+    return status
 
 
 @router.get("/matching/requests")
-async def get_matching_requests(current_user: dict = Depends(get_current_user), db: mysql.connector.connection.MySQLConnection = Depends(get_db)):
+async def get_matching_requests(current_user: dict = Depends(get_current_user), db: AsyncConnection = Depends(get_db)):
     
     cursor = db.cursor(dictionary=True)
     try:  #抓取pending表裡面 requester 的名字
-        cursor.execute("""
+        await cursor.execute("""
             SELECT user_match_requests.*, name as user_name
             FROM user_match_requests
             JOIN users ON user_match_requests.requester_id = users.id
             WHERE user_match_requests.recipient_id = %s AND user_match_requests.status = 'pending'
         """, (current_user['id'],))
 
-        requests = cursor.fetchall()
+        requests = await cursor.fetchall()
         return requests
         
     except Exception as e:
@@ -213,96 +166,114 @@ async def respond_to_matching_request(
     requester_id: int,
     response: MatchResponse,
     current_user: Dict[str, Any] = Depends(get_current_user),
-    db: pooling.PooledMySQLConnection = Depends(get_db)
+    db: AsyncConnection = Depends(get_db)
 ):
     if response.action not in ['accept', 'reject']:
         raise HTTPException(status_code=400, detail="無效的操作")
 
     try:
-        with db.cursor(dictionary=True) as cursor:
+        async with db.cursor(dictionary=True) as cursor:
             # 檢查當前用戶
-            cursor.execute("SELECT name FROM users WHERE id = %s", (current_user['id'],))
-            result = cursor.fetchone()
-            if not result:
+            await cursor.execute("SELECT id, name FROM users WHERE id IN (%s, %s)", (current_user['id'], requester_id))
+            names = {row['id']: row['name'] for row in await cursor.fetchall()}
+            if current_user['id'] not in names:
                 raise HTTPException(status_code=404, detail="找不到當前用戶")
-            current_user_name = result['name']
+            current_user_name = names[current_user['id']]
 
             # 檢查配對請求
-            cursor.execute("""
+            await cursor.execute("""
                 SELECT * FROM user_match_requests 
                 WHERE requester_id = %s AND recipient_id = %s AND status = 'pending'
             """, (requester_id, current_user['id']))
-            if not cursor.fetchone():
+            match_request = await cursor.fetchone()
+            if not match_request:
                 raise HTTPException(status_code=404, detail="找不到配對請求或您沒有權限回應此請求")
 
             if response.action == 'accept':
                 # 檢查是否有活躍的匹配
-                cursor.execute("""
+                await cursor.execute("""
                     SELECT * FROM users
                     WHERE id IN (%s, %s) AND is_matching = 1
                 """, (requester_id, current_user['id']))
-                if cursor.fetchone():
+                if await cursor.fetchone():
                     raise HTTPException(status_code=400, detail="您或您的夥伴已經有一個活躍的匹配")
 
                 # 更新請求狀態和創建新的匹配
-                cursor.execute("""
+                await cursor.execute("""
                     UPDATE user_match_requests 
                     SET status = 'accepted' 
                     WHERE requester_id = %s AND recipient_id = %s
                 """, (requester_id, current_user['id']))
-                cursor.fetchone()  # 讀取空結果集
 
-                cursor.execute("""
+                await cursor.execute("""
                     UPDATE users 
                     SET is_matching = 1 
                     WHERE id IN (%s, %s)
                 """, (requester_id, current_user['id']))
-                cursor.fetchone()  # 讀取空結果集
 
-                cursor.execute("""
+                await cursor.execute("""
                     INSERT INTO user_matches 
                     (user_id, partner_id, match_date, status) 
                     VALUES (%s, %s, CURDATE(), 'accepted'),
                            (%s, %s, CURDATE(), 'accepted')
                 """, (current_user['id'], requester_id, requester_id, current_user['id']))
-                cursor.fetchone()
 
             else:  # reject
-                cursor.execute("""
+                await cursor.execute("""
                     UPDATE users 
                     SET is_matching = 0 
                     WHERE id IN (%s, %s)
                 """, (requester_id, current_user['id']))
-                cursor.fetchone()
 
-                cursor.execute("""
+                await cursor.execute("""
                     INSERT INTO user_matches 
                     (user_id, partner_id, match_date, status) 
                     VALUES (%s, %s, CURDATE(), 'rejected'),
                            (%s, %s, CURDATE(), 'rejected')
                 """, (current_user['id'], requester_id, requester_id, current_user['id']))
-                cursor.fetchone()  # 讀取空結果集
 
             # 刪除配對請求
-            cursor.execute("""
+            await cursor.execute("""
                 DELETE FROM user_match_requests 
                 WHERE requester_id = %s AND recipient_id = %s
             """, (requester_id, current_user['id']))
-            cursor.fetchone()  # 讀取空結果集
 
-        db.commit()
-
-        # 清除相關的快取
-        await redis_client.delete(f"match_status:{current_user['id']}")
-        await redis_client.delete(f"match_status:{requester_id}")
+        await db.commit()
+
+        # 雙方的配對狀態直接寫入快取，並通知請求者
+        if response.action == 'accept':
+            matched_at = datetime.utcnow()
+            requester_record = make_record(ACCEPTED, current_user['id'], current_user_name, matched_at)
+            await set_match_status(redis_client, current_user['id'], make_record(ACCEPTED, requester_id, names.get(requester_id), matched_at))
+            await set_match_status(redis_client, requester_id, requester_record)
+            await match_events.publish(requester_id, REQUEST_ACCEPTED, {
+                "partner_id": current_user['id'],
+                "partner_name": current_user_name,
+                "status": to_response(requester_record)
+            })
+        else:
+            await set_match_status(redis_client, current_user['id'], make_record(NONE))
+            await set_match_status(redis_client, requester_id, make_record(NONE))
+            await match_events.publish(requester_id, REQUEST_REJECTED, {
+                "partner_id": current_user['id'],
+                "status": to_response(make_record(NONE))
+            })
+        # 接受或拒絕都記入配對紀錄，冷卻期內不會再配到同一人
+        await record_partners(redis_client, (requester_id, current_user['id']))
+        # 請求已經回應，不需要再到期
+        await cancel_expiry(redis_client, match_request['id'], requester_id, current_user['id'])
+
+        if response.action == 'reject':
+            # 拒絕後雙方的 is_matching 為 0，重新進入可配對佇列
+            await mark_available(redis_client, current_user['id'], requester_id)
         
         return {"message": f"Scucessfully {response.action}ed the match request"}
 
-    except mysql.connector.Error as e:
-        db.rollback()
+    except DatabaseError as e:
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"處理請求時發生數據庫錯誤: {str(e)}")
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"處理請求時發生未知錯誤: {str(e)}")
     finally:
         logger.debug("數據庫操作完成")
@@ -311,86 +282,87 @@ async def respond_to_matching_request(
 @router.post("/matching/request_exchange")
 async def request_exchange(
     current_user: dict = Depends(get_current_user),
-    db: mysql.connector.connection.MySQLConnection = Depends(get_db)
+    db: AsyncConnection = Depends(get_db)
 ):
     cursor = db.cursor(dictionary=True)
-    
+    claimed = None
+
     try:
-        # 將 24 小時前的待處理請求標記為過期
-        cursor.execute("""
-            UPDATE user_match_requests
-            SET status = 'expired'
-            WHERE status = 'pending' AND created_at < DATE_SUB(NOW(), INTERVAL 24 HOUR)
-        """)
-
-        cursor.execute("""
+        # 過期的請求由 MatchExpiryScheduler 在到期時標記，這裡不再整表 UPDATE
+        await cursor.execute("""
             SELECT partner_id from user_matches
             WHERE user_id = %s AND status = 'accepted'
             ORDER BY created_at DESC LIMIT 1
         """, (current_user['id'],)) 
-        result = cursor.fetchone()
+        result = await cursor.fetchone()
 
         if result:
             partner_id = result['partner_id']
-            cursor.execute("UPDATE users SET is_matching = 0 WHERE id IN (%s, %s)", (current_user['id'], partner_id))
-                        # 清除匹配夥伴的快取
-            await redis_client.delete(f"match_status:{partner_id}")
+            await cursor.execute("UPDATE users SET is_matching = 0 WHERE id IN (%s, %s)", (current_user['id'], partner_id))
+            # 原本的夥伴回到沒有配對的狀態
+            await set_match_status(redis_client, partner_id, make_record(NONE))
+            # 原本的夥伴重新進入可配對佇列
+            await mark_available(redis_client, partner_id)
         else:
-            cursor.execute("UPDATE users SET is_matching = 0 WHERE id = %s", (current_user['id'],))
+            await cursor.execute("UPDATE users SET is_matching = 0 WHERE id = %s", (current_user['id'],))
 
         # 檢查用戶是否已經有待處理的請求（24小時內）
-        cursor.execute("""
+        await cursor.execute("""
             SELECT * FROM user_match_requests 
             WHERE (requester_id = %s OR recipient_id = %s) AND status = 'pending'
             AND created_at > DATE_SUB(NOW(), INTERVAL 24 HOUR)
         """, (current_user['id'], current_user['id']))
         
-        existing_request = cursor.fetchone()
+        existing_request = await cursor.fetchone()
         
         if existing_request:
             return {"message": "已經存在一個待處理的配對請求", "status": "pending"}
         
-        # 尋找可配對的用戶
-        cursor.execute("""
-            SELECT id, name
-            FROM users 
-            WHERE id != %s
-            AND is_matching = 0 
-            AND id NOT IN (
-                SELECT requester_id FROM user_match_requests 
-                WHERE status = 'pending' AND created_at > DATE_SUB(NOW(), INTERVAL 24 HOUR)
-            )
-            AND id NOT IN (
-                SELECT recipient_id FROM user_match_requests 
-                WHERE status = 'pending' AND created_at > DATE_SUB(NOW(), INTERVAL 24 HOUR)
-            )
-            ORDER BY RAND()
-            LIMIT 1
-        """, (current_user['id'],))
-        
-        partner = cursor.fetchone()
-        
-        if not partner:
-            return {"message": "No MOODs buddy Now", "status": "no_match"}
+        # 從 Redis 可配對佇列原子取出最相似（索引未就緒時為等待最久）的用戶，取代 ORDER BY RAND() 全表掃描
+        await ensure_availability_seeded(redis_client, db)
+        recent = await recent_partners(redis_client, current_user['id'])
+        while True:
+            claimed = await _claim_best_partner(current_user['id'], recent)
+            if not claimed:
+                await set_match_status(redis_client, current_user['id'], make_record(NONE))
+                return {"message": "No MOODs buddy Now", "status": "no_match"}
+            # 佇列可能落後於資料庫（例如每日配對已寫入、對方已有待處理的請求），以主鍵再確認一次
+            await cursor.execute("""
+                SELECT u.id, u.name, u.is_matching,
+                       EXISTS(SELECT 1 FROM user_match_requests r
+                              WHERE r.status = 'pending' AND (r.requester_id = u.id OR r.recipient_id = u.id)) AS has_pending
+                FROM users u WHERE u.id = %s
+            """, (claimed[0],))
+            partner = await cursor.fetchone()
+            if partner and partner['is_matching'] == 0 and not partner['has_pending']:
+                break
         
         # 創建新的配對請求
-        cursor.execute(
+        await cursor.execute(
             "INSERT INTO user_match_requests (requester_id, recipient_id, request_date, status) VALUES (%s, %s, CURDATE(), 'pending')",
             (current_user['id'], partner['id'])
         )
+        request_id = cursor.lastrowid
          # 獲取剛插入的請求的 created_at 時間
-        cursor.execute(
-            "SELECT created_at FROM user_match_requests WHERE requester_id = %s AND recipient_id = %s AND status = 'pending' ORDER BY created_at DESC LIMIT 1",
-            (current_user['id'], partner['id'])
-        )
-        request_info = cursor.fetchone()
+        await cursor.execute("SELECT created_at FROM user_match_requests WHERE id = %s", (request_id,))
+        request_info = await cursor.fetchone()
         created_at = request_info['created_at'] if request_info else None
 
-        db.commit()
-
-        # 清除相關的快取
-        await redis_client.delete(f"match_status:{current_user['id']}")
-        await redis_client.delete(f"match_status:{partner['id']}")
+        await db.commit()
+
+        if created_at:
+            # 雙方的配對狀態直接寫入快取，並通知被請求的用戶
+            recipient_record = make_record(INCOMING, current_user['id'], current_user.get('name'), created_at)
+            await set_match_status(redis_client, current_user['id'], make_record(OUTGOING, partner['id'], partner['name'], created_at))
+            await set_match_status(redis_client, partner['id'], recipient_record)
+            await match_events.publish(partner['id'], REQUEST_RECEIVED, {
+                "request_id": request_id,
+                "requester_id": current_user['id'],
+                "requester_name": current_user.get('name'),
+                "status": to_response(recipient_record)
+            })
+            # 排入延遲佇列，24 小時後由背景工作標記為過期
+            await schedule_expiry(redis_client, request_id, current_user['id'], partner['id'], created_at)
 
         return {
                     "message": "Your match request is on its way!",
@@ -398,172 +370,83 @@ async def request_exchange(
                     "partner_id": partner['id'],
                     "created_at": created_at.isoformat() if created_at else None
                 }        
-    except mysql.connector.Error as e:
-        db.rollback()
+    except DatabaseError as e:
+        await db.rollback()
+        await _release_claim(claimed, current_user['id'])
         raise HTTPException(status_code=500, detail="資料庫錯誤，請稍後再試")
     except Exception as e:
-        db.rollback()
+        await db.rollback()
+        await _release_claim(claimed, current_user['id'])
         raise HTTPException(status_code=500, detail=str(e))
     finally:
-        cursor.close()
+        await cursor.close()
+
+
+async def _claim_best_partner(requester_id: int, recent: Set[int] = frozenset()):
+    # 相似度索引挑出目前可配對的前幾名（排除冷卻期內的舊夥伴），依序嘗試原子取出；都被取走時退回等待最久的用戶
+    for partner_id in partner_index.best_partners(requester_id, k=PARTNER_CANDIDATES, exclude=recent):
+        claimed = await claim_specific_partner(redis_client, requester_id, partner_id)
+        partner_index.set_available([partner_id], False)
+        if claimed:
+            partner_index.set_available([requester_id], False)
+            return claimed
+
+    # 等待最久的用戶若是舊夥伴就暫時取出跳過（最多 MAX_HISTORY_SKIPS 位），結束後放回原本的等待位置
+    skipped = []
+    claimed = None
+    try:
+        for _ in range(MAX_HISTORY_SKIPS + 1):
+            claimed = await claim_partner(redis_client, requester_id)
+            if not claimed or claimed[0] not in recent:
+                break
+            skipped.append(claimed)
+            claimed = None
+    finally:
+        for partner_id, since in skipped:
+            await mark_available(redis_client, partner_id, since=since)
+    if skipped and not claimed:
+        # 請求者在取出時已移出佇列，沒有配到人就重新排隊
+        await mark_available(redis_client, requester_id)
+    return claimed
+
+
+async def _release_claim(claimed, requester_id: int):
+    # 請求沒有建立成功，把取出的夥伴放回原本的等待位置，請求者也重新排隊
+    await redis_client.delete(status_key(requester_id))
+    if claimed:
+        await mark_available(redis_client, claimed[0], since=claimed[1])
+        await mark_available(redis_client, requester_id)
+
 
 @router.get("/matching/status")
 async def get_matching_status(
     current_user: dict = Depends(get_current_user),
-    db: mysql.connector.connection.MySQLConnection = Depends(get_db)
+    db: AsyncConnection = Depends(get_db)
 ):
-    # cache_key = f"match_status:{current_user['id']}"
-
-    # cached_status = await redis_client.get(cache_key)
-    # if cached_status:
-    #     print(f"Cache hitttt: {cache_key}")  # 調試信息
-    #     return json.loads(cached_status)
-
-    # print(f"Cache missss: {cache_key}")  # 調試信息
-
-    cursor = db.cursor(dictionary=True)
-    
+    # 狀態由每個轉換 write-through 寫入快取，輪詢通常只會命中快取
     try:
-         # 首先，更新過期的請求
-        cursor.execute("""
-            UPDATE user_match_requests
-            SET status = 'expired'
-            WHERE status = 'pending' AND created_at < DATE_SUB(NOW(), INTERVAL 24 HOUR)
-        """)
-        db.commit()
-        # 用戶當前is_matching=0，檢查是否有待處理的請求
-        cursor.execute("""
-            SELECT 'outgoing' as request_type, recipient_id, requester_id, created_at
-            FROM user_match_requests 
-            WHERE requester_id = %s AND status = 'pending'
-            UNION
-            SELECT 'incoming' as request_type, recipient_id, requester_id, created_at
-            FROM user_match_requests 
-            WHERE recipient_id = %s AND status = 'pending'
-        """, (current_user['id'], current_user['id']))
+        record = await get_cached_match_status(redis_client, current_user['id'])
+        if record is None:
+            record = await refresh_match_status(redis_client, db, current_user['id'])
+        return to_response(record)
 
-        pending_request = cursor.fetchone()
-
-        if pending_request:
-            pending_request['created_at'] = pending_request['created_at'].isoformat()
-
-            # 新增：計算剩餘時間
-            current_time = datetime.utcnow()
-            created_time = datetime.fromisoformat(pending_request['created_at'])
-            time_elapsed = current_time - created_time
-            remaining_time = timedelta(hours=24) - time_elapsed
-            
-            if remaining_time.total_seconds() > 0:            
-                if pending_request['request_type'] == 'outgoing':
-                    return {
-                        "status": "pending", 
-                        "message": "You have a pending outgoing match request",
-                        "recipient_id": pending_request.get('recipient_id'),
-                        "remaining_time_seconds": remaining_time.total_seconds(),
-                        "created_at": pending_request['created_at']                        
-                    }
-                elif pending_request['request_type'] == 'incoming':
-                    requester_id = pending_request.get('requester_id')
-                    if requester_id:
-                        cursor.execute("SELECT name FROM users WHERE id = %s", (requester_id,))
-
-                        requester_data = cursor.fetchone()
-                        requester_name = requester_data['name'] if requester_data else "Unknown"
-
-                        return {
-                            "status": "incoming_request",
-                            "message": f"You have a pending incoming match request from {requester_name}",
-                            "requester_id": requester_id,
-                            "requester_name": requester_name,
-                            "remaining_time_seconds": remaining_time.total_seconds(),
-                            "created_at": pending_request['created_at']
-                        }
-                    else:
-                        print(f"Error: requester_id not found in pending_request: {pending_request}")
-                        # await redis_client.set(cache_key, json.dumps(status), ex=300) 
-                        return {"status": "error", "message": "Invalid request data"}
-            else:
-                cursor.execute("UPDATE user_match_requests SET status = 'expired' WHERE id = %s", (pending_request['id'],))
-                db.commit()
-            
-    # 如果沒有待處理的請求，再繼續執行下面檢查現有匹配狀態
-               
-    # 獲取用戶當前狀態和最新的match記錄，有雙方的is_matching
-    # 第一個LEFT JOIN獲取最新的一個match
-    # 第二個LEFT JOIN獲取匹配夥伴的資料
-        cursor.execute("""
-            SELECT users.is_matching, 
-            user_matches.id as match_id, user_matches.status as match_status, 
-            user_matches.partner_id, user_matches.created_at,
-            users_partner.name as partner_name, users_partner.is_matching as partner_is_matching
-        FROM users
-        LEFT JOIN (
-            SELECT * FROM user_matches
-            WHERE user_id = %s
-            ORDER BY created_at DESC
-            LIMIT 1
-        ) user_matches ON users.id = user_matches.user_id
-        LEFT JOIN users users_partner ON user_matches.partner_id = users_partner.id
-        WHERE users.id = %s
-        """, (current_user['id'], current_user['id']))
-    
-        user_info = cursor.fetchone()
-        print(f"Debug: user_info = {user_info}")  # 添加這行來打印 user_info
-
-        status = {"status": "no_match", "message": "No buddy match now. Click EXCHANGE to find a diary buddy!"}        
-
-            # 檢查是否存在user_matches.id
-        if user_info['match_id'] is not None:
-            if user_info['is_matching'] == 1:
-                # 檢查最新user_matches裡有沒有accepted
-                cursor.execute("""
-                    SELECT id, status FROM user_matches
-                    WHERE (user_id = %s AND partner_id = %s) OR (user_id = %s AND partner_id = %s)
-                    ORDER BY created_at DESC
-                    LIMIT 1
-                """, (current_user['id'], user_info['partner_id'], user_info['partner_id'], current_user['id']))
-                latest_match = cursor.fetchone()
-            
-                if latest_match and latest_match['status'] == 'accepted':
-                    # 確保雙方的 is_matching 狀態一致，為了解決當 B 接受後立即調用 checkMatchStatus()，發現 A 的 is_matching 仍為 0（可能是由於數據庫更新的延遲）
-                    # 匹配有效
-                    status = {
-                        "status": "accepted",
-                        "partner_id": user_info['partner_id'],
-                        "partner_name": user_info['partner_name'],
-                        "match_date": user_info['created_at'].isoformat() if user_info['created_at'] else None
-                    }
-                    # await redis_client.set(cache_key, json.dumps(status), ex=300)
-                    return status
-
-            cursor.execute("UPDATE users SET is_matching = 0 WHERE id = %s", (current_user['id'],))
-            db.commit()
-            # await redis_client.set(cache_key, json.dumps(status), ex=300)
-        return {"status": "no_match", "message": "You don't have any current matches. Click EXCHANGE to find a diary buddy!"}
-        
     except Exception as e:
         print(f"Error in get_matching_status: {str(e)}")
         return {"status": "error", "detail": f"Unexpected error: {str(e)}"}
-    finally:
-        cursor.close()
-
-
-
-
 
 
 @router.get("/get_partner_diary/{partner_id}", response_model=List[DiaryEntryResponse])
 async def get_partner_diary(
     partner_id: int,
     current_user: dict = Depends(get_current_user),
-    db: mysql.connector.connection.MySQLConnection = Depends(get_db)
+    db: AsyncConnection = Depends(get_db)
 ):
 
-    cache_key = f"partner_diary:{partner_id}"
-    cached_diary = await redis_client.get(cache_key)
-    if cached_diary:
+    cache_key = partner_diary_key(partner_id, await get_generation(redis_client, partner_id))
+    cached_diary = await hot_cache.get(cache_key, raw=True)
+    if cached_diary is not None:
         print(f"Cache hit: {cache_key}")  # 調試信息
-        return json.loads(cached_diary)
+        return json_response(cached_diary)
 
     print(f"Cache miss: {cache_key}")  # 調試信息
 
@@ -571,7 +454,7 @@ async def get_partner_diary(
         cursor = db.cursor(dictionary=True)
 
         # 步驟 1: 獲取當前用戶的活躍匹配
-        cursor.execute("""
+        await cursor.execute("""
             SELECT um.partner_id, um.created_at
             FROM user_matches um
             JOIN users u1 ON um.user_id = u1.id
@@ -582,7 +465,7 @@ async def get_partner_diary(
             LIMIT 1
         """, (current_user['id'],))
         
-        current_match = cursor.fetchone()
+        current_match = await cursor.fetchone()
 
         # 這裡考慮檢查user_match_requests，按下exchange之後應該不再顯示夥伴的日記
 
@@ -592,7 +475,7 @@ async def get_partner_diary(
 
 
         # 獲取夥伴的日記
-        cursor.execute("""
+        await cursor.execute("""
             SELECT d.id, d.user_id, d.title, d.content, d.image_url, d.is_public, 
                    d.date, d.created_at, d.updated_at, users.email
             FROM diary_entries d
@@ -602,7 +485,7 @@ async def get_partner_diary(
             LIMIT 5
         """, (partner_id,))
         
-        entries = cursor.fetchall()
+        entries = await cursor.fetchall()
         # 轉換日期和時間格式
         for entry in entries:
             entry['date'] = entry['date'].isoformat()
@@ -610,30 +493,30 @@ async def get_partner_diary(
             entry['updated_at'] = entry['updated_at'].isoformat()
             # is_public 會由 Pydantic 驗證器自動處理
 
-        entries = [DiaryEntryResponse(**entry) for entry in entries]
+        body = dump_entries(entries)
 
         # 將結果存入快取
-        await redis_client.set(cache_key, json.dumps([entry.dict() for entry in entries]), ex=3600)  # 設置1小時過期
+        await hot_cache.set(cache_key, body, ttl=3600, raw=True)  # 設置1小時過期
 
-        return entries
+        return json_response(body)
 
     except HTTPException as http_ex:
         raise http_ex
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
     finally:
-        cursor.close()
+        await cursor.close()
 
 @router.get("/get_partner_info/{partner_id}")
 async def get_partner_info(
     partner_id: int,
     current_user: dict = Depends(get_current_user),
-    db: mysql.connector.connection.MySQLConnection = Depends(get_db)
+    db: AsyncConnection = Depends(get_db)
 ):
     cursor = db.cursor(dictionary=True)
     try:
         # 首先檢查是否有權限獲取該夥伴的信息
-        cursor.execute("""
+        await cursor.execute("""
             SELECT um.partner_id
             FROM user_matches um
             JOIN users u1 ON um.user_id = u1.id
@@ -644,18 +527,18 @@ async def get_partner_info(
             LIMIT 1
         """, (current_user['id'], partner_id))
         
-        match = cursor.fetchone()
+        match = await cursor.fetchone()
         if not match:
             raise HTTPException(status_code=403, detail="你沒有權限查看此用戶的資料")
 
         # 獲取夥伴的資料
-        cursor.execute("""
+        await cursor.execute("""
             SELECT id, name, avatar_url, self_intro
             FROM users
             WHERE id = %s
         """, (partner_id,))
         
-        partner_info = cursor.fetchone()
+        partner_info = await cursor.fetchone()
         if not partner_info:
             raise HTTPException(status_code=404, detail="找不到該用戶")
 
@@ -671,36 +554,55 @@ async def get_partner_info(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"獲取夥伴資料時發生錯誤: {str(e)}")
     finally:
-        cursor.close()
+        await cursor.close()
 
 
 
 # websocket================
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: Dict[int, WebSocket] = {}
+manager = ConnectionManager(redis_client, decode_access_token)
+match_events = MatchEventPublisher(redis_client, manager.send_personal_message)
 
-    async def connect(self, websocket: WebSocket, user_id: int):
-        await websocket.accept()
-        self.active_connections[user_id] = websocket
 
-    def disconnect(self, user_id: int):
-        if user_id in self.active_connections:
-            del self.active_connections[user_id]
+async def _notify_request_expired(request_id: int, requester_id: int, recipient_id: int):
+    data = {"request_id": request_id, "status": to_response(make_record(NONE))}
+    await match_events.publish(requester_id, REQUEST_EXPIRED, data)
+    await match_events.publish(recipient_id, REQUEST_EXPIRED, data)
 
-    async def send_personal_message(self, message: str, user_id: int):
-        if user_id in self.active_connections:
-            await self.active_connections[user_id].send_text(message)
 
-manager = ConnectionManager()
+async def notify_partner_diary_updated(db, user_id: int, entry_id: int):
+    # 用戶寫了新日記：通知夥伴（夥伴看到的日記快取鍵含此用戶的世代，寫入時已經換新）
+    record = await get_cached_match_status(redis_client, user_id)
+    if record is None:
+        record = await refresh_match_status(redis_client, db, user_id)
+    if record['state'] == ACCEPTED and record['partner_id']:
+        await match_events.publish(record['partner_id'], PARTNER_DIARY_UPDATED, {"partner_id": user_id, "entry_id": entry_id})
+
+# 由 app.py 在啟動時開始、關閉時停止
+expiry_scheduler = MatchExpiryScheduler(redis_client, async_db, on_expired=_notify_request_expired)
 
 @router.websocket("/ws/{user_id}")
-async def websocket_endpoint(websocket: WebSocket, user_id: int):
-    await manager.connect(websocket, user_id)
+async def websocket_endpoint(websocket: WebSocket, user_id: int, token: str = None, resume: str = None):
+    connection = await manager.connect(websocket, user_id, token)
+    if connection is None:
+        return
     try:
+        # 重新連線時補送 resume token 之後錯過的事件
+        for message in await match_events.replay(user_id, resume):
+            manager.enqueue(connection, message)
         while True:
-            data = await websocket.receive_text()
-            # 處理接收到的消息(如果需要)
-    except WebSocketDisconnect:
-        manager.disconnect(user_id)
+            # 用戶端的任何訊息（包含回應心跳的 pong）都代表連線仍然活著
+            await websocket.receive_text()
+            connection.touch()
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
+        await manager.disconnect(connection)
+
+@router.get("/ws/stats")
+async def websocket_stats(current_user: dict = Depends(get_current_user)):
+    return manager.stats()
+
+@router.get("/cache/stats")
+async def cache_stats(current_user: dict = Depends(get_current_user)):
+    return hot_cache.stats()
 
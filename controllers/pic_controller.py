@@ -1,7 +1,6 @@
 from fastapi import FastAPI, HTTPException, APIRouter, Depends
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
-import mysql.connector
 import boto3
 import uuid
 from dotenv import load_dotenv
@@ -11,11 +10,11 @@ from fastapi.encoders import jsonable_encoder
 from datetime import datetime
 from models.diary import PresigneUrlRequest, MessageRequest, MessageResponse
 from fastapi.responses import HTMLResponse
-from dependencies import get_current_user
+from dependencies import get_db, get_current_user
+from services.async_db import AsyncConnection, DatabaseError
 from typing import Dict
 import logging
 import traceback
-from mysql.connector import Error
 
 
 
@@ -36,13 +35,6 @@ s3_client = boto3.client("s3",
 BUCKET_NAME = os.getenv("AWS_S3_BUCKET_NAME")
 CLOUDFRONT_DOMAIN = os.getenv("CLOUDFRONT_DOMAIN")
 
-db_config = {
-    "user": os.getenv("DB_USER"),
-    "host": os.getenv("RDS_HOST"),
-    "password": os.getenv("RDS_PASSWORD"),
-    "database": os.getenv("RDS_MOOD")
-}
-
 @router.post("/api/v1/presigned_urls")
 async def get_presigned_url(request: PresigneUrlRequest):
     try:
@@ -59,7 +51,8 @@ async def get_presigned_url(request: PresigneUrlRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/api/v1/messages")
-async def save_message(request: MessageRequest, current_user: dict = Depends(get_current_user)):
+async def save_message(request: MessageRequest, current_user: dict = Depends(get_current_user),
+                       db: AsyncConnection = Depends(get_db)):
     try:
         if not request.text.strip() and not request.imageUrl:
             raise HTTPException(status_code=400, detail="Message must contain text or image")
@@ -69,26 +62,18 @@ async def save_message(request: MessageRequest, current_user: dict = Depends(get
         if not email:
             raise HTTPException(status_code=400, detail="Email is required")
 
-        conn = mysql.connector.connect(**db_config)
-        cursor = conn.cursor()
-        insert_query = """
-        INSERT INTO messages(text, imageUrl, email)
-        VALUES (%s, %s, %s)
-        """
-
-        cursor.execute(insert_query, (request.text, request.imageUrl, email))
-        conn.commit()
+        async with db.cursor() as cursor:
+            insert_query = """
+            INSERT INTO messages(text, imageUrl, email)
+            VALUES (%s, %s, %s)
+            """
 
-        # 獲取插入的消息ID
-        message_id = cursor.lastrowid
+            await cursor.execute(insert_query, (request.text, request.imageUrl, email))
+            await db.commit()
 
-        # 獲取插入的消息
-        select_query = "SELECT * FROM messages WHERE id = %s"
-        cursor.execute(select_query, (message_id,))
-        saved_message = cursor.fetchone()
+            # 獲取插入的消息ID
+            message_id = cursor.lastrowid
 
-        cursor.close()
-        conn.close()
         # 返回完整的消息對象
         response = MessageResponse(
             id=message_id,
@@ -99,66 +84,62 @@ async def save_message(request: MessageRequest, current_user: dict = Depends(get
         )
         return response.dict()  # 返回字典形式的響應
 
-    except mysql.connector.Error as db_error:
+    except HTTPException:
+        raise
+    except DatabaseError as db_error:
         raise HTTPException(status_code=500, detail=f"Database error: {str(db_error)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
 
 @router.delete("/api/v1/messages/{message_id}")
-async def delete_message(message_id: int, current_user: Dict = Depends(get_current_user)):
+async def delete_message(message_id: int, current_user: Dict = Depends(get_current_user),
+                         db: AsyncConnection = Depends(get_db)):
     try:
-        conn = mysql.connector.connect(**db_config)
-        cursor = conn.cursor(dictionary=True)
-
-        # 首先檢查消息是否屬於當前用戶
-        check_query = "SELECT email FROM messages WHERE id = %s"
-        cursor.execute(check_query, (message_id,))
-        result = cursor.fetchone()
-        
-        if not result:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Message not found")
-
-        delete_query = "DELETE FROM messages WHERE id = %s AND email = %s"
-        cursor.execute(delete_query, (message_id, current_user['email']))
-        conn.commit()
-
-        if cursor.rowcount == 0:
-            raise HTTPException(status_code=404, detail="Message not found or already deleted")
-        
+        async with db.cursor(dictionary=True) as cursor:
+            # 首先檢查消息是否屬於當前用戶
+            check_query = "SELECT email FROM messages WHERE id = %s"
+            await cursor.execute(check_query, (message_id,))
+            result = await cursor.fetchone()
+
+            if not result:
+                raise HTTPException(status_code=404, detail="Message not found")
+
+            delete_query = "DELETE FROM messages WHERE id = %s AND email = %s"
+            await cursor.execute(delete_query, (message_id, current_user['email']))
+            await db.commit()
+
+            if cursor.rowcount == 0:
+                raise HTTPException(status_code=404, detail="Message not found or already deleted")
+
         return {"message": "Message deleted successfully"}
-    except mysql.connector.Error as db_error:
+    except HTTPException:
+        raise
+    except DatabaseError as db_error:
         raise HTTPException(status_code=500, detail=f"Database error: {str(db_error)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
-    finally:
-        if cursor is not None:
-            cursor.close()
-        if conn is not None:
-            conn.close()
 
 
 @router.get('/api/v1/messages')
-async def get_messages(current_user_id: int = None):
+async def get_messages(current_user_id: int = None, db: AsyncConnection = Depends(get_db)):
     try:
-        conn = mysql.connector.connect(**db_config)
-        cursor = conn.cursor(dictionary=True)
-        
-        # 查詢 messages
-        messages_query = """
-        SELECT m.id, m.text, m.imageUrl, m.created_at, m.email,
-            u.name as user_name,
-            (SELECT COUNT(*) FROM likes WHERE message_id = m.id) as like_count,
-            CASE 
-            WHEN %s IS NOT NULL THEN EXISTS(SELECT 1 FROM likes WHERE message_id = m.id AND user_id = %s)
-            ELSE FALSE
-            END as is_liked_by_user
-        FROM messages m
-        LEFT JOIN users u ON m.email = u.email
-        ORDER BY m.created_at DESC
-        """
-
-        cursor.execute(messages_query, (current_user_id, current_user_id))
-        messages = cursor.fetchall()
+        async with db.cursor(dictionary=True) as cursor:
+            # 查詢 messages
+            messages_query = """
+            SELECT m.id, m.text, m.imageUrl, m.created_at, m.email,
+                u.name as user_name,
+                (SELECT COUNT(*) FROM likes WHERE message_id = m.id) as like_count,
+                CASE 
+                WHEN %s IS NOT NULL THEN EXISTS(SELECT 1 FROM likes WHERE message_id = m.id AND user_id = %s)
+                ELSE FALSE
+                END as is_liked_by_user
+            FROM messages m
+            LEFT JOIN users u ON m.email = u.email
+            ORDER BY m.created_at DESC
+            """
+
+            await cursor.execute(messages_query, (current_user_id, current_user_id))
+            messages = await cursor.fetchall()
 
         # 格式化消息
         formatted_messages = []
@@ -175,60 +156,47 @@ async def get_messages(current_user_id: int = None):
             })
 
         return JSONResponse(content=formatted_messages)
-    except Error as e:
+    except DatabaseError as e:
         print(f"Error fetching messages: {e}")
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        if conn.is_connected():
-            cursor.close()
-            conn.close()
 
 
 @router.post("/api/v1/messages/{message_id}/likes")
-async def toggle_like(message_id: int, current_user: Dict = Depends(get_current_user)):
+async def toggle_like(message_id: int, current_user: Dict = Depends(get_current_user),
+                      db: AsyncConnection = Depends(get_db)):
     try:
-        conn = mysql.connector.connect(**db_config)
-        cursor = conn.cursor(dictionary=True)    
-        # 首先檢查消息
-        check_message_query = "SELECT id FROM messages WHERE id = %s"
-        cursor.execute(check_message_query, (message_id,))
-        message = cursor.fetchone()
-        
-        if not message:
-            raise HTTPException(status_code=404, detail="Message not found")
-
-        user_id = current_user.get('id')
-        user_email = current_user.get('email')
-
-        print(f"處理用戶 ID: {user_id}, 電子郵件: {user_email} 對訊息 ID: {message_id} 的讚")
-        
-        check_like_query = "SELECT * FROM likes WHERE user_id = %s AND message_id =%s"
-        cursor.execute(check_like_query, (user_id, message_id))
-        existing_like = cursor.fetchone()
-
-        if existing_like:
-            delete_like_query = "DELETE FROM likes WHERE user_id = %s AND message_id = %s"
-            cursor.execute(delete_like_query, (user_id, message_id))
-            conn.commit()
-            return {"liked": False, "message": "Like removed"}
-        
-        else:
-            insert_like_query = "INSERT INTO likes (user_id, message_id, created_at) VALUES (%s, %s, %s) "
-            cursor.execute(insert_like_query, (user_id, message_id, datetime.now().isoformat()))
-            conn.commit()
-            return{"liked": True, "message": "Like added"}
-
-    except mysql.connector.Error as e:
-        print(f"Database error: {e}")
-        print(f"Error code: {e.errno}")
-        print(f"SQL State: {e.sqlstate}")
-        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+        async with db.cursor(dictionary=True) as cursor:
+            # 首先檢查消息
+            check_message_query = "SELECT id FROM messages WHERE id = %s"
+            await cursor.execute(check_message_query, (message_id,))
+            message = await cursor.fetchone()
+
+            if not message:
+                raise HTTPException(status_code=404, detail="Message not found")
 
-    finally:
-        cursor.close()
-        conn.close()
-            
+            user_id = current_user.get('id')
+            user_email = current_user.get('email')
 
+            print(f"處理用戶 ID: {user_id}, 電子郵件: {user_email} 對訊息 ID: {message_id} 的讚")
 
+            check_like_query = "SELECT * FROM likes WHERE user_id = %s AND message_id =%s"
+            await cursor.execute(check_like_query, (user_id, message_id))
+            existing_like = await cursor.fetchone()
 
+            if existing_like:
+                delete_like_query = "DELETE FROM likes WHERE user_id = %s AND message_id = %s"
+                await cursor.execute(delete_like_query, (user_id, message_id))
+                await db.commit()
+                return {"liked": False, "message": "Like removed"}
 
+            else:
+                insert_like_query = "INSERT INTO likes (user_id, message_id, created_at) VALUES (%s, %s, %s) "
+                await cursor.execute(insert_like_query, (user_id, message_id, datetime.now().isoformat()))
+                await db.commit()
+                return{"liked": True, "message": "Like added"}
+
+    except DatabaseError as e:
+        print(f"Database error: {e}")
+        # PyMySQL 的錯誤以 (錯誤碼, 訊息) 作為 args
+        print(f"Error code: {e.args[0] if e.args else None}")
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
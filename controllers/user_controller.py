@@ -9,18 +9,17 @@ router = APIRouter()
 @router.post("/api/user")
 async def create_user(user: User, db=Depends(get_db)):
     try:
-        with db as connection:
-            with connection.cursor() as cursor:
-                cursor.execute("SELECT * FROM users WHERE email=%s", (user.email,))
-                existing_user = cursor.fetchone()
-                if existing_user:
-                    return JSONResponse(status_code=400, content={
-                        "error": True,
-                        "message": "Registration failed, please check email and password"
-                    })
-                cursor.execute("INSERT INTO users(name, email, password) VALUES (%s, %s, %s)", 
-                               (user.name, user.email, user.password))
-                connection.commit()
+        async with db.cursor() as cursor:
+            await cursor.execute("SELECT * FROM users WHERE email=%s", (user.email,))
+            existing_user = await cursor.fetchone()
+            if existing_user:
+                return JSONResponse(status_code=400, content={
+                    "error": True,
+                    "message": "Registration failed, please check email and password"
+                })
+            await cursor.execute("INSERT INTO users(name, email, password) VALUES (%s, %s, %s)", 
+                                 (user.name, user.email, user.password))
+            await db.commit()
         return {"ok": True}
     except Exception as e:
         print(f"Database error: {str(e)}") 
@@ -35,10 +34,9 @@ async def read_user(current_user: dict = Depends(get_current_user), db=Depends(g
         if not current_user:
             raise HTTPException(status_code=401, detail="Unauthorized")
 
-        with db as connection:
-            with connection.cursor() as cursor:
-                cursor.execute("SELECT id, name, email FROM users WHERE id=%s", (current_user["id"],))
-                user = cursor.fetchone()
+        async with db.cursor() as cursor:
+            await cursor.execute("SELECT id, name, email FROM users WHERE id=%s", (current_user["id"],))
+            user = await cursor.fetchone()
 
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
@@ -50,11 +48,10 @@ async def read_user(current_user: dict = Depends(get_current_user), db=Depends(g
 @router.put("/api/user/auth")
 async def check_user(user: UserCheckin, db=Depends(get_db)):
     try:
-        with db as connection:
-            with connection.cursor(dictionary=True) as cursor:
-                cursor.execute("SELECT * FROM users WHERE email=%s AND password=%s", 
-                               (user.email, user.password))
-                user_data = cursor.fetchone()
+        async with db.cursor(dictionary=True) as cursor:
+            await cursor.execute("SELECT * FROM users WHERE email=%s AND password=%s", 
+                                 (user.email, user.password))
+            user_data = await cursor.fetchone()
         
         if not user_data:
             return JSONResponse(status_code=400, content={
@@ -7,6 +7,7 @@ from fastapi import HTTPException, Depends
 from dotenv import load_dotenv
 import os
 import logging
+from services.async_db import AsyncDatabase
 
 
 
@@ -40,27 +41,21 @@ pool = pooling.MySQLConnectionPool(
 print("Connection pool created successfully")
 
 
-def get_db():
-    connection = None
+# 控制器使用的 asyncio 連線池（由 app.py 在啟動時建立）；上面的同步連接池留給背景執行緒與離線工作
+async_db = AsyncDatabase(rds_db_config, maxsize=15)
+
+
+async def get_db():
     try:
-        connection = pool.get_connection()
-        connection.ping(reconnect=True, attempts=3, delay=5)  # 確保連接是活的
-        if connection is None:
-            raise HTTPException(status_code=503, detail="無法獲取數據庫連接")
-        yield connection
-    except pooling.PoolError as e:
-        logger.error(f"數據庫連接池錯誤: {str(e)}")
-        raise HTTPException(status_code=503, detail=f"數據庫連接池錯誤: {str(e)}")
+        connection = await async_db.acquire()
     except Exception as e:
-        logger.error(f"獲取數據庫連接時發生意外錯誤: {str(e)}", exc_info=True)
-        raise HTTPException(status_code=500, detail=f"獲取數據庫連接時發生意外錯誤: {str(e)}")
+        logger.error(f"獲取數據庫連接時發生錯誤: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=503, detail=f"無法獲取數據庫連接: {str(e)}")
+    try:
+        yield connection
     finally:
-        if connection is not None:
-            try:
-                connection.close()  # 將連接返回到連接池
-                logger.debug("數據庫連接已返回到連接池")
-            except Exception as e:
-                logger.error(f"返回連接到連接池時發生錯誤: {str(e)}", exc_info=True)
+        # 將連接返回到連接池
+        await async_db.release(connection)
 
 async def create_access_token(data: dict, expires_delta: datetime.timedelta = datetime.timedelta(days=7)):
 	to_encode = data.copy()
@@ -1,6 +1,6 @@
 from pydantic import BaseModel, Field, validator
 from datetime import datetime, date
-from typing import Optional, Union
+from typing import List, Optional, Union
 
 class PresigneUrlRequest(BaseModel):
     filename: str
@@ -65,6 +65,10 @@ class DiaryEntryResponse(BaseModel):
             return bool(v)
         return v
 
+class DiaryEntryPage(BaseModel):
+    entries: List[DiaryEntryResponse]
+    next_cursor: Optional[str] = None  # 沒有下一頁時為 None
+
 class MoodEntryRequest(BaseModel):
     mood_score: Optional[int] = Field(None, ge=1, le=5)
     date: date
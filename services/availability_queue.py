@@ -0,0 +1,93 @@
+import time
+from typing import Optional, Tuple
+
+
+# 可配對用戶的 Redis sorted set：member 為 user_id，score 為開始等待的時間
+# is_matching 變回 0 時加入，建立配對請求時以 Lua 原子取出，等待最久的先配對
+AVAILABLE_KEY = "match_available"
+SEEDED_KEY = "match_available:seeded"
+
+# KEYS[1] 可配對集合；ARGV[1] 請求者 id，ARGV[2] 現在時間
+# 請求者先移出集合，再取出分數最低（等待最久）的用戶；沒有人可配對時請求者放回原本的位置
+_CLAIM_PARTNER = """
+local requester_score = redis.call('ZSCORE', KEYS[1], ARGV[1])
+redis.call('ZREM', KEYS[1], ARGV[1])
+local partner = redis.call('ZRANGE', KEYS[1], 0, 0, 'WITHSCORES')
+if #partner == 0 then
+    redis.call('ZADD', KEYS[1], requester_score or ARGV[2], ARGV[1])
+    return false
+end
+redis.call('ZREM', KEYS[1], partner[1])
+return partner
+"""
+
+# KEYS[1] 可配對集合；ARGV[1] 請求者 id，ARGV[2] 指定的夥伴 id
+# 夥伴仍在集合中才取出（同時移出請求者），回傳夥伴原本的等待時間
+_CLAIM_SPECIFIC = """
+local partner_score = redis.call('ZSCORE', KEYS[1], ARGV[2])
+if not partner_score then
+    return false
+end
+redis.call('ZREM', KEYS[1], ARGV[1], ARGV[2])
+return partner_score
+"""
+
+
+async def mark_available(redis_client, *user_ids: int, since: Optional[float] = None):
+    # NX：已經在排隊的用戶保留原本的等待時間
+    if user_ids:
+        score = since if since is not None else time.time()
+        await redis_client.zadd(AVAILABLE_KEY, {str(user_id): score for user_id in user_ids}, nx=True)
+
+
+async def mark_unavailable(redis_client, *user_ids: int):
+    if user_ids:
+        await redis_client.zrem(AVAILABLE_KEY, *[str(user_id) for user_id in user_ids])
+
+
+async def claim_partner(redis_client, requester_id: int) -> Optional[Tuple[int, float]]:
+    # O(log n) 取出等待最久的用戶，並發的請求不會拿到同一位
+    script = redis_client.register_script(_CLAIM_PARTNER)
+    result = await script(keys=[AVAILABLE_KEY], args=[str(requester_id), time.time()])
+    if not result:
+        return None
+    partner_id, score = result
+    return int(partner_id), float(score)
+
+
+async def claim_specific_partner(redis_client, requester_id: int, partner_id: int) -> Optional[Tuple[int, float]]:
+    # 索引挑出的人選可能已被其他 worker 取走，只有仍可配對時才會成功
+    script = redis_client.register_script(_CLAIM_SPECIFIC)
+    score = await script(keys=[AVAILABLE_KEY], args=[str(requester_id), str(partner_id)])
+    if score is None:
+        return None
+    return partner_id, float(score)
+
+
+async def ensure_availability_seeded(redis_client, db):
+    # Redis 清空或第一次部署時，從資料庫建立一次可配對集合
+    if await redis_client.exists(SEEDED_KEY):
+        return
+    # NX 的旗標同時作為鎖，避免多個 worker 同時建立
+    if not await redis_client.set(SEEDED_KEY, "1", nx=True):
+        return
+    try:
+        async with db.cursor(dictionary=True) as cursor:
+            await cursor.execute("""
+                SELECT id FROM users
+                WHERE is_matching = 0
+                AND id NOT IN (
+                    SELECT requester_id FROM user_match_requests WHERE status = 'pending'
+                    UNION
+                    SELECT recipient_id FROM user_match_requests WHERE status = 'pending'
+                )
+            """)
+            user_ids = [row['id'] for row in await cursor.fetchall()]
+        # 沒有等待時間資料，以 user id 順序作為先後
+        for start in range(0, len(user_ids), 1000):
+            chunk = user_ids[start:start + 1000]
+            await redis_client.zadd(AVAILABLE_KEY, {str(user_id): float(user_id) for user_id in chunk}, nx=True)
+    except BaseException:
+        # 查詢或寫入失敗時清掉旗標，下一個請求會重新建立，佇列不會一直是空的
+        await redis_client.delete(SEEDED_KEY)
+        raise
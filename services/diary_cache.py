@@ -0,0 +1,44 @@
+from typing import Optional
+
+
+# 每位用戶一個世代計數器，嵌在所有日記／心情相關快取的鍵裡
+# 寫入時 INCR 一次，舊世代的鍵不再被讀到，各自依 TTL 過期（不需要 KEYS 或萬用字元刪除）
+# 計數器的 TTL 必須長於任何快取的 TTL，過期歸零時才不會讀到舊的同世代鍵
+GENERATION_TTL = 7 * 24 * 3600
+
+
+def generation_key(user_id: int) -> str:
+    return f"diary_gen:{user_id}"
+
+
+async def get_generation(redis_client, user_id: int) -> int:
+    return int(await redis_client.get(generation_key(user_id)) or 0)
+
+
+async def bump_generation(redis_client, user_id: int) -> int:
+    async with redis_client.pipeline(transaction=True) as pipe:
+        pipe.incr(generation_key(user_id))
+        pipe.expire(generation_key(user_id), GENERATION_TTL)
+        generation, _ = await pipe.execute()
+    return generation
+
+
+def diary_list_key(user_id: int, generation: int, skip: int, limit: int) -> str:
+    return f"diary_entries:{user_id}:g{generation}:{skip}:{limit}"
+
+
+def diary_page_key(user_id: int, generation: int, limit: int, cursor: Optional[str]) -> str:
+    return f"diary_entries:{user_id}:g{generation}:page:{limit}:{cursor or 'first'}"
+
+
+def diary_entry_key(user_id: int, generation: int, entry_id: int) -> str:
+    return f"diary_entry:{user_id}:g{generation}:{entry_id}"
+
+
+def diary_date_key(user_id: int, generation: int, day: str) -> str:
+    return f"diary_entries_date:{user_id}:g{generation}:{day}"
+
+
+def partner_diary_key(partner_id: int, generation: int) -> str:
+    # 以夥伴自己的世代為準：夥伴寫日記或心情後，看到的快取自動換新
+    return f"partner_diary:{partner_id}:g{generation}"
@@ -0,0 +1,115 @@
+import csv
+import io
+import json
+import zlib
+from datetime import date, datetime
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+
+# 匯出以未緩衝的 cursor 分批讀取，邊讀邊輸出：記憶體只與 EXPORT_BATCH_SIZE 有關，與日記總數無關
+EXPORT_BATCH_SIZE = 500
+EXPORT_COLUMNS = ["id", "user_id", "title", "content", "image_url", "is_public", "date", "created_at", "updated_at"]
+STREAM_FORMATS = {
+    "json": ("application/json", "json"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "csv": ("text/csv", "csv"),
+}
+
+
+def export_query(user_id: int, start: Optional[date] = None, end: Optional[date] = None) -> Tuple[str, List]:
+    # start、end 都包含在內
+    conditions, params = ["user_id = %s"], [user_id]
+    if start:
+        conditions.append("date >= %s")
+        params.append(start)
+    if end:
+        conditions.append("date <= %s")
+        params.append(end)
+    query = f"""
+        SELECT {", ".join(EXPORT_COLUMNS)} FROM diary_entries
+        WHERE {" AND ".join(conditions)}
+        ORDER BY date DESC, id DESC
+    """
+    return query, params
+
+
+def serialize_row(row: Dict) -> Dict:
+    return {key: value.isoformat() if isinstance(value, (date, datetime)) else value for key, value in row.items()}
+
+
+async def iter_batches(database, query: str, params: List, batch_size: int = EXPORT_BATCH_SIZE) -> AsyncIterator[List[Dict]]:
+    # 串流回應在依賴（get_db）結束後才送出，因此自己向連線池取連線
+    # 未緩衝的 cursor 關閉時會讀掉剩下的結果（客戶端中途斷線），連線才能放回連線池
+    async with database.connection() as db:
+        async with db.cursor(dictionary=True, buffered=False) as cursor:
+            await cursor.execute(query, params)
+            while True:
+                rows = await cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield [serialize_row(row) for row in rows]
+
+
+async def json_chunks(batches: AsyncIterator[List[Dict]]) -> AsyncIterator[str]:
+    # 逐批輸出 JSON 陣列的片段，沒有日記時為 []
+    yield "["
+    first = True
+    async for rows in batches:
+        body = ",\n".join(json.dumps(row, ensure_ascii=False) for row in rows)
+        yield ("\n" if first else ",\n") + body
+        first = False
+    yield "]\n" if first else "\n]\n"
+
+
+async def ndjson_chunks(batches: AsyncIterator[List[Dict]]) -> AsyncIterator[str]:
+    async for rows in batches:
+        yield "".join(json.dumps(row, ensure_ascii=False) + "\n" for row in rows)
+
+
+async def csv_chunks(batches: AsyncIterator[List[Dict]]) -> AsyncIterator[str]:
+    # 標題列固定輸出，沒有日記時也是合法的 CSV
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_COLUMNS)
+    writer.writeheader()
+    yield buffer.getvalue()
+    async for rows in batches:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(rows)
+        yield buffer.getvalue()
+
+
+FORMATTERS = {"json": json_chunks, "ndjson": ndjson_chunks, "csv": csv_chunks}
+
+
+async def _closing(chunks: AsyncIterator, batches: AsyncIterator) -> AsyncIterator:
+    # 客戶端中斷時立即關閉讀取端，連線不必等到垃圾回收才放回連線池
+    try:
+        async for chunk in chunks:
+            yield chunk
+    finally:
+        await chunks.aclose()
+        await batches.aclose()
+
+
+async def gzip_chunks(chunks: AsyncIterator[str]) -> AsyncIterator[bytes]:
+    # wbits=31：輸出 gzip 格式（含標頭與檢查碼）
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    async for chunk in chunks:
+        data = compressor.compress(chunk.encode("utf-8"))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def stream_export(database, user_id: int, format: str, start: Optional[date] = None, end: Optional[date] = None,
+                  gzip: bool = False, batch_size: int = EXPORT_BATCH_SIZE) -> Tuple[AsyncIterator, str, str]:
+    # 回傳 (內容產生器, media type, 檔名)
+    query, params = export_query(user_id, start, end)
+    batches = iter_batches(database, query, params, batch_size)
+    chunks = FORMATTERS[format](batches)
+    media_type, extension = STREAM_FORMATS[format]
+    filename = f"my_moods.{extension}"
+    if gzip:
+        chunks, media_type, filename = gzip_chunks(chunks), "application/gzip", f"{filename}.gz"
+    return _closing(chunks, batches), media_type, filename
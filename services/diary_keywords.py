@@ -0,0 +1,100 @@
+import argparse
+import json
+import logging
+from typing import List, Optional
+import mysql.connector
+from services.tokenizer import extract_keywords, serialize_keywords, tokenize
+
+
+logger = logging.getLogger(__name__)
+
+# 每篇日記寫入時斷好的關鍵字（以空白分隔），配對時直接讀取，不必再處理原文
+KEYWORDS_COLUMN_DDL = "ALTER TABLE diary_entries ADD COLUMN keywords TEXT NULL"
+BACKFILL_BATCH_SIZE = 1000
+ER_DUP_FIELDNAME = 1060
+
+
+def keywords_for(content: str) -> str:
+    return serialize_keywords(extract_keywords(content or ""))
+
+
+def ensure_keywords_column(db: mysql.connector.connection.MySQLConnection) -> bool:
+    cursor = db.cursor()
+    try:
+        cursor.execute("""
+            SELECT COUNT(*) FROM information_schema.COLUMNS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'diary_entries' AND COLUMN_NAME = 'keywords'
+        """)
+        if cursor.fetchone()[0]:
+            return False
+        try:
+            cursor.execute(KEYWORDS_COLUMN_DDL)
+        except mysql.connector.Error as e:
+            # 多個 worker 同時啟動時，其他 worker 可能已經加上欄位
+            if e.errno == ER_DUP_FIELDNAME:
+                return False
+            raise
+        return True
+    finally:
+        cursor.close()
+
+
+def ensure_keywords_schema(pool) -> bool:
+    # 由 app.py 在啟動時呼叫：diary_controller 的 INSERT/UPDATE 會寫入 keywords 欄位，欄位必須先存在
+    # 舊日記的回填較久，另外以 python -m services.diary_keywords 執行
+    db = pool.get_connection()
+    try:
+        created = ensure_keywords_column(db)
+    finally:
+        db.close()
+    if created:
+        logger.info("已建立 diary_entries.keywords 欄位")
+    return created
+
+
+def backfill_keywords(db: mysql.connector.connection.MySQLConnection, batch_size: int = BACKFILL_BATCH_SIZE,
+                      rebuild: bool = False) -> int:
+    # 依 id 分批回填（rebuild 時連已有關鍵字的也重算，用於斷詞規則改變後）
+    updated = 0
+    last_id = 0
+    missing_only = "" if rebuild else "AND keywords IS NULL"
+    cursor = db.cursor()
+    try:
+        while True:
+            cursor.execute(f"""
+                SELECT id, content FROM diary_entries
+                WHERE id > %s {missing_only}
+                ORDER BY id LIMIT %s
+            """, (last_id, batch_size))
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            cursor.executemany("UPDATE diary_entries SET keywords = %s WHERE id = %s",
+                               [(serialize_keywords(tokenize(content or "")), entry_id) for entry_id, content in rows])
+            db.commit()
+            updated += len(rows)
+            last_id = rows[-1][0]
+            logger.info(f"已回填 {updated} 篇日記的關鍵字")
+    finally:
+        cursor.close()
+    return updated
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="日記關鍵字欄位的建立與回填")
+    parser.add_argument("--batch-size", type=int, default=BACKFILL_BATCH_SIZE)
+    parser.add_argument("--rebuild", action="store_true", help="重新計算所有日記的關鍵字")
+    args = parser.parse_args(argv)
+
+    from dependencies import pool
+    db = pool.get_connection()
+    try:
+        created = ensure_keywords_column(db)
+        updated = backfill_keywords(db, args.batch_size, args.rebuild)
+        print(json.dumps({"column_created": created, "updated": updated}))
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
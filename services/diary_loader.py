@@ -0,0 +1,43 @@
+import mysql.connector
+from typing import Dict, FrozenSet, Iterable, List, NamedTuple, Optional
+from services.tokenizer import parse_keywords
+
+
+# 每次查詢的用戶數，避免 IN (...) 過長
+CHUNK_SIZE = 1000
+
+
+class MatchDiaryEntry(NamedTuple):
+    # 配對只需要日期與關鍵字，欄位名稱與 DiaryEntryResponse 相同，User 的方法可以直接使用
+    # keywords 為寫入時斷好的詞；尚未回填的舊日記才帶 content 即時斷詞
+    date: str
+    content: str = ""
+    keywords: Optional[FrozenSet[str]] = None
+
+
+def load_recent_diaries(db: mysql.connector.connection.MySQLConnection, user_ids: Iterable[int],
+                        per_user_limit: int = 100, chunk_size: int = CHUNK_SIZE) -> Dict[int, List[MatchDiaryEntry]]:
+    # 以視窗函數一次取出每位用戶最近 per_user_limit 篇日記，依 user_id 分組
+    user_ids = list(user_ids)
+    diaries: Dict[int, List[MatchDiaryEntry]] = {user_id: [] for user_id in user_ids}
+    for start in range(0, len(user_ids), chunk_size):
+        chunk = user_ids[start:start + chunk_size]
+        placeholders = ", ".join(["%s"] * len(chunk))
+        # 非緩衝游標：邊讀邊分組，不需要一次把結果全部放進記憶體
+        cursor = db.cursor(buffered=False)
+        try:
+            cursor.execute(f"""
+                SELECT user_id, date, CASE WHEN keywords IS NULL THEN content END, keywords FROM (
+                    SELECT user_id, date, content, keywords,
+                           ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY date DESC, id DESC) AS row_num
+                    FROM diary_entries
+                    WHERE user_id IN ({placeholders})
+                ) ranked
+                WHERE row_num <= %s
+            """, (*chunk, per_user_limit))
+            for user_id, entry_date, content, keywords in cursor:
+                diaries[user_id].append(MatchDiaryEntry(entry_date.isoformat(), content or "",
+                                                        parse_keywords(keywords) if keywords is not None else None))
+        finally:
+            cursor.close()
+    return diaries
@@ -0,0 +1,83 @@
+import base64
+import binascii
+from datetime import date, datetime
+from typing import Dict, List, Optional, Tuple
+import mysql.connector
+
+
+# 日記列表以 (date, id) 由新到舊分頁，下一頁從上一頁最後一篇之後開始：
+# 不論翻到第幾頁，資料庫都只讀 limit + 1 列（OFFSET 要先掃過前面所有列）
+PAGE_INDEX_DDL = "CREATE INDEX idx_diary_entries_user_date_id ON diary_entries (user_id, date, id)"
+PAGE_CACHE_TTL = 300
+MAX_PAGE_SIZE = 100
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(entry_date, entry_id: int) -> str:
+    # 不透明的游標：客戶端只需要原樣傳回
+    value = entry_date.isoformat() if isinstance(entry_date, (date, datetime)) else str(entry_date)
+    return base64.urlsafe_b64encode(f"{value}|{entry_id}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        value, entry_id = raw.rsplit("|", 1)
+        datetime.fromisoformat(value)
+        return value, int(entry_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError) as e:
+        raise InvalidCursor(cursor) from e
+
+
+async def load_diary_page(db, user_id: int, limit: int,
+                          cursor: Optional[str] = None) -> Tuple[List[Dict], Optional[str]]:
+    after = decode_cursor(cursor) if cursor else None
+    # 多取一列判斷是否還有下一頁
+    async with db.cursor(dictionary=True) as db_cursor:
+        if after:
+            await db_cursor.execute("""
+                SELECT * FROM diary_entries
+                WHERE user_id = %s AND (date < %s OR (date = %s AND id < %s))
+                ORDER BY date DESC, id DESC LIMIT %s
+            """, (user_id, after[0], after[0], after[1], limit + 1))
+        else:
+            await db_cursor.execute("""
+                SELECT * FROM diary_entries
+                WHERE user_id = %s
+                ORDER BY date DESC, id DESC LIMIT %s
+            """, (user_id, limit + 1))
+        rows = await db_cursor.fetchall()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]['date'], rows[-1]['id'])
+    return rows, next_cursor
+
+
+def ensure_page_index(db: mysql.connector.connection.MySQLConnection) -> bool:
+    cursor = db.cursor()
+    try:
+        cursor.execute("""
+            SELECT COUNT(*) FROM information_schema.STATISTICS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'diary_entries'
+            AND INDEX_NAME = 'idx_diary_entries_user_date_id'
+        """)
+        if cursor.fetchone()[0]:
+            return False
+        cursor.execute(PAGE_INDEX_DDL)
+        return True
+    finally:
+        cursor.close()
+
+
+if __name__ == "__main__":
+    from dependencies import pool
+    connection = pool.get_connection()
+    try:
+        print({"index_created": ensure_page_index(connection)})
+    finally:
+        connection.close()
@@ -0,0 +1,129 @@
+import numpy as np
+from scipy import sparse
+from typing import Dict, Iterable, List, Set
+
+
+# Mersenne 質數 2^31 - 1，讓 a * x + b 在 uint64 內不會溢位
+_PRIME = (1 << 31) - 1
+_EMPTY = np.uint32(_PRIME)
+
+# 每批 (nnz, num_perm) uint64 暫存陣列的大小上限；批次的關鍵字數量依 num_perm 換算
+# （num_perm = 64 時約 6.5 萬個關鍵字），每批有數個同樣大小的暫存，峰值維持在百 MB 以內
+_HASH_CHUNK_BYTES = 32 * 1024 * 1024
+
+
+class KeywordLSH:
+    # MinHash 簽名分成 bands 個區段放進桶子，同桶的用戶才會成為候選
+    #
+    # 召回率與速度的旋鈕：num_perm = bands * rows_per_band，
+    # 相似度門檻約為 (1 / bands) ** (1 / rows_per_band)。
+    # bands 越多（rows_per_band 越少）召回越高、候選越多；反之越快但可能漏掉鄰居。
+    def __init__(self, bands: int = 16, rows_per_band: int = 4, max_bucket_size: int = 200, seed: int = 1):
+        if bands < 1 or rows_per_band < 1:
+            raise ValueError("bands 與 rows_per_band 必須大於 0")
+        self.bands = bands
+        self.rows_per_band = rows_per_band
+        self.num_perm = bands * rows_per_band
+        self.max_bucket_size = max_bucket_size
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, _PRIME, size=self.num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, _PRIME, size=self.num_perm, dtype=np.uint64)
+        self.signatures = np.zeros((0, self.num_perm), dtype=np.uint32)
+        self._band_groups: List[np.ndarray] = []
+        self._band_order: List[np.ndarray] = []
+        self._band_starts: List[np.ndarray] = []
+
+    @classmethod
+    def threshold(cls, bands: int, rows_per_band: int) -> float:
+        return (1 / bands) ** (1 / rows_per_band)
+
+    def fit_sets(self, keyword_sets: Iterable[Set[str]]) -> "KeywordLSH":
+        # 字串關鍵字先轉成整數 id 再建立稀疏矩陣
+        vocabulary: Dict[str, int] = {}
+        indptr = [0]
+        indices: List[int] = []
+        for keywords in keyword_sets:
+            for keyword in keywords:
+                indices.append(vocabulary.setdefault(keyword, len(vocabulary)))
+            indptr.append(len(indices))
+        matrix = sparse.csr_matrix(
+            (np.ones(len(indices)), np.array(indices, dtype=np.int64), np.array(indptr, dtype=np.int64)),
+            shape=(len(indptr) - 1, len(vocabulary))
+        )
+        return self.fit(matrix)
+
+    def fit(self, keyword_matrix: sparse.csr_matrix) -> "KeywordLSH":
+        # keyword_matrix 為 (用戶數, 詞彙數) 的 CSR 矩陣，例如 SimilarityEngine.keywords
+        matrix = sparse.csr_matrix(keyword_matrix)
+        self.signatures = self._minhash(matrix.indptr.astype(np.int64), matrix.indices.astype(np.uint64))
+        self._build_buckets(np.diff(matrix.indptr) > 0)
+        return self
+
+    def _minhash(self, indptr: np.ndarray, indices: np.ndarray) -> np.ndarray:
+        n = len(indptr) - 1
+        signatures = np.full((n, self.num_perm), _EMPTY, dtype=np.uint32)
+        chunk = max(_HASH_CHUNK_BYTES // (self.num_perm * 8), 1)
+        row = 0
+        while row < n:
+            # 找出這一批可以處理到哪一位用戶
+            stop = int(np.searchsorted(indptr, indptr[row] + chunk, side='right')) - 1
+            stop = max(stop, row + 1)
+            start_nnz, stop_nnz = indptr[row], indptr[stop]
+            if stop_nnz > start_nnz:
+                ids = indices[start_nnz:stop_nnz]
+                hashed = ((ids[:, None] * self._a[None, :] + self._b[None, :]) % _PRIME).astype(np.uint32)
+                offsets = indptr[row:stop] - start_nnz
+                non_empty = indptr[row + 1:stop + 1] > indptr[row:stop]
+                # 空集合不參與 reduceat，相鄰的非空用戶區間因此剛好是各自的關鍵字
+                signatures[row:stop][non_empty] = np.minimum.reduceat(hashed, offsets[non_empty], axis=0)
+            row = stop
+        return signatures
+
+    def _build_buckets(self, non_empty: np.ndarray):
+        self._non_empty = non_empty
+        self._band_groups = []
+        self._band_order = []
+        self._band_starts = []
+        for band in range(self.bands):
+            chunk = np.ascontiguousarray(self.signatures[:, band * self.rows_per_band:(band + 1) * self.rows_per_band])
+            keys = chunk.view(np.dtype((np.void, chunk.dtype.itemsize * chunk.shape[1]))).ravel()
+            _, groups = np.unique(keys, return_inverse=True)
+            groups = groups.ravel()
+            # 沒有關鍵字的用戶不放進任何桶子
+            groups[~non_empty] = -1
+            order = np.argsort(groups, kind='stable')
+            starts = np.searchsorted(groups[order], np.arange(groups.max() + 2 if len(groups) else 1))
+            self._band_groups.append(groups)
+            self._band_order.append(order)
+            self._band_starts.append(starts)
+
+    def candidates(self, i: int) -> np.ndarray:
+        if not self._non_empty[i]:
+            return np.zeros(0, dtype=np.int64)
+        found = []
+        half = self.max_bucket_size // 2
+        for groups, order, starts in zip(self._band_groups, self._band_order, self._band_starts):
+            group = groups[i]
+            members = order[starts[group]:starts[group + 1]]
+            if len(members) > self.max_bucket_size:
+                # 桶子太大時只取排序上相鄰的成員，控制候選數量
+                position = int(np.searchsorted(members, i))
+                low = max(0, position - half)
+                members = members[low:low + self.max_bucket_size]
+            found.append(members)
+        found = np.unique(np.concatenate(found))
+        return found[found != i]
+
+    def estimated_jaccard(self, i: int, others: np.ndarray) -> np.ndarray:
+        return (self.signatures[others] == self.signatures[i]).mean(axis=1)
+
+    def top_k_candidates(self, k: int) -> List[np.ndarray]:
+        # 每位用戶依估計的 Jaccard 取前 k 個候選鄰居
+        result = []
+        for i in range(len(self.signatures)):
+            found = self.candidates(i)
+            if len(found) > k:
+                estimates = self.estimated_jaccard(i, found)
+                found = np.sort(found[np.argsort(-estimates, kind='stable')[:k]])
+            result.append(found)
+        return result
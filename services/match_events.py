@@ -0,0 +1,63 @@
+import json
+import logging
+import re
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional
+
+
+logger = logging.getLogger(__name__)
+
+# 配對生命週期事件，透過 WebSocket 推送給用戶
+REQUEST_RECEIVED = "request_received"
+REQUEST_ACCEPTED = "request_accepted"
+REQUEST_REJECTED = "request_rejected"
+REQUEST_EXPIRED = "request_expired"
+PARTNER_DIARY_UPDATED = "partner_diary_updated"
+EVENT_TYPES = (REQUEST_RECEIVED, REQUEST_ACCEPTED, REQUEST_REJECTED, REQUEST_EXPIRED, PARTNER_DIARY_UPDATED)
+
+# 每位用戶保留最近的事件（Redis Stream），斷線重連時依 resume token 補送
+EVENT_STREAM_MAXLEN = 100
+EVENT_STREAM_TTL = 7 * 24 * 3600
+
+_STREAM_ID = re.compile(r"^\d+-\d+$")
+
+
+def events_key(user_id: int) -> str:
+    return f"match_events:{user_id}"
+
+
+def _encode(event_id: str, fields: Dict) -> str:
+    return json.dumps({
+        "id": event_id,
+        "type": fields["type"],
+        "data": json.loads(fields["data"]),
+        "created_at": fields["created_at"]
+    }, ensure_ascii=False)
+
+
+class MatchEventPublisher:
+    # 事件先寫入用戶的事件流，再即時送出；事件 id（stream id）就是用戶端的 resume token
+    def __init__(self, redis_client, send: Callable[[str, int], Awaitable[None]]):
+        self.redis_client = redis_client
+        self.send = send
+
+    async def publish(self, user_id: int, event_type: str, data: Dict) -> str:
+        if event_type not in EVENT_TYPES:
+            raise ValueError(f"未知的事件類型: {event_type}")
+        fields = {"type": event_type, "data": json.dumps(data, ensure_ascii=False), "created_at": datetime.utcnow().isoformat()}
+        key = events_key(user_id)
+        event_id = await self.redis_client.xadd(key, fields, maxlen=EVENT_STREAM_MAXLEN, approximate=True)
+        await self.redis_client.expire(key, EVENT_STREAM_TTL)
+        try:
+            await self.send(_encode(event_id, fields), user_id)
+        except Exception as e:
+            # 用戶不在線或連線已斷，重新連線時會依 resume token 補送
+            logger.debug(f"即時推送事件給用戶 {user_id} 失敗: {str(e)}")
+        return event_id
+
+    async def replay(self, user_id: int, resume_token: Optional[str]) -> List[str]:
+        # 回傳 resume_token 之後的事件（不含 resume_token 本身）
+        if not resume_token or not _STREAM_ID.match(resume_token):
+            return []
+        entries = await self.redis_client.xrange(events_key(user_id), min=f"({resume_token}", max="+", count=EVENT_STREAM_MAXLEN)
+        return [_encode(event_id, fields) for event_id, fields in entries]
@@ -0,0 +1,138 @@
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import Awaitable, Callable, Optional
+from services.availability_queue import mark_available
+from services.match_status import NONE, expires_at, make_record, set_match_status
+
+
+logger = logging.getLogger(__name__)
+
+# 待處理配對請求的延遲佇列：member 為 "request_id:requester_id:recipient_id"，score 為到期時間
+EXPIRY_KEY = "match_request_expiry"
+
+# 最長的等待間隔，新排入的請求最晚在這段時間內被看到
+MAX_SLEEP_SECONDS = 30
+BATCH_SIZE = 100
+# 寫入資料庫失敗時，等這段時間再重試放回佇列的請求
+RETRY_SECONDS = 5
+
+
+def _member(request_id: int, requester_id: int, recipient_id: int) -> str:
+    return f"{request_id}:{requester_id}:{recipient_id}"
+
+
+async def schedule_expiry(redis_client, request_id: int, requester_id: int, recipient_id: int, created_at: datetime):
+    await redis_client.zadd(EXPIRY_KEY, {_member(request_id, requester_id, recipient_id): expires_at(created_at)})
+
+
+async def cancel_expiry(redis_client, request_id: int, requester_id: int, recipient_id: int):
+    await redis_client.zrem(EXPIRY_KEY, _member(request_id, requester_id, recipient_id))
+
+
+class MatchExpiryScheduler:
+    # 背景工作：每個請求在 24 小時到期時才寫一次 expired，讀取路徑不再需要整表 UPDATE
+    def __init__(self, redis_client, database, on_expired: Optional[Callable[[int, int, int], Awaitable[None]]] = None):
+        self.redis_client = redis_client
+        self.database = database
+        self.on_expired = on_expired
+        # 上一次 expire_due 是否有請求因為資料庫錯誤放回佇列
+        self.retry_pending = False
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def load_pending(self):
+        # 啟動時把資料庫中已存在的待處理請求排入佇列（ZADD 冪等，多個 worker 重複執行也沒關係）
+        async with self.database.connection() as db:
+            async with db.cursor(dictionary=True) as cursor:
+                await cursor.execute("""
+                    SELECT id, requester_id, recipient_id, created_at
+                    FROM user_match_requests WHERE status = 'pending'
+                """)
+                pending = await cursor.fetchall()
+        for start in range(0, len(pending), 1000):
+            chunk = pending[start:start + 1000]
+            await self.redis_client.zadd(EXPIRY_KEY, {
+                _member(row['id'], row['requester_id'], row['recipient_id']): expires_at(row['created_at']) for row in chunk
+            })
+
+    async def _run(self):
+        try:
+            await self.load_pending()
+        except Exception as e:
+            logger.error(f"載入待處理配對請求失敗: {str(e)}", exc_info=True)
+
+        while True:
+            try:
+                await self.expire_due()
+                await asyncio.sleep(RETRY_SECONDS if self.retry_pending else await self._seconds_until_next())
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"處理過期配對請求時發生錯誤: {str(e)}", exc_info=True)
+                await asyncio.sleep(MAX_SLEEP_SECONDS)
+
+    async def _seconds_until_next(self) -> float:
+        head = await self.redis_client.zrange(EXPIRY_KEY, 0, 0, withscores=True)
+        if not head:
+            return MAX_SLEEP_SECONDS
+        return min(max(head[0][1] - time.time(), 0.05), MAX_SLEEP_SECONDS)
+
+    async def expire_due(self) -> int:
+        expired = 0
+        self.retry_pending = False
+        while not self.retry_pending:
+            due = await self.redis_client.zrangebyscore(EXPIRY_KEY, 0, time.time(), start=0, num=BATCH_SIZE,
+                                                        withscores=True)
+            if not due:
+                break
+            for member, score in due:
+                # ZREM 成功的 worker 才負責這個請求，多個 worker 之間只會處理一次
+                if not await self.redis_client.zrem(EXPIRY_KEY, member):
+                    continue
+                request_id, requester_id, recipient_id = (int(part) for part in member.split(":"))
+                try:
+                    marked = await self._mark_expired(request_id)
+                except Exception as e:
+                    # 以原本的到期時間放回佇列，繼續處理同一批的其他請求；這一輪不再重取，稍後重試
+                    logger.error(f"標記配對請求 {request_id} 過期失敗: {str(e)}", exc_info=True)
+                    await self.redis_client.zadd(EXPIRY_KEY, {member: score})
+                    self.retry_pending = True
+                    continue
+                if marked:
+                    expired += 1
+                    await self._after_expired(request_id, requester_id, recipient_id)
+        return expired
+
+    async def _mark_expired(self, request_id: int) -> bool:
+        async with self.database.connection() as db:
+            async with db.cursor() as cursor:
+                await cursor.execute("""
+                    UPDATE user_match_requests SET status = 'expired'
+                    WHERE id = %s AND status = 'pending'
+                """, (request_id,))
+                await db.commit()
+                return cursor.rowcount > 0
+
+    async def _after_expired(self, request_id: int, requester_id: int, recipient_id: int):
+        await set_match_status(self.redis_client, requester_id, make_record(NONE))
+        await set_match_status(self.redis_client, recipient_id, make_record(NONE))
+        await mark_available(self.redis_client, requester_id, recipient_id)
+        if self.on_expired:
+            try:
+                await self.on_expired(request_id, requester_id, recipient_id)
+            except Exception as e:
+                logger.error(f"通知配對請求過期失敗: {str(e)}", exc_info=True)
@@ -0,0 +1,138 @@
+import os
+import time
+from datetime import date, timedelta
+from typing import Iterable, Optional, Set, Tuple
+import mysql.connector
+import numpy as np
+
+
+# 冷卻期內配對過（接受或拒絕）的兩人不再被配在一起
+MATCH_COOLDOWN_DAYS = int(os.getenv("MATCH_COOLDOWN_DAYS", "30"))
+# 被排除的組合在配對迴圈中的分數：低於任何真實分數，只有別無選擇時才會被選到
+EXCLUDED_SCORE = -1.0
+
+BITS_PER_PAIR = 10
+BLOOM_HASHES = 5
+# 各個雜湊使用不同的奇數乘數（multiply-shift）
+_HASH_MULTIPLIERS = np.array([
+    0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9, 0xD6E8FEB86659FD93, 0xFF51AFD7ED558CCD
+], dtype=np.uint64)
+
+
+def history_key(user_id: int) -> str:
+    return f"match_history:{user_id}"
+
+
+def cooldown_cutoff(now: Optional[float] = None, cooldown_days: int = MATCH_COOLDOWN_DAYS) -> float:
+    return (now if now is not None else time.time()) - cooldown_days * 86400
+
+
+def pair_keys(a, b) -> np.ndarray:
+    # 無序的一對 (a, b) 編成一個 64 位元整數
+    a = np.asarray(a, dtype=np.uint64)
+    b = np.asarray(b, dtype=np.uint64)
+    return (np.minimum(a, b) << np.uint64(32)) | np.maximum(a, b)
+
+
+class PairBloom:
+    # 固定大小的 Bloom filter，以向量化的 multiply-shift 雜湊做 O(1) 查詢；偶爾誤判只會多排除一組
+    def __init__(self, capacity: int, bits_per_pair: int = BITS_PER_PAIR, hashes: int = BLOOM_HASHES):
+        size_bits = max(64, int(capacity) * bits_per_pair)
+        self.log_bits = int(np.ceil(np.log2(size_bits)))
+        self.bits = np.zeros((1 << self.log_bits) // 64, dtype=np.uint64)
+        self.multipliers = _HASH_MULTIPLIERS[:hashes]
+
+    def _positions(self, keys: np.ndarray) -> np.ndarray:
+        keys = np.asarray(keys, dtype=np.uint64)[..., None]
+        with np.errstate(over='ignore'):
+            return (keys * self.multipliers) >> np.uint64(64 - self.log_bits)
+
+    def add(self, a, b):
+        positions = self._positions(pair_keys(a, b)).ravel()
+        np.bitwise_or.at(self.bits, positions >> np.uint64(6), np.uint64(1) << (positions & np.uint64(63)))
+
+    def contains(self, a, b) -> np.ndarray:
+        positions = self._positions(pair_keys(a, b))
+        words = self.bits[positions >> np.uint64(6)]
+        return ((words >> (positions & np.uint64(63))) & np.uint64(1)).astype(bool).all(axis=-1)
+
+
+class PartnerHistory:
+    # 以引擎的列索引表示的歷史配對：Bloom filter 供任意兩列 O(1) 查詢，
+    # 每列的過去夥伴（CSR）供整列計分時直接把這幾欄設為 EXCLUDED_SCORE
+    def __init__(self, ids: np.ndarray, user_a: Iterable[int], user_b: Iterable[int]):
+        ids = np.asarray(ids, dtype=np.int64)
+        user_a = np.asarray(user_a, dtype=np.int64)
+        user_b = np.asarray(user_b, dtype=np.int64)
+        order = np.argsort(ids, kind='stable')
+        sorted_ids = ids[order]
+
+        def to_rows(user_ids):
+            pos = np.clip(np.searchsorted(sorted_ids, user_ids), 0, max(len(ids) - 1, 0))
+            found = sorted_ids[pos] == user_ids if len(ids) else np.zeros(len(user_ids), dtype=bool)
+            return np.where(found, order[pos] if len(ids) else -1, -1)
+
+        rows_a, rows_b = to_rows(user_a), to_rows(user_b)
+        keep = (rows_a >= 0) & (rows_b >= 0) & (rows_a != rows_b)
+        rows_a, rows_b = rows_a[keep], rows_b[keep]
+
+        self.bloom = PairBloom(len(rows_a))
+        self.bloom.add(rows_a, rows_b)
+        both_a = np.concatenate([rows_a, rows_b])
+        both_b = np.concatenate([rows_b, rows_a])
+        by_row = np.argsort(both_a, kind='stable')
+        self.indices = both_b[by_row]
+        self.indptr = np.concatenate([[0], np.cumsum(np.bincount(both_a, minlength=len(ids)))]).astype(np.int64)
+        self.pairs = len(rows_a)
+
+    def partners(self, row: int) -> np.ndarray:
+        return self.indices[self.indptr[row]:self.indptr[row + 1]]
+
+    def excluded(self, rows, cols) -> np.ndarray:
+        return self.bloom.contains(rows, cols)
+
+
+def load_recent_pairs(db: mysql.connector.connection.MySQLConnection, today: date,
+                      cooldown_days: int = MATCH_COOLDOWN_DAYS) -> Tuple[np.ndarray, np.ndarray]:
+    # 冷卻期內的每日配對與接受／拒絕過的交換請求（兩者都寫入 user_matches，每對兩列只取一列）
+    since = today - timedelta(days=cooldown_days)
+    cursor = db.cursor()
+    try:
+        cursor.execute("""
+            SELECT DISTINCT user_id, partner_id FROM user_matches
+            WHERE match_date >= %s AND status IN ('accepted', 'rejected') AND user_id < partner_id
+        """, (since,))
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+    if not rows:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    pairs = np.array(rows, dtype=np.int64)
+    return pairs[:, 0], pairs[:, 1]
+
+
+def queue_history_updates(pipe, pairs: Iterable[Tuple[int, int]], now: Optional[float] = None,
+                          cooldown_days: int = MATCH_COOLDOWN_DAYS):
+    # 每位用戶一個 sorted set（過去夥伴 -> 配對時間），同時清掉冷卻期以前的紀錄
+    # 只把指令放進 pipeline，同步與 asyncio 的 Redis 用戶端都可以使用
+    now = now if now is not None else time.time()
+    cutoff = cooldown_cutoff(now, cooldown_days)
+    for user_id, partner_id in pairs:
+        for a, b in ((user_id, partner_id), (partner_id, user_id)):
+            key = history_key(a)
+            pipe.zadd(key, {str(b): now})
+            pipe.zremrangebyscore(key, 0, cutoff)
+            pipe.expire(key, cooldown_days * 86400)
+
+
+async def record_partners(redis_client, *pairs: Tuple[int, int]):
+    if not pairs:
+        return
+    async with redis_client.pipeline(transaction=False) as pipe:
+        queue_history_updates(pipe, pairs)
+        await pipe.execute()
+
+
+async def recent_partners(redis_client, user_id: int) -> Set[int]:
+    members = await redis_client.zrangebyscore(history_key(user_id), cooldown_cutoff(), "+inf")
+    return {int(member) for member in members}
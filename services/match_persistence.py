@@ -0,0 +1,70 @@
+import logging
+import mysql.connector
+from datetime import date
+from typing import Dict, List, Sequence, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+# 每個交易處理的配對數（每對寫入兩列 user_matches）
+CHUNK_SIZE = 500
+
+
+def save_daily_matches(db: mysql.connector.connection.MySQLConnection, pairs: Sequence[Tuple[int, int]],
+                       match_date: date, status: str = 'accepted', chunk_size: int = CHUNK_SIZE) -> Dict[str, int]:
+    # 批次寫入一次配對的結果：每個 chunk 一個交易，多列 INSERT + 一次 UPDATE users
+    # 同一個 match_date 已經有紀錄的用戶會被略過，重跑不會重複寫入；
+    # chunk 失敗整個回滾，不會留下只寫了一半的配對
+    inserted = skipped = 0
+    for start in range(0, len(pairs), chunk_size):
+        chunk = pairs[start:start + chunk_size]
+        written = _save_chunk(db, chunk, match_date, status)
+        inserted += written
+        skipped += len(chunk) - written
+    logger.info(f"{match_date} 的配對已寫入 {inserted} 對，略過 {skipped} 對")
+    return {"inserted": inserted, "skipped": skipped}
+
+
+def _save_chunk(db, chunk: Sequence[Tuple[int, int]], match_date: date, status: str) -> int:
+    user_ids = [user_id for pair in chunk for user_id in pair]
+    placeholders = ", ".join(["%s"] * len(user_ids))
+    cursor = db.cursor(dictionary=True)
+    try:
+        db.start_transaction()
+
+        # 鎖住這些用戶當天的配對紀錄，並找出已經寫入過的用戶
+        cursor.execute(f"""
+            SELECT user_id FROM user_matches
+            WHERE match_date = %s AND user_id IN ({placeholders})
+            FOR UPDATE
+        """, (match_date, *user_ids))
+        already_matched = {row['user_id'] for row in cursor.fetchall()}
+
+        pending: List[Tuple[int, int]] = [
+            (user1_id, user2_id) for user1_id, user2_id in chunk
+            if user1_id not in already_matched and user2_id not in already_matched
+        ]
+        if pending:
+            values = []
+            for user1_id, user2_id in pending:
+                values.extend((user1_id, user2_id, match_date, status, user2_id, user1_id, match_date, status))
+            rows = ", ".join(["(%s, %s, %s, %s), (%s, %s, %s, %s)"] * len(pending))
+            cursor.execute(f"""
+                INSERT INTO user_matches (user_id, partner_id, match_date, status)
+                VALUES {rows}
+            """, tuple(values))
+
+            matched_ids = [user_id for pair in pending for user_id in pair]
+            cursor.execute(f"""
+                UPDATE users SET is_matching = 1
+                WHERE id IN ({", ".join(["%s"] * len(matched_ids))})
+            """, tuple(matched_ids))
+
+        db.commit()
+        return len(pending)
+    except Exception:
+        db.rollback()
+        logger.error(f"寫入配對失敗，已回滾 {len(chunk)} 對", exc_info=True)
+        raise
+    finally:
+        cursor.close()
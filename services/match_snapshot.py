@@ -0,0 +1,145 @@
+import json
+import os
+import shutil
+import tempfile
+from array import array
+import numpy as np
+from typing import Dict, Iterable, List, Optional, Sequence
+
+
+# 與 User.weather_counts 預設的五種天氣一致，其他天氣類型會附加在後面
+WEATHER_TYPES = ['sunny', 'cloudy', 'rainy', 'snowy', 'windy']
+
+_COLUMNS = ('ids', 'posting_frequency', 'like_count', 'avg_mood_score', 'weather', 'keyword_indptr', 'keyword_indices')
+
+
+class MatchSnapshot:
+    # 配對所需的欄位式快照：每位用戶一列，關鍵字以整數 id 儲存
+    # 寫入目錄後可用 mmap 載入，多個 worker 行程共用同一份分頁快取
+    def __init__(self, ids: np.ndarray, posting_frequency: np.ndarray, like_count: np.ndarray,
+                 avg_mood_score: np.ndarray, weather: np.ndarray, keyword_indptr: np.ndarray,
+                 keyword_indices: np.ndarray, weather_types: List[str], vocabulary: List[str]):
+        self.ids = ids
+        self.posting_frequency = posting_frequency
+        self.like_count = like_count
+        self.avg_mood_score = avg_mood_score
+        self.weather = weather
+        self.keyword_indptr = keyword_indptr
+        self.keyword_indices = keyword_indices
+        self.weather_types = weather_types
+        self.vocabulary = vocabulary
+        self._keyword_ids: Optional[Dict[str, int]] = None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(getattr(self, column).nbytes for column in _COLUMNS)
+
+    def keyword_id(self, keyword: str) -> Optional[int]:
+        if self._keyword_ids is None:
+            self._keyword_ids = {word: index for index, word in enumerate(self.vocabulary)}
+        return self._keyword_ids.get(keyword)
+
+    def keywords(self, row: int) -> List[str]:
+        start, stop = self.keyword_indptr[row], self.keyword_indptr[row + 1]
+        return [self.vocabulary[index] for index in self.keyword_indices[start:stop]]
+
+    @classmethod
+    def from_users(cls, users: Iterable) -> "MatchSnapshot":
+        # 已經有 User 物件時使用；從資料庫建立時用 services.matching_loader.load_matching_snapshot，不需要先建立 User
+        builder = MatchSnapshotBuilder()
+        for user in users:
+            builder.add(user.id, user.posting_frequency, user.like_count, user.avg_mood_score,
+                        user.weather_counts, user.get_all_keywords())
+        return builder.build()
+
+    def save(self, path: str):
+        # 先寫到暫存目錄再改名，讀取端不會看到寫到一半的快照
+        parent = os.path.dirname(os.path.abspath(path))
+        os.makedirs(parent, exist_ok=True)
+        tmp_path = tempfile.mkdtemp(prefix=".snapshot-", dir=parent)
+        try:
+            for column in _COLUMNS:
+                np.save(os.path.join(tmp_path, f"{column}.npy"), getattr(self, column))
+            with open(os.path.join(tmp_path, "meta.json"), "w", encoding="utf-8") as f:
+                json.dump({"weather_types": self.weather_types, "vocabulary": self.vocabulary}, f, ensure_ascii=False)
+        except Exception:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            raise
+        # 舊快照先改名移開、新快照立即換上，最後才刪除舊的：兩次 rename 之間才會短暫沒有快照
+        # 已經以 mmap 開啟舊檔案的讀取端不受刪除影響
+        old_path = None
+        if os.path.exists(path):
+            old_path = f"{tmp_path}-old"
+            os.rename(path, old_path)
+        try:
+            os.rename(tmp_path, path)
+        except Exception:
+            if old_path is not None:
+                os.rename(old_path, path)
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            raise
+        if old_path is not None:
+            shutil.rmtree(old_path, ignore_errors=True)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> "MatchSnapshot":
+        mode = 'r' if mmap else None
+        columns = {column: np.load(os.path.join(path, f"{column}.npy"), mmap_mode=mode) for column in _COLUMNS}
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        return cls(weather_types=meta["weather_types"], vocabulary=meta["vocabulary"], **columns)
+
+
+class MatchSnapshotBuilder:
+    # 逐位用戶附加到緊湊的 array 欄位，不需要保留 User / DiaryEntryResponse 物件
+    def __init__(self, weather_types: Sequence[str] = WEATHER_TYPES):
+        self.weather_types = list(weather_types)
+        self._weather_index = {weather: index for index, weather in enumerate(self.weather_types)}
+        self._keyword_ids: Dict[str, int] = {}
+        self._ids = array('q')
+        self._posting_frequency = array('d')
+        self._like_count = array('q')
+        self._avg_mood_score = array('d')
+        self._weather: List[array] = [array('i') for _ in self.weather_types]
+        self._keyword_indptr = array('q', [0])
+        self._keyword_indices = array('i')
+
+    def add(self, user_id: int, posting_frequency: float, like_count: int, avg_mood_score: float,
+            weather_counts: Dict[str, int], keywords: Iterable[str]):
+        self._ids.append(int(user_id))
+        self._posting_frequency.append(float(posting_frequency or 0))
+        self._like_count.append(int(like_count or 0))
+        self._avg_mood_score.append(float(avg_mood_score or 0))
+
+        for weather in weather_counts:
+            if weather not in self._weather_index:
+                # 新的天氣類型：之前的用戶補 0
+                self._weather_index[weather] = len(self.weather_types)
+                self.weather_types.append(weather)
+                self._weather.append(array('i', [0] * (len(self._ids) - 1)))
+        for weather, column in zip(self.weather_types, self._weather):
+            column.append(int(weather_counts.get(weather, 0) or 0))
+
+        for keyword in keywords:
+            self._keyword_indices.append(self._keyword_ids.setdefault(keyword, len(self._keyword_ids)))
+        self._keyword_indptr.append(len(self._keyword_indices))
+
+    def build(self) -> MatchSnapshot:
+        n = len(self._ids)
+        weather = np.zeros((n, len(self.weather_types)), dtype=np.int32)
+        for index, column in enumerate(self._weather):
+            weather[:, index] = np.frombuffer(column, dtype=np.int32) if len(column) else 0
+        return MatchSnapshot(
+            ids=np.frombuffer(self._ids, dtype=np.int64).copy(),
+            posting_frequency=np.frombuffer(self._posting_frequency, dtype=np.float64).copy(),
+            like_count=np.frombuffer(self._like_count, dtype=np.int64).astype(np.int32),
+            avg_mood_score=np.frombuffer(self._avg_mood_score, dtype=np.float64).copy(),
+            weather=weather,
+            keyword_indptr=np.frombuffer(self._keyword_indptr, dtype=np.int64).copy(),
+            keyword_indices=np.frombuffer(self._keyword_indices, dtype=np.int32).copy(),
+            weather_types=list(self.weather_types),
+            vocabulary=list(self._keyword_ids)
+        )
@@ -0,0 +1,138 @@
+import json
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional
+from services.availability_queue import mark_available
+
+
+# 每位用戶的配對狀態紀錄，快取在 match_status:{user_id}
+# state: none / outgoing / incoming / accepted，另外記錄夥伴 id、名字、建立時間與到期時間
+# 每個狀態轉換都直接寫入新紀錄（write-through），輪詢只讀快取
+STATUS_TTL = 3600
+
+# 待處理的配對請求 24 小時後過期
+REQUEST_TTL = timedelta(hours=24)
+
+NONE = "none"
+OUTGOING = "outgoing"
+INCOMING = "incoming"
+ACCEPTED = "accepted"
+
+
+def expires_at(created_at: datetime) -> float:
+    # created_at 為資料庫中的 UTC naive 時間
+    return (created_at.replace(tzinfo=timezone.utc) + REQUEST_TTL).timestamp()
+
+
+def status_key(user_id: int) -> str:
+    return f"match_status:{user_id}"
+
+
+def make_record(state: str, partner_id: Optional[int] = None, partner_name: Optional[str] = None,
+                created_at: Optional[datetime] = None) -> Dict:
+    record = {"state": state, "partner_id": partner_id, "partner_name": partner_name, "created_at": None, "deadline": None}
+    if created_at is not None:
+        record["created_at"] = created_at.isoformat()
+        if state in (OUTGOING, INCOMING):
+            record["deadline"] = expires_at(created_at)
+    return record
+
+
+async def set_match_status(redis_client, user_id: int, record: Dict):
+    await redis_client.set(status_key(user_id), json.dumps(record), ex=STATUS_TTL)
+
+
+async def get_cached_match_status(redis_client, user_id: int) -> Optional[Dict]:
+    cached = await redis_client.get(status_key(user_id))
+    return json.loads(cached) if cached else None
+
+
+async def _load_status_row(db, user_id: int) -> Optional[Dict]:
+    # 以一次查詢取出最新的待處理請求、最新的配對以及夥伴資料
+    async with db.cursor(dictionary=True) as cursor:
+        await cursor.execute("""
+            SELECT users.is_matching,
+                   requests.requester_id, requests.recipient_id, requests.created_at AS request_created_at,
+                   matches.status AS match_status, matches.partner_id, matches.created_at AS match_created_at,
+                   partner.id AS partner_user_id, partner.name AS partner_name
+            FROM users
+            LEFT JOIN user_match_requests requests ON requests.id = (
+                SELECT id FROM user_match_requests
+                WHERE (requester_id = users.id OR recipient_id = users.id) AND status = 'pending'
+                AND created_at > DATE_SUB(NOW(), INTERVAL 24 HOUR)
+                ORDER BY created_at DESC LIMIT 1
+            )
+            LEFT JOIN user_matches matches ON matches.id = (
+                SELECT id FROM user_matches WHERE user_id = users.id
+                ORDER BY created_at DESC LIMIT 1
+            )
+            LEFT JOIN users partner ON partner.id = CASE
+                WHEN requests.id IS NULL THEN matches.partner_id
+                WHEN requests.requester_id = users.id THEN requests.recipient_id
+                ELSE requests.requester_id
+            END
+            WHERE users.id = %s
+        """, (user_id,))
+        return await cursor.fetchone()
+
+
+def _record_from_row(row: Optional[Dict], user_id: int) -> Dict:
+    if not row:
+        return make_record(NONE)
+    if row['requester_id'] is not None:
+        state = OUTGOING if row['requester_id'] == user_id else INCOMING
+        return make_record(state, row['partner_user_id'], row['partner_name'], row['request_created_at'])
+    if row['is_matching'] == 1 and row['match_status'] == 'accepted':
+        return make_record(ACCEPTED, row['partner_id'], row['partner_name'], row['match_created_at'])
+    return make_record(NONE)
+
+
+async def refresh_match_status(redis_client, db, user_id: int) -> Dict:
+    # 快取未命中時從資料庫算出狀態並寫回快取
+    # 沒有配對時 is_matching 只在這裡重設，也只有資料庫中 is_matching = 0 的用戶會放回可配對佇列
+    row = await _load_status_row(db, user_id)
+    record = _record_from_row(row, user_id)
+    await set_match_status(redis_client, user_id, record)
+    if row and record["state"] == NONE:
+        if row['is_matching'] == 1 and row['match_status'] is not None:
+            # 最新的配對已不是 accepted（被拒絕或已結束）
+            async with db.cursor() as cursor:
+                await cursor.execute("UPDATE users SET is_matching = 0 WHERE id = %s AND is_matching = 1", (user_id,))
+            await db.commit()
+            row['is_matching'] = 0
+        if row['is_matching'] == 0:
+            await mark_available(redis_client, user_id)
+    return record
+
+
+def to_response(record: Dict) -> Dict:
+    # 轉成 /matching/status 原本的回應格式，剩餘時間在讀取時才計算
+    state = record["state"]
+    if state in (OUTGOING, INCOMING):
+        remaining = record["deadline"] - time.time()
+        if remaining > 0:
+            if state == OUTGOING:
+                return {
+                    "status": "pending",
+                    "message": "You have a pending outgoing match request",
+                    "recipient_id": record["partner_id"],
+                    "remaining_time_seconds": remaining,
+                    "created_at": record["created_at"]
+                }
+            requester_name = record["partner_name"] or "Unknown"
+            return {
+                "status": "incoming_request",
+                "message": f"You have a pending incoming match request from {requester_name}",
+                "requester_id": record["partner_id"],
+                "requester_name": requester_name,
+                "remaining_time_seconds": remaining,
+                "created_at": record["created_at"]
+            }
+    elif state == ACCEPTED:
+        return {
+            "status": "accepted",
+            "partner_id": record["partner_id"],
+            "partner_name": record["partner_name"],
+            "match_date": record["created_at"]
+        }
+    return {"status": "no_match", "message": "You don't have any current matches. Click EXCHANGE to find a diary buddy!"}
@@ -0,0 +1,141 @@
+import logging
+from datetime import datetime, date
+from typing import List, Dict, Tuple, Set, Optional, Sequence
+from models.diary import DiaryEntryResponse
+from services.similarity_engine import SimilarityEngine
+from services.match_snapshot import MatchSnapshot
+from services.keyword_lsh import KeywordLSH
+from services.pairing import PairingResult, pair_users
+from services.tokenizer import extract_keywords
+
+
+logger = logging.getLogger(__name__)
+
+
+def posting_frequency(entries: Sequence) -> float:
+    # 日記篇數除以第一篇到最後一篇之間的天數
+    if not entries:
+        return 0.0
+    dates = [datetime.strptime(entry.date, "%Y-%m-%d").date() for entry in entries]
+    date_range = (max(dates) - min(dates)).days + 1
+    return len(entries) / date_range if date_range > 0 else 0.0
+
+
+def diary_keywords(entries: Sequence) -> Set[str]:
+    # 每篇日記的關鍵字在寫入時已斷好（MatchDiaryEntry.keywords），沒有的才依內容斷詞
+    keywords = set()
+    for entry in entries:
+        entry_keywords = getattr(entry, 'keywords', None)
+        keywords |= entry_keywords if entry_keywords is not None else extract_keywords(entry.content)
+    return keywords
+
+
+class User:
+    def __init__(self, id: int):
+        self.id = id
+        self._keywords: Optional[Set[str]] = None
+        self.diary_entries: List[DiaryEntryResponse] = []
+        self.posting_frequency: float = 0.0
+        self.last_matched: Optional[date] = None
+        self.current_exchange_partner: Optional[int] = None
+        self.pending_requests: List[int] = []  # 新增：儲存待處理的請求ID
+        self.like_count: int = 0
+        self.weather_counts: Dict[str, int] = {
+                        'sunny': 0, 'cloudy': 0, 'rainy': 0, 'snowy': 0, 'windy': 0
+        }
+        self.mood_scores: List[float] = []
+        self.avg_mood_score: float = 0.0
+
+
+    def calculate_avg_mood_score(self):
+        if self.mood_scores:
+            self.avg_mood_score = sum(self.mood_scores) / len(self.mood_scores)
+        else:
+            self.avg_mood_score = 0.0
+
+    def calculate_posting_frequency(self):
+        self.posting_frequency = posting_frequency(self.diary_entries)
+
+    @property
+    def diary_entries(self) -> List[DiaryEntryResponse]:
+        return self._diary_entries
+
+    @diary_entries.setter
+    def diary_entries(self, entries: List[DiaryEntryResponse]):
+        # 換上新的日記清單時才重算關鍵字；要修改日記請指定新的清單，不要原地修改
+        self._diary_entries = entries
+        self._keywords = None
+
+    def get_all_keywords(self) -> Set[str]:
+        # calculate_similarity 每次都會呼叫，每份日記清單只取一次聯集（回傳的集合唯讀，不要修改）
+        if self._keywords is None:
+            self._keywords = diary_keywords(self._diary_entries)
+        return self._keywords
+
+
+def calculate_similarity(user1: User, user2: User, target_keyword: str=None) -> float:
+    user1_keywords = user1.get_all_keywords()
+    user2_keywords = user2.get_all_keywords()
+    all_keywords = user1_keywords | user2_keywords
+
+    # target_keyword = "olympic"
+    if not all_keywords:
+        keyword_similarity = 0
+    else:
+        keyword_weights = { k:3 if k == target_keyword else 1 for k in all_keywords}
+        weighted_common_keywords = sum(keyword_weights[k] for k in user1_keywords & user2_keywords)
+        total_weighted_keywords = sum(keyword_weights.values())
+        keyword_similarity = (weighted_common_keywords/total_weighted_keywords) if total_weighted_keywords > 0 else 0
+
+    # 計算發文頻率相似度
+    freq_diff = abs(user1.posting_frequency - user2.posting_frequency)
+    freq_similarity = 1 / (1 + freq_diff)  # 頻率差異越小，相似度越高
+
+    # 計算點讚數相似度（希望活潑的配對不那麼活潑的）
+    like_diff = abs(user1.like_count-user2.like_count)
+    like_similarity = 1/(like_diff + 1)
+
+    # 計算天氣偏好相似度（希望天氣相似的配對）
+    all_weather_types = set(user1.weather_counts.keys()) | set(user2.weather_counts.keys())
+
+    similarity = sum(min(user1.weather_counts.get(w, 0), user2.weather_counts.get(w, 0)) for w in all_weather_types)
+    total_weather = sum(user1.weather_counts.values()) + sum(user2.weather_counts.values())
+
+    weather_similarity = similarity / total_weather if total_weather > 0 else 0
+
+    # 計算心情分數相似度（希望心情好的配對心情不好的）
+    mood_diff = abs(user1.avg_mood_score - user2.avg_mood_score)
+    mood_similarity = 1/(mood_diff + 1)
+
+    return (
+        0.25 * keyword_similarity +
+        0.20 * freq_similarity +
+        0.15 * like_similarity +
+        0.20 * weather_similarity +
+        0.20 * mood_similarity
+    )
+
+
+def match_users(users: List[User], target_keyword: str = None, candidate_k: int = None, lsh_bands: int = 16,
+                pairing: str = 'greedy', time_budget: float = None,
+                history: Optional[Tuple[Sequence[int], Sequence[int]]] = None) -> Tuple[List[Tuple[User, User]], PairingResult]:
+    # 只負責計算配對，不碰資料庫：daily_matching、離線 job 與 benchmark 共用
+    # 一次編碼所有用戶成欄位式快照，以矩陣運算取代逐一呼叫 calculate_similarity
+    snapshot = MatchSnapshot.from_users(users)
+    engine = SimilarityEngine.from_snapshot(snapshot, target_keyword)
+    # history：冷卻期內配對過的 (用戶 id, 用戶 id)，例如 load_recent_pairs 的結果
+    if history is not None:
+        engine.exclude_pairs(*history)
+
+    # 設定 candidate_k 時只計算 LSH 找到的前 K 個關鍵字鄰居，lsh_bands 越大召回越高
+    candidates = None
+    if candidate_k:
+        lsh = KeywordLSH(bands=lsh_bands).fit(engine.keywords)
+        candidates = lsh.top_k_candidates(candidate_k)
+
+    # pairing：greedy（原本的方式）、exact（blossom）、sorted_edge（top-K 稀疏圖）、auto
+    # time_budget 秒內 exact 沒有完成就改用 sorted_edge
+    result = pair_users(engine, strategy=pairing, candidates=candidates, k=candidate_k or 10, time_budget=time_budget)
+    logger.info(f"配對策略 {result.strategy}：{len(result.pairs)} 對，總相似度 {result.total_similarity:.4f}，耗時 {result.elapsed:.2f}s")
+
+    return [(users[i], users[j]) for i, j in result.pairs], result
@@ -0,0 +1,277 @@
+import argparse
+import json
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, datetime
+from typing import Callable, Dict, List, Optional
+import numpy as np
+import pytz
+import redis
+from services.match_snapshot import MatchSnapshot
+from services.matching_loader import load_matching_snapshot
+from services.similarity_engine import SimilarityEngine
+from services.pairing import PAIRING_STRATEGIES, pair_users
+from services.match_persistence import save_daily_matches
+from services.matching_queue import DEFAULT_PAIRING, MATCHING_JOB_QUEUE, JOB_STATUS_TTL, job_key, make_job_id
+from services.match_status import status_key
+from services.match_history import load_recent_pairs, queue_history_updates
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 每日配對的離線工作：
+#   python -m services.matching_job run --keyword olympic --workers 4   手動或由 cron 排程執行
+#   python -m services.matching_job worker                              消化 POST /daily_matches 排入的工作
+# 每個階段都寫檢查點到 MATCHING_JOB_DIR/<match_date>/，被中斷後重跑會從停下的地方繼續
+JOB_ROOT = os.getenv("MATCHING_JOB_DIR", "/tmp/matching_jobs")
+SHARD_SIZE = 5000
+TOP_K = 10
+
+_worker_engine: Optional[SimilarityEngine] = None
+
+
+def _load_engine(snapshot: MatchSnapshot, history_path: str, target_keyword: Optional[str]) -> SimilarityEngine:
+    # 冷卻期內配對過的組合跟快照一起存檔，每個行程各自建立排除用的 Bloom filter
+    engine = SimilarityEngine.from_snapshot(snapshot, target_keyword)
+    with np.load(history_path) as history:
+        return engine.exclude_pairs(history["user_a"], history["user_b"])
+
+
+def _init_worker(snapshot_path: str, history_path: str, target_keyword: Optional[str]):
+    # 每個 worker 行程以 mmap 載入同一份快照，只建立一次引擎
+    global _worker_engine
+    _worker_engine = _load_engine(MatchSnapshot.load(snapshot_path), history_path, target_keyword)
+
+
+def _score_shard(start: int, stop: int, k: int, out_path: str) -> int:
+    indices, scores = _worker_engine.top_k(k, start, stop)
+    tmp_path = f"{out_path}.tmp.npz"
+    np.savez(tmp_path, indices=indices, scores=scores)
+    os.replace(tmp_path, out_path)
+    return start
+
+
+class MatchingJob:
+    # pairing / time_budget 與 services.pairing.pair_users 相同；sorted_edge（與 auto 人數過多時）使用分片算好的 top-K
+    # candidate_k 為每位用戶保留的鄰居數（分片 top-K 的 K）
+    def __init__(self, match_date: date, target_keyword: Optional[str] = None, workers: Optional[int] = None,
+                 k: int = TOP_K, shard_size: int = SHARD_SIZE, job_root: str = JOB_ROOT,
+                 on_progress: Optional[Callable[[Dict], None]] = None, redis_client: Optional[redis.Redis] = None,
+                 load_snapshot: Optional[Callable] = None, pairing: str = DEFAULT_PAIRING,
+                 time_budget: Optional[float] = None, candidate_k: Optional[int] = None):
+        self.match_date = match_date
+        self.target_keyword = target_keyword
+        self.pairing = pairing
+        self.time_budget = time_budget
+        # 會影響結果的參數；同一天的檢查點只能以相同的參數繼續
+        self.options = {"target_keyword": target_keyword, "pairing": pairing, "time_budget": time_budget,
+                        "candidate_k": candidate_k}
+        self.job_id = make_job_id(match_date)
+        self.job_dir = os.path.join(job_root, self.job_id)
+        self.workers = workers
+        self.k = candidate_k or k
+        self.shard_size = shard_size
+        self.on_progress = on_progress
+        self.redis_client = redis_client
+        # (db, match_date) -> MatchSnapshot，預設從資料庫逐列建立
+        self.load_snapshot = load_snapshot or load_matching_snapshot
+        os.makedirs(self.job_dir, exist_ok=True)
+
+        self.state = self._read_state() or {
+            "job_id": self.job_id,
+            "match_date": match_date.isoformat(),
+            **self.options,
+            "status": "running",
+            "stage": None,
+            "shards_done": 0,
+            "shards_total": 0,
+            "progress": 0.0
+        }
+
+    @property
+    def snapshot_path(self) -> str:
+        return os.path.join(self.job_dir, "snapshot")
+
+    @property
+    def history_path(self) -> str:
+        return os.path.join(self.job_dir, "history.npz")
+
+    def _shard_path(self, start: int) -> str:
+        return os.path.join(self.job_dir, f"topk_{start}.npz")
+
+    def _read_state(self) -> Optional[Dict]:
+        path = os.path.join(self.job_dir, "state.json")
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+        return None
+
+    def _update(self, **changes):
+        self.state.update(changes, updated_at=datetime.utcnow().isoformat())
+        tmp_path = os.path.join(self.job_dir, "state.json.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, ensure_ascii=False)
+        os.replace(tmp_path, os.path.join(self.job_dir, "state.json"))
+        if self.on_progress:
+            self.on_progress(dict(self.state))
+
+    def run(self, db_factory: Callable) -> Dict:
+        changed = {name: self.state.get(name) for name, value in self.options.items() if self.state.get(name) != value}
+        if changed:
+            # 同一天的檢查點是用別的參數算的，不能混用；只回報失敗（排入時寫的 queued 不會一直留著），檢查點保持原樣
+            error = f"{self.job_id} 已經以 {changed!r} 執行過"
+            if self.on_progress:
+                self.on_progress({**self.state, **self.options, "status": "failed",
+                                  "error": error, "updated_at": datetime.utcnow().isoformat()})
+            raise ValueError(error)
+        if self.state["status"] == "done":
+            logger.info(f"配對工作 {self.job_id} 已經完成")
+            # 重新排入已完成的工作時，把 queued 的狀態換回 done
+            if self.on_progress:
+                self.on_progress(dict(self.state))
+            return self.state
+        try:
+            self._update(status="running", error=None)
+            snapshot = self._build_snapshot(db_factory)
+            top_k = self._score_candidates(snapshot)
+            pairs = self._pair(snapshot, top_k)
+            self._persist(db_factory, snapshot, pairs)
+            self._update(status="done", stage="done", progress=1.0)
+        except Exception as e:
+            logger.error(f"配對工作 {self.job_id} 失敗: {str(e)}", exc_info=True)
+            self._update(status="failed", error=str(e))
+            raise
+        return self.state
+
+    def _build_snapshot(self, db_factory: Callable) -> MatchSnapshot:
+        if not os.path.exists(self.snapshot_path):
+            self._update(stage="snapshot")
+            # 候選人與日記以非緩衝游標逐列讀進 MatchSnapshotBuilder，不建立 User 物件
+            db = db_factory()
+            try:
+                snapshot = self.load_snapshot(db, self.match_date)
+            finally:
+                db.close()
+            snapshot.save(self.snapshot_path)
+        if not os.path.exists(self.history_path):
+            db = db_factory()
+            try:
+                user_a, user_b = load_recent_pairs(db, self.match_date)
+            finally:
+                db.close()
+            np.savez(f"{self.history_path}.tmp.npz", user_a=user_a, user_b=user_b)
+            os.replace(f"{self.history_path}.tmp.npz", self.history_path)
+        return MatchSnapshot.load(self.snapshot_path)
+
+    def _score_candidates(self, snapshot: MatchSnapshot):
+        n = len(snapshot)
+        starts = list(range(0, n, self.shard_size))
+        pending = [start for start in starts if not os.path.exists(self._shard_path(start))]
+        self._update(stage="candidates", shards_total=len(starts), shards_done=len(starts) - len(pending))
+
+        if pending:
+            # 依列分片到多個行程，每片完成就寫檢查點
+            with ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                     initargs=(self.snapshot_path, self.history_path, self.state["target_keyword"])) as executor:
+                futures = [executor.submit(_score_shard, start, min(start + self.shard_size, n), self.k, self._shard_path(start))
+                           for start in pending]
+                for future in as_completed(futures):
+                    future.result()
+                    done = self.state["shards_done"] + 1
+                    self._update(shards_done=done, progress=0.9 * done / len(starts))
+
+        shards = [np.load(self._shard_path(start)) for start in starts]
+        if not shards:
+            return np.zeros((0, 0), dtype=np.int64), np.zeros((0, 0))
+        return np.concatenate([s["indices"] for s in shards]), np.concatenate([s["scores"] for s in shards])
+
+    def _pair(self, snapshot: MatchSnapshot, top_k) -> np.ndarray:
+        path = os.path.join(self.job_dir, "pairs.npy")
+        if not os.path.exists(path):
+            self._update(stage="pairing")
+            engine = _load_engine(snapshot, self.history_path, self.state["target_keyword"])
+            result = pair_users(engine, self.pairing, k=self.k, time_budget=self.time_budget, top_k=top_k)
+            pairs = result.pairs
+            self._update(pairs=len(pairs), total_similarity=result.total_similarity, pairing_used=result.strategy)
+            np.save(f"{path}.tmp.npy", np.array(pairs, dtype=np.int64).reshape(-1, 2))
+            os.replace(f"{path}.tmp.npy", path)
+        return np.load(path)
+
+    def _persist(self, db_factory: Callable, snapshot: MatchSnapshot, pairs: np.ndarray):
+        self._update(stage="persist", progress=0.95)
+        # save_daily_matches 以 match_date 冪等，中斷後重跑只會補寫還沒寫入的配對
+        user_pairs = [(int(snapshot.ids[i]), int(snapshot.ids[j])) for i, j in pairs]
+        db = db_factory()
+        try:
+            save_daily_matches(db, user_pairs, self.match_date)
+        finally:
+            db.close()
+
+        # 配對後的用戶狀態改變，讓下一次輪詢從資料庫重新計算；新配對記入冷卻期紀錄
+        if self.redis_client:
+            user_ids = [user_id for pair in user_pairs for user_id in pair]
+            for start in range(0, len(user_ids), 1000):
+                self.redis_client.delete(*[status_key(user_id) for user_id in user_ids[start:start + 1000]])
+            for start in range(0, len(user_pairs), 1000):
+                pipe = self.redis_client.pipeline(transaction=False)
+                queue_history_updates(pipe, user_pairs[start:start + 1000])
+                pipe.execute()
+
+
+def _redis_progress(client: redis.Redis) -> Callable[[Dict], None]:
+    def publish(state: Dict):
+        client.set(job_key(state["job_id"]), json.dumps(state), ex=JOB_STATUS_TTL)
+    return publish
+
+
+def run_matching_job(match_date: date, target_keyword: Optional[str] = None, workers: Optional[int] = None,
+                     redis_client: Optional[redis.Redis] = None, pairing: str = DEFAULT_PAIRING,
+                     time_budget: Optional[float] = None, candidate_k: Optional[int] = None) -> Dict:
+    from dependencies import pool
+    on_progress = _redis_progress(redis_client) if redis_client else None
+    job = MatchingJob(match_date, target_keyword, workers, on_progress=on_progress, redis_client=redis_client,
+                      pairing=pairing, time_budget=time_budget, candidate_k=candidate_k)
+    return job.run(pool.get_connection)
+
+
+def worker_loop(redis_client: redis.Redis, workers: Optional[int] = None):
+    logger.info("每日配對 worker 已啟動，等待工作")
+    while True:
+        _, payload = redis_client.blpop(MATCHING_JOB_QUEUE)
+        try:
+            job = json.loads(payload)
+            run_matching_job(date.fromisoformat(job["match_date"]), job.get("target_keyword"), workers, redis_client,
+                             job.get("pairing", DEFAULT_PAIRING), job.get("time_budget"), job.get("candidate_k"))
+        except Exception:
+            # 記錄後繼續處理下一個工作（格式錯誤的 payload 也不會讓 worker 停下）
+            logger.exception(f"配對工作執行失敗: {payload}")
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="每日配對離線工作")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    run_parser = subparsers.add_parser("run", help="執行（或從檢查點繼續）一天的配對")
+    run_parser.add_argument("--date", type=date.fromisoformat, default=None, help="配對日期，預設為今天 (UTC)")
+    run_parser.add_argument("--keyword", default=None, help="加權的目標關鍵字")
+    run_parser.add_argument("--workers", type=int, default=None)
+    run_parser.add_argument("--pairing", choices=PAIRING_STRATEGIES, default=DEFAULT_PAIRING)
+    run_parser.add_argument("--time-budget", type=float, default=None, help="exact 配對的時間預算（秒），超過改用 sorted_edge")
+    run_parser.add_argument("--candidate-k", type=int, default=None, help=f"每位用戶保留的鄰居數，預設 {TOP_K}")
+    worker_parser = subparsers.add_parser("worker", help="從 Redis 佇列消化 POST /daily_matches 排入的工作")
+    worker_parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    redis_client = redis.Redis(host='redis', port=6379, decode_responses=True)
+    if args.command == "run":
+        match_date = args.date or datetime.now(pytz.utc).date()
+        state = run_matching_job(match_date, args.keyword, args.workers, redis_client,
+                                 args.pairing, args.time_budget, args.candidate_k)
+        print(json.dumps(state, ensure_ascii=False))
+    else:
+        worker_loop(redis_client, args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import mysql.connector
+from datetime import date, timedelta
+from typing import Dict, Iterator, List, Optional
+from services.diary_loader import CHUNK_SIZE, load_recent_diaries
+from services.match_snapshot import MatchSnapshot, MatchSnapshotBuilder, WEATHER_TYPES
+from services.matching import diary_keywords, posting_frequency
+
+
+# 每日配對的候選人：今天還沒有配對的用戶及其點讚、心情與天氣統計
+DIARIES_PER_USER = 100
+
+
+def iter_candidate_rows(db: mysql.connector.connection.MySQLConnection, today: date,
+                        user_ids: Optional[List[int]] = None) -> Iterator[Dict]:
+    # 非緩衝游標逐列讀取；user_ids 只載入指定的用戶
+    # 讀完之前同一條連線不能執行其他查詢
+    user_filter = ""
+    params = [today, today - timedelta(days=30)]
+    if user_ids:
+        user_filter = f"AND users.id IN ({', '.join(['%s'] * len(user_ids))})"
+        params.extend(user_ids)
+    cursor = db.cursor(dictionary=True, buffered=False)
+    try:
+        cursor.execute(f"""
+            SELECT users.id,
+            user_matches.partner_id,
+            user_matches.match_date,
+            COUNT(likes.user_id) as like_count,
+            AVG(mood_entries.mood_score) as mood_score,
+            SUM(CASE WHEN mood_entries.weather = 'sunny' THEN 1 ELSE 0 END) as sunny_count,
+                   SUM(CASE WHEN mood_entries.weather = 'cloudy' THEN 1 ELSE 0 END) as cloudy_count,
+                   SUM(CASE WHEN mood_entries.weather = 'rainy' THEN 1 ELSE 0 END) as rainy_count,
+                   SUM(CASE WHEN mood_entries.weather = 'snowy' THEN 1 ELSE 0 END) as snowy_count,
+                   SUM(CASE WHEN mood_entries.weather = 'windy' THEN 1 ELSE 0 END) as windy_count
+            FROM users
+            LEFT JOIN user_matches ON users.id = user_matches.user_id AND user_matches.match_date = %s
+            LEFT JOIN likes ON likes.user_id = users.id
+            LEFT JOIN mood_entries ON mood_entries.user_id = users.id
+            WHERE mood_entries.date >= %s {user_filter}
+            GROUP BY users.id, user_matches.partner_id, user_matches.match_date
+        """, params)
+        for row in cursor:
+            if row.get('match_date') == today or row.get('partner_id') is not None:
+                continue
+            yield row
+    finally:
+        cursor.close()
+
+
+def mood_scores(row: Dict) -> List[float]:
+    mood_scores_str = row.get('mood_scores') or ''
+    return [float(score) for score in mood_scores_str.split(',') if score]
+
+
+def weather_counts(row: Dict) -> Dict[str, int]:
+    return {weather: row.get(f'{weather}_count') or 0 for weather in WEATHER_TYPES}
+
+
+def load_matching_snapshot(db: mysql.connector.connection.MySQLConnection, today: date,
+                           chunk_size: int = CHUNK_SIZE) -> MatchSnapshot:
+    # 不建立 User 物件，直接從資料列建立配對快照：
+    # 候選人的統計只保留幾個數字，日記每次只載入 chunk_size 位用戶，算完關鍵字與頻率就丟掉
+    candidates = []
+    for row in iter_candidate_rows(db, today):
+        scores = mood_scores(row)
+        candidates.append((row['id'], row.get('like_count') or 0,
+                           sum(scores) / len(scores) if scores else 0.0, weather_counts(row)))
+
+    builder = MatchSnapshotBuilder()
+    for start in range(0, len(candidates), chunk_size):
+        chunk = candidates[start:start + chunk_size]
+        diaries = load_recent_diaries(db, [user_id for user_id, *_ in chunk], DIARIES_PER_USER, chunk_size)
+        for user_id, like_count, avg_mood_score, weather in chunk:
+            entries = diaries.pop(user_id)
+            builder.add(user_id, posting_frequency(entries), like_count, avg_mood_score, weather,
+                        diary_keywords(entries))
+    return builder.build()
@@ -0,0 +1,61 @@
+import json
+from datetime import date, datetime
+from typing import Dict, Optional
+from services.pairing import PAIRING_STRATEGIES
+
+
+# 每日配對工作的 Redis 佇列與狀態 key，HTTP 端只負責排入工作與讀取進度
+MATCHING_JOB_QUEUE = "matching_jobs:queue"
+JOB_STATUS_TTL = 7 * 24 * 3600
+# 離線工作預設的配對方式：在分片算好的 top-K 稀疏圖上配對
+DEFAULT_PAIRING = 'sorted_edge'
+
+
+def job_key(job_id: str) -> str:
+    return f"matching_job:{job_id}"
+
+
+def make_job_id(match_date: date) -> str:
+    # 配對結果以 match_date 為單位，同一天只會有一個工作
+    return match_date.isoformat()
+
+
+async def get_matching_job_status(redis_client, job_id: str) -> Optional[Dict]:
+    status = await redis_client.get(job_key(job_id))
+    return json.loads(status) if status else None
+
+
+async def enqueue_matching_job(redis_client, match_date: date, target_keyword: Optional[str] = None,
+                               pairing: str = DEFAULT_PAIRING, time_budget: Optional[float] = None,
+                               candidate_k: Optional[int] = None) -> Dict:
+    # 參數與 services.pairing.pair_users 相同；不合法時拋出 ValueError，不會排入工作
+    if pairing not in PAIRING_STRATEGIES:
+        raise ValueError(f"未知的配對策略: {pairing}")
+    if candidate_k is not None and candidate_k < 1:
+        raise ValueError("candidate_k 必須大於 0")
+    job_id = make_job_id(match_date)
+    options = {"target_keyword": target_keyword, "pairing": pairing, "time_budget": time_budget, "candidate_k": candidate_k}
+    status = {
+        "job_id": job_id,
+        "status": "queued",
+        "stage": None,
+        "match_date": match_date.isoformat(),
+        **options,
+        "progress": 0.0,
+        "updated_at": datetime.utcnow().isoformat()
+    }
+
+    # NX：同一天的工作已經排入或正在執行時不再重複排入
+    if not await redis_client.set(job_key(job_id), json.dumps(status), nx=True, ex=JOB_STATUS_TTL):
+        existing = await get_matching_job_status(redis_client, job_id)
+        if existing and existing["status"] != "failed":
+            return existing
+        # 失敗的工作可以重新排入，會從檢查點繼續
+        await redis_client.set(job_key(job_id), json.dumps(status), ex=JOB_STATUS_TTL)
+
+    await redis_client.rpush(MATCHING_JOB_QUEUE, json.dumps({
+        "job_id": job_id,
+        "match_date": match_date.isoformat(),
+        **options
+    }))
+    return status
@@ -0,0 +1,150 @@
+import logging
+import multiprocessing
+import time
+import numpy as np
+import networkx as nx
+from typing import List, Optional, Sequence, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+PAIRING_STRATEGIES = ('greedy', 'exact', 'sorted_edge', 'auto')
+
+# exact（blossom）為 O(n^3)，超過這個人數 auto 模式直接使用 sorted_edge
+EXACT_MAX_USERS = 200
+
+
+class PairingResult:
+    def __init__(self, strategy: str, pairs: List[Tuple[int, int]], total_similarity: float, elapsed: float):
+        self.strategy = strategy
+        self.pairs = pairs
+        self.total_similarity = total_similarity
+        self.elapsed = elapsed
+
+    def to_dict(self):
+        return {
+            "strategy": self.strategy,
+            "pair_count": len(self.pairs),
+            "total_similarity": self.total_similarity,
+            "elapsed_seconds": self.elapsed
+        }
+
+
+def total_similarity(engine, pairs: Sequence[Tuple[int, int]]) -> float:
+    if not pairs:
+        return 0.0
+    rows, cols = zip(*pairs)
+    return float(engine.score_pairs(rows, cols, exclude_history=False).sum())
+
+
+def greedy_pairing(engine, candidates: Optional[Sequence[np.ndarray]] = None) -> List[Tuple[int, int]]:
+    # 原本 daily_matching 的配對方式，結果依名單順序而定
+    return engine.greedy_pairs(candidates)
+
+
+def _blossom(n: int, edges: List[Tuple[int, int, float]]) -> List[Tuple[int, int]]:
+    graph = nx.Graph()
+    graph.add_nodes_from(range(n))
+    graph.add_weighted_edges_from(edges)
+    # maxcardinality=True：在讓最多人配對的前提下取總相似度最大
+    matching = nx.max_weight_matching(graph, maxcardinality=True)
+    return sorted((min(a, b), max(a, b)) for a, b in matching)
+
+
+def exact_pairing(engine, time_budget: Optional[float] = None) -> Optional[List[Tuple[int, int]]]:
+    # 完全圖上的最大權重配對（blossom），超過 time_budget 秒回傳 None
+    started = time.monotonic()
+    n = len(engine)
+    edges = []
+    for start, stop, block in engine.iter_blocks():
+        for i in range(start, stop):
+            edges.extend((i, j, float(block[i - start, j])) for j in range(i + 1, n))
+
+    if time_budget is None:
+        return _blossom(n, edges)
+
+    remaining = time_budget - (time.monotonic() - started)
+    if remaining <= 0:
+        logger.warning(f"exact 配對超過時間預算 {time_budget}s，改用 sorted_edge")
+        return None
+
+    # 在獨立的行程中計算，超時可以直接終止
+    # 以 spawn 啟動：呼叫端的行程已有執行緒（連線池、event loop），fork 之後子行程可能卡在被複製的鎖上
+    pool = multiprocessing.get_context('spawn').Pool(1)
+    try:
+        return pool.apply_async(_blossom, (n, edges)).get(timeout=remaining)
+    except multiprocessing.TimeoutError:
+        logger.warning(f"exact 配對超過時間預算 {time_budget}s，改用 sorted_edge")
+        return None
+    finally:
+        pool.terminate()
+
+
+def sorted_edge_pairing(engine, k: int = 10, candidates: Optional[Sequence[np.ndarray]] = None,
+                        top_k: Optional[Tuple[np.ndarray, np.ndarray]] = None) -> List[Tuple[int, int]]:
+    # 在稀疏的 top-K 圖上依邊權重由大到小貪婪配對（1/2 近似），剩下的人再用 greedy 補齊
+    # top_k 可傳入已算好的 (索引, 分數)，例如分片計算後合併的結果
+    n = len(engine)
+    if top_k is not None:
+        indices, scores = top_k
+        rows = np.repeat(np.arange(n, dtype=np.int64), indices.shape[1])
+        cols = indices.ravel()
+        weights = scores.ravel()
+    elif candidates is not None:
+        rows = np.concatenate([np.full(len(found), i, dtype=np.int64) for i, found in enumerate(candidates)] or [np.zeros(0, dtype=np.int64)])
+        cols = np.concatenate([np.asarray(found, dtype=np.int64) for found in candidates] or [np.zeros(0, dtype=np.int64)])
+        weights = engine.score_pairs(rows, cols) if len(rows) else np.zeros(0)
+    else:
+        indices, scores = engine.top_k(k)
+        rows = np.repeat(np.arange(n, dtype=np.int64), indices.shape[1])
+        cols = indices.ravel()
+        weights = scores.ravel()
+
+    # 去除重複的無向邊
+    low, high = np.minimum(rows, cols), np.maximum(rows, cols)
+    keep = low != high
+    low, high, weights = low[keep], high[keep], weights[keep]
+    _, unique = np.unique(low * n + high, return_index=True)
+    low, high, weights = low[unique], high[unique], weights[unique]
+
+    matched = np.zeros(n, dtype=bool)
+    pairs = []
+    for edge in np.argsort(-weights, kind='stable'):
+        a, b = int(low[edge]), int(high[edge])
+        if not matched[a] and not matched[b]:
+            matched[a] = matched[b] = True
+            pairs.append((a, b))
+
+    # top-K 圖裡找不到空位的人，彼此之間再貪婪配對
+    leftover = np.flatnonzero(~matched)
+    while len(leftover) >= 2:
+        i, rest = leftover[-1], leftover[:-1]
+        j = int(rest[np.argmax(engine.score_rows([i], rest)[0])])
+        pairs.append((int(i), j))
+        leftover = rest[rest != j]
+    return pairs
+
+
+def pair_users(engine, strategy: str = 'greedy', candidates: Optional[Sequence[np.ndarray]] = None,
+               k: int = 10, time_budget: Optional[float] = None, exact_max_users: int = EXACT_MAX_USERS,
+               top_k: Optional[Tuple[np.ndarray, np.ndarray]] = None) -> PairingResult:
+    # top_k：已算好的 (索引, 分數)，sorted_edge 直接使用（例如離線工作分片計算的結果）
+    if strategy not in PAIRING_STRATEGIES:
+        raise ValueError(f"未知的配對策略: {strategy}")
+
+    started = time.monotonic()
+    pairs = None
+    used = strategy
+    if strategy == 'auto':
+        used = 'exact' if len(engine) <= exact_max_users else 'sorted_edge'
+
+    if used == 'greedy':
+        pairs = greedy_pairing(engine, candidates)
+    elif used == 'exact':
+        pairs = exact_pairing(engine, time_budget)
+        if pairs is None:
+            used = 'sorted_edge'
+    if used == 'sorted_edge':
+        pairs = sorted_edge_pairing(engine, k, candidates, top_k)
+
+    return PairingResult(used, pairs, total_similarity(engine, pairs), time.monotonic() - started)
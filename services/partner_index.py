@@ -0,0 +1,210 @@
+import asyncio
+import logging
+import zlib
+from contextlib import closing
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Set
+import numpy as np
+from services.availability_queue import AVAILABLE_KEY
+from services.match_snapshot import WEATHER_TYPES
+from services.similarity_engine import KEYWORD_WEIGHT, FREQ_WEIGHT, LIKE_WEIGHT, WEATHER_WEIGHT, MOOD_WEIGHT
+
+
+logger = logging.getLogger(__name__)
+
+# 關鍵字以 crc32 雜湊進固定長度的位元組（各 process 結果一致），以 popcount 估計 Jaccard
+SKETCH_BITS = 1024
+SKETCH_WORDS = SKETCH_BITS // 64
+INITIAL_CAPACITY = 1024
+# 可配對集合（Redis）同步到本機遮罩的間隔；遮罩只是提示，最後仍以 Redis 原子取出為準
+AVAILABILITY_SYNC_SECONDS = 10
+# 啟動時建立索引失敗（例如資料庫暫時連不上）的重試間隔，每次加倍直到上限
+REBUILD_RETRY_SECONDS = 1
+REBUILD_RETRY_MAX_SECONDS = 60
+
+
+def keyword_sketch(keywords: Iterable[str]) -> np.ndarray:
+    bits = 0
+    for keyword in keywords:
+        bits |= 1 << (zlib.crc32(keyword.encode("utf-8")) % SKETCH_BITS)
+    return np.frombuffer(bits.to_bytes(SKETCH_BITS // 8, "little"), dtype="<u8").astype(np.uint64)
+
+
+class PartnerIndex:
+    # 記憶體中的扁平最近鄰索引：每位用戶一欄特徵，查詢時對所有用戶向量化計算
+    # calculate_similarity 的分數（關鍵字部分以 sketch 估計），過濾後取前 k 名
+    # 多維特徵以 (維度, 用戶) 排列，每一維都是連續記憶體，逐維運算比逐列快
+    def __init__(self, capacity: int = INITIAL_CAPACITY):
+        self.rows: Dict[int, int] = {}
+        self._allocate(capacity)
+        self.size = 0
+
+    def _allocate(self, capacity: int):
+        old = getattr(self, "ids", None)
+        arrays = {
+            "ids": np.zeros(capacity, dtype=np.int64),
+            "posting_frequency": np.zeros(capacity),
+            "like_count": np.zeros(capacity),
+            "avg_mood_score": np.zeros(capacity),
+            "weather": np.zeros((len(WEATHER_TYPES), capacity)),
+            "weather_total": np.zeros(capacity),
+            "sketch": np.zeros((SKETCH_WORDS, capacity), dtype=np.uint64),
+            "sketch_count": np.zeros(capacity),
+            "available": np.zeros(capacity, dtype=bool),
+        }
+        if old is not None:
+            for name, array in arrays.items():
+                array[..., :self.size] = getattr(self, name)[..., :self.size]
+        for name, array in arrays.items():
+            setattr(self, name, array)
+        self.capacity = capacity
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self.rows
+
+    def upsert(self, user):
+        # 新用戶附加到尾端，既有用戶就地更新（不需要重建整個索引）
+        row = self.rows.get(user.id)
+        if row is None:
+            if self.size == self.capacity:
+                self._allocate(self.capacity * 2)
+            row = self.size
+            self.size += 1
+            self.rows[user.id] = row
+            self.ids[row] = user.id
+        weather = [user.weather_counts.get(w, 0) for w in WEATHER_TYPES]
+        self.posting_frequency[row] = user.posting_frequency
+        self.like_count[row] = user.like_count
+        self.avg_mood_score[row] = user.avg_mood_score
+        self.weather[:, row] = weather
+        self.weather_total[row] = sum(user.weather_counts.values())
+        sketch = keyword_sketch(user.get_all_keywords())
+        self.sketch[:, row] = sketch
+        self.sketch_count[row] = np.bitwise_count(sketch).sum()
+
+    def set_available(self, user_ids: Iterable[int], available: bool = True):
+        rows = [self.rows[user_id] for user_id in user_ids if user_id in self.rows]
+        self.available[rows] = available
+
+    def sync_available(self, user_ids: Iterable[int]):
+        # 以 Redis 可配對集合的完整內容取代本機遮罩
+        self.available[:] = False
+        self.set_available(user_ids, True)
+
+    def scores(self, user_id: int) -> np.ndarray:
+        # 回傳此用戶與索引中每位用戶（依列順序）的分數
+        i, n = self.rows[user_id], self.size
+        common = np.zeros(n)
+        word = np.empty(n, dtype=np.uint64)
+        for j in range(SKETCH_WORDS):
+            np.bitwise_and(self.sketch[j, :n], self.sketch[j, i], out=word)
+            common += np.bitwise_count(word)
+        union = self.sketch_count[:n] + self.sketch_count[i] - common
+        keyword = np.divide(common, union, out=np.zeros(n), where=union > 0)
+
+        weather_common = np.zeros(n)
+        for j in range(len(WEATHER_TYPES)):
+            weather_common += np.minimum(self.weather[j, :n], self.weather[j, i])
+        weather_total = self.weather_total[:n] + self.weather_total[i]
+        weather = np.divide(weather_common, weather_total, out=np.zeros(n), where=weather_total > 0)
+
+        return (KEYWORD_WEIGHT * keyword
+                + FREQ_WEIGHT / (1 + np.abs(self.posting_frequency[:n] - self.posting_frequency[i]))
+                + LIKE_WEIGHT / (1 + np.abs(self.like_count[:n] - self.like_count[i]))
+                + WEATHER_WEIGHT * weather
+                + MOOD_WEIGHT / (1 + np.abs(self.avg_mood_score[:n] - self.avg_mood_score[i])))
+
+    def best_partners(self, user_id: int, k: int = 5, exclude: Sequence[int] = ()) -> List[int]:
+        # 不可配對、待處理中（已從可配對集合取出）、自己與 exclude 都在查詢內過濾
+        if user_id not in self.rows:
+            return []
+        scores = self.scores(user_id)
+        scores[~self.available[:self.size]] = -np.inf
+        scores[self.rows[user_id]] = -np.inf
+        for other in exclude:
+            row = self.rows.get(other)
+            if row is not None:
+                scores[row] = -np.inf
+        k = min(k, self.size)
+        top = np.argpartition(-scores, k - 1)[:k] if k < self.size else np.arange(self.size)
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return self.ids[top[np.isfinite(scores[top])]].tolist()
+
+
+class PartnerIndexUpdater:
+    # 背景工作：啟動時建立索引、定期同步可配對遮罩；用戶資料變動時增量更新該用戶
+    def __init__(self, index: PartnerIndex, redis_client, pool, load_users: Callable):
+        self.index = index
+        self.redis_client = redis_client
+        self.pool = pool
+        self.load_users = load_users
+        self.ready = False
+        self._task: Optional[asyncio.Task] = None
+        self._refreshes: Set[asyncio.Task] = set()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        for task in [self._task, *self._refreshes]:
+            if task is None:
+                continue
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+        self._refreshes.clear()
+
+    def _load(self, user_ids: Optional[List[int]] = None):
+        with closing(self.pool.get_connection()) as db:
+            return self.load_users(db, user_ids)
+
+    async def rebuild(self):
+        for user in await asyncio.to_thread(self._load):
+            self.index.upsert(user)
+        await self.sync_available()
+        self.ready = True
+        logger.info(f"配對索引已建立：{len(self.index)} 位用戶")
+
+    async def refresh_users(self, *user_ids: int):
+        # 只重新載入這幾位用戶的特徵，索引未就緒時略過（建立時會讀到最新資料）
+        if not self.ready or not user_ids:
+            return
+        try:
+            for user in await asyncio.to_thread(self._load, list(user_ids)):
+                self.index.upsert(user)
+        except Exception as e:
+            logger.error(f"更新配對索引失敗: {str(e)}")
+
+    def schedule_refresh(self, *user_ids: int):
+        if not self.ready:
+            return
+        task = asyncio.create_task(self.refresh_users(*user_ids))
+        self._refreshes.add(task)
+        task.add_done_callback(self._refreshes.discard)
+
+    async def sync_available(self):
+        members = await self.redis_client.zrange(AVAILABLE_KEY, 0, -1)
+        self.index.sync_available(int(member) for member in members)
+
+    async def _run(self):
+        # 索引就緒前 schedule_refresh 不做事，request_exchange 只能退回 Redis 取人，所以失敗時要一直重試
+        delay = REBUILD_RETRY_SECONDS
+        while not self.ready:
+            try:
+                await self.rebuild()
+            except Exception as e:
+                logger.error(f"建立配對索引失敗，{delay} 秒後重試: {str(e)}", exc_info=True)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, REBUILD_RETRY_MAX_SECONDS)
+        while True:
+            await asyncio.sleep(AVAILABILITY_SYNC_SECONDS)
+            try:
+                await self.sync_available()
+            except Exception as e:
+                logger.error(f"同步可配對用戶失敗: {str(e)}")
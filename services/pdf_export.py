@@ -0,0 +1,206 @@
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
+from typing import Dict, Iterator, List, Optional, Set
+from xml.sax.saxutils import escape
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.cidfonts import UnicodeCIDFont
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph
+from services.diary_export import export_query, iter_batches
+
+
+logger = logging.getLogger(__name__)
+
+# PDF 在獨立的行程池中產生，不佔用 event loop；字型與樣式在每個行程啟動時只初始化一次
+PDF_EXPORT_DIR = os.getenv("PDF_EXPORT_DIR", "/tmp/pdf_exports")
+PDF_EXPORT_WORKERS = int(os.getenv("PDF_EXPORT_WORKERS", "2"))
+PDF_JOB_TTL = 3600
+# 超過這段時間仍停在 pending/rendering 的工作視為失敗（負責的 worker 可能已重啟，工作不會再完成）
+PDF_JOB_TIMEOUT = int(os.getenv("PDF_JOB_TIMEOUT", "300"))
+# 每張表格的列數：表格逐批加入文件，不需要一次持有整份歷史的 flowable
+ROWS_PER_TABLE = 50
+
+PAGE_WIDTH = letter[0]
+COL_WIDTHS = [PAGE_WIDTH * 0.25, PAGE_WIDTH * 0.75]  # 25% 給日期，75% 給內容
+TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+    ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, 0), 14),
+    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+    ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+    ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
+    ('FONTNAME', (0, 1), (-1, -1), 'STSong-Light'),
+    ('FONTSIZE', (0, 1), (-1, -1), 12),
+    ('TOPPADDING', (0, 1), (-1, -1), 6),
+    ('BOTTOMPADDING', (0, 1), (-1, -1), 6),
+    ('GRID', (0, 0), (-1, -1), 1, colors.black),
+    ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+])
+
+_styles = None
+
+
+def _init_worker():
+    global _styles
+    pdfmetrics.registerFont(UnicodeCIDFont("STSong-Light"))
+    styles = getSampleStyleSheet()
+    styles.add(ParagraphStyle(name='Chinese', fontName='STSong-Light', fontSize=12))
+    _styles = styles
+
+
+def _warm() -> int:
+    return os.getpid()
+
+
+class _FlowableStream(list):
+    # build() 處理每個 flowable 前都會檢查 len()，清單用完時才從產生器補下一批
+    # 依賴 reportlab 的內部實作：BaseDocTemplate.build 以 while len(flowables) 迴圈從清單開頭逐一取出處理，
+    # 而不是先複製清單或只在開始時取一次長度；升級 reportlab 時要確認 test_render_pdf_streams_tables 仍通過
+    def __init__(self, batches: Iterator[List]):
+        super().__init__()
+        self._batches = batches
+
+    def __len__(self) -> int:
+        if not list.__len__(self):
+            self.extend(next(self._batches, []))
+        return list.__len__(self)
+
+
+def _read_spool(spool_path: str) -> Iterator[List[Dict]]:
+    batch = []
+    with open(spool_path, encoding="utf-8") as f:
+        for line in f:
+            batch.append(json.loads(line))
+            if len(batch) == ROWS_PER_TABLE:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+def _flowables(spool_path: str) -> Iterator[List]:
+    yield [Paragraph("My Mood Diary", _styles['Title'])]
+    for rows in _read_spool(spool_path):
+        data = [['Date', 'Content']]
+        data.extend([row['date'], Paragraph(escape(row['content'] or ""), _styles['Chinese'])] for row in rows)
+        # repeatRows：跨頁時每頁都有標題列
+        yield [Table(data, colWidths=COL_WIDTHS, style=TABLE_STYLE, repeatRows=1)]
+
+
+def render_pdf(spool_path: str, out_path: str) -> str:
+    if _styles is None:
+        _init_worker()
+    tmp_path = f"{out_path}.tmp"
+    SimpleDocTemplate(tmp_path, pagesize=letter).build(_FlowableStream(_flowables(spool_path)))
+    os.replace(tmp_path, out_path)
+    return out_path
+
+
+def pdf_job_key(job_id: str) -> str:
+    return f"pdf_export:{job_id}"
+
+
+class PdfExporter:
+    # HTTP 端建立工作並回傳 job id；日記先以未緩衝的 cursor 寫入暫存檔，再交給行程池產生 PDF
+    # 狀態存在 Redis，檔案放在同一台機器共用的目錄，任何 worker 都能回應下載
+    def __init__(self, redis_client, database, workers: int = PDF_EXPORT_WORKERS, export_dir: str = PDF_EXPORT_DIR):
+        self.redis_client = redis_client
+        self.database = database
+        self.workers = workers
+        self.export_dir = export_dir
+        self.executor: Optional[ProcessPoolExecutor] = None
+        self._jobs: Set[asyncio.Task] = set()
+
+    async def start(self):
+        if self.executor is not None:
+            return
+        os.makedirs(self.export_dir, exist_ok=True)
+        # spawn：不複製 web 行程的連線與執行緒
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                            mp_context=multiprocessing.get_context("spawn"))
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*[loop.run_in_executor(self.executor, _warm) for _ in range(self.workers)])
+
+    async def stop(self):
+        for task in list(self._jobs):
+            task.cancel()
+        await asyncio.gather(*self._jobs, return_exceptions=True)
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+    def file_path(self, job_id: str) -> str:
+        return os.path.join(self.export_dir, f"{job_id}.pdf")
+
+    async def _set_status(self, status: Dict):
+        status["updated_at"] = datetime.utcnow().isoformat()
+        await self.redis_client.set(pdf_job_key(status["job_id"]), json.dumps(status), ex=PDF_JOB_TTL)
+
+    async def get_status(self, job_id: str, user_id: int) -> Optional[Dict]:
+        status = await self.redis_client.get(pdf_job_key(job_id))
+        if not status:
+            return None
+        status = json.loads(status)
+        if status["user_id"] != user_id:
+            return None
+        if status["status"] in ("pending", "rendering"):
+            age = (datetime.utcnow() - datetime.fromisoformat(status["updated_at"])).total_seconds()
+            if age > PDF_JOB_TIMEOUT:
+                status.update(status="failed", error="PDF 匯出逾時，請重新匯出")
+                await self._set_status(status)
+        return status
+
+    async def submit(self, user_id: int, start: Optional[date] = None, end: Optional[date] = None) -> Dict:
+        if self.executor is None:
+            await self.start()
+        status = {"job_id": uuid.uuid4().hex, "user_id": user_id, "status": "pending"}
+        await self._set_status(status)
+        task = asyncio.create_task(self._run(status, start, end))
+        self._jobs.add(task)
+        task.add_done_callback(self._jobs.discard)
+        return status
+
+    async def _run(self, status: Dict, start: Optional[date], end: Optional[date]):
+        spool_path = os.path.join(self.export_dir, f"{status['job_id']}.ndjson")
+        try:
+            await asyncio.to_thread(self._remove_expired)
+            query, params = export_query(status["user_id"], start, end)
+            with open(spool_path, "w", encoding="utf-8") as spool:
+                async for rows in iter_batches(self.database, query, params):
+                    spool.write("".join(json.dumps(row, ensure_ascii=False) + "\n" for row in rows))
+            status["status"] = "rendering"
+            await self._set_status(status)
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(self.executor, render_pdf, spool_path, self.file_path(status["job_id"]))
+            status["status"] = "done"
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"PDF 匯出失敗: {str(e)}", exc_info=True)
+            status.update(status="failed", error=str(e))
+        finally:
+            if os.path.exists(spool_path):
+                os.remove(spool_path)
+        await self._set_status(status)
+
+    def _remove_expired(self):
+        # 狀態過期後檔案也不會再被下載
+        cutoff = time.time() - PDF_JOB_TTL
+        for name in os.listdir(self.export_dir):
+            path = os.path.join(self.export_dir, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except FileNotFoundError:
+                pass
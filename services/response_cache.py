@@ -0,0 +1,23 @@
+from typing import Dict, List, Union
+from fastapi import Response
+from pydantic import TypeAdapter
+from models.diary import DiaryEntryResponse
+
+
+# 快取存的是回應本身的 JSON：命中時原樣送出，不再 json.loads、逐欄驗證與重新編碼
+# 未命中時整批驗證一次、序列化一次，寫入快取的就是回應內容
+DIARY_ENTRY_ADAPTER = TypeAdapter(DiaryEntryResponse)
+DIARY_LIST_ADAPTER = TypeAdapter(List[DiaryEntryResponse])
+
+
+def dump_entry(entry: Dict) -> bytes:
+    return DIARY_ENTRY_ADAPTER.dump_json(DIARY_ENTRY_ADAPTER.validate_python(entry))
+
+
+def dump_entries(entries: List[Dict]) -> bytes:
+    return DIARY_LIST_ADAPTER.dump_json(DIARY_LIST_ADAPTER.validate_python(entries))
+
+
+def json_response(body: Union[bytes, str]) -> Response:
+    # 直接回傳 Response，FastAPI 不會再套用 response_model
+    return Response(content=body, media_type="application/json")
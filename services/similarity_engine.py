@@ -0,0 +1,178 @@
+import numpy as np
+from scipy import sparse
+from typing import Iterator, List, Optional, Sequence, Tuple
+from services.match_snapshot import MatchSnapshot
+from services.match_history import EXCLUDED_SCORE, PartnerHistory
+
+
+# calculate_similarity 的權重
+KEYWORD_WEIGHT = 0.25
+FREQ_WEIGHT = 0.20
+LIKE_WEIGHT = 0.15
+WEATHER_WEIGHT = 0.20
+MOOD_WEIGHT = 0.20
+
+TARGET_KEYWORD_BOOST = 3
+
+
+class SimilarityEngine:
+    # 一次把所有用戶編碼成 NumPy 陣列，之後以矩陣運算分塊計算 calculate_similarity
+    def __init__(self, users: Sequence, target_keyword: Optional[str] = None, block_size: int = 128):
+        self.users = list(users)
+        self._load(MatchSnapshot.from_users(self.users), target_keyword, block_size)
+
+    @classmethod
+    def from_snapshot(cls, snapshot: MatchSnapshot, target_keyword: Optional[str] = None, block_size: int = 128) -> "SimilarityEngine":
+        # 直接使用快照（可以是 mmap 載入的）的欄位，不需要 User 物件
+        engine = cls.__new__(cls)
+        engine.users = None
+        engine._load(snapshot, target_keyword, block_size)
+        return engine
+
+    def _load(self, snapshot: MatchSnapshot, target_keyword: Optional[str], block_size: int):
+        self.snapshot = snapshot
+        self.target_keyword = target_keyword
+        self.block_size = block_size
+        self.history: Optional[PartnerHistory] = None
+        n = len(snapshot)
+
+        self.ids = snapshot.ids
+        self.posting_frequency = snapshot.posting_frequency
+        self.like_count = snapshot.like_count.astype(np.float64)
+        self.avg_mood_score = snapshot.avg_mood_score
+        self.weather_types = snapshot.weather_types
+        self.weather = snapshot.weather
+        self.weather_total = self.weather.sum(axis=1, dtype=np.int64)
+
+        # 關鍵字稀疏矩陣（每個用戶只斷詞一次）
+        vocab_size = len(snapshot.vocabulary)
+        self.keywords = sparse.csr_matrix(
+            (np.ones(len(snapshot.keyword_indices), dtype=np.float64), snapshot.keyword_indices, snapshot.keyword_indptr),
+            shape=(n, vocab_size)
+        )
+
+        weights = np.ones(vocab_size, dtype=np.float64)
+        target_id = snapshot.keyword_id(target_keyword) if target_keyword is not None else None
+        if target_id is not None:
+            weights[target_id] = TARGET_KEYWORD_BOOST
+        self.keyword_weights = weights
+        self.keyword_weight_sum = self.keywords @ weights
+        # 轉置後的加權矩陣，K[rows] @ 它 = 加權共同關鍵字
+        self._weighted_keywords = sparse.csr_matrix(self.keywords.multiply(weights))
+        self._weighted_keywords_t = self._weighted_keywords.T.tocsr()
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def exclude_pairs(self, user_a, user_b):
+        # 冷卻期內配對過的用戶（以用戶 id 表示），之後的計分都以 EXCLUDED_SCORE 取代
+        self.history = PartnerHistory(self.ids, user_a, user_b)
+        return self
+
+    def score_rows(self, rows, cols=None) -> np.ndarray:
+        rows = np.atleast_1d(np.asarray(rows, dtype=np.int64))
+        # 加權共同關鍵字：(len(rows), len(cols)) 的矩陣
+        if cols is None:
+            common = (self.keywords[rows] @ self._weighted_keywords_t).toarray()
+            scores = self._combine(rows[:, None], slice(None), common)
+            if self.history is not None and self.history.pairs:
+                for k, row in enumerate(rows):
+                    scores[k, self.history.partners(row)] = EXCLUDED_SCORE
+            return scores
+        cols = np.atleast_1d(np.asarray(cols, dtype=np.int64))
+        common = (self.keywords[rows] @ self._weighted_keywords[cols].T).toarray()
+        scores = self._combine(rows[:, None], cols[None, :], common)
+        if self.history is not None and self.history.pairs:
+            scores[self.history.excluded(rows[:, None], cols[None, :])] = EXCLUDED_SCORE
+        return scores
+
+    def score_pairs(self, rows, cols, exclude_history: bool = True) -> np.ndarray:
+        # 逐對計算 (rows[k], cols[k]) 的相似度；exclude_history=False 時回傳原始分數（統計用）
+        rows = np.atleast_1d(np.asarray(rows, dtype=np.int64))
+        cols = np.atleast_1d(np.asarray(cols, dtype=np.int64))
+        common = np.asarray(self.keywords[rows].multiply(self._weighted_keywords[cols]).sum(axis=1), dtype=np.float64).ravel()
+        scores = self._combine(rows, cols, common)
+        if exclude_history and self.history is not None and self.history.pairs:
+            scores[self.history.excluded(rows, cols)] = EXCLUDED_SCORE
+        return scores
+
+    def _combine(self, r, c, common: np.ndarray) -> np.ndarray:
+        # r、c 為可互相廣播的索引，運算順序與 calculate_similarity 相同以得到一致的浮點結果
+        # 關鍵字相似度：加權交集 / 加權聯集
+        union = self.keyword_weight_sum[r] + self.keyword_weight_sum[c] - common
+        keyword_similarity = np.divide(common, union, out=np.zeros_like(common), where=union > 0)
+
+        # 發文頻率、點讚數、心情分數相似度
+        freq_similarity = 1 / (1 + np.abs(self.posting_frequency[r] - self.posting_frequency[c]))
+        like_similarity = 1 / (np.abs(self.like_count[r] - self.like_count[c]) + 1)
+        mood_similarity = 1 / (np.abs(self.avg_mood_score[r] - self.avg_mood_score[c]) + 1)
+
+        # 天氣偏好相似度：逐欄累加避免 (rows, n, W) 的大陣列
+        weather_common = np.zeros_like(common)
+        for col in range(self.weather.shape[1]):
+            weather_common += np.minimum(self.weather[r, col], self.weather[c, col])
+        weather_total = self.weather_total[r] + self.weather_total[c]
+        weather_similarity = np.divide(weather_common, weather_total, out=np.zeros_like(common), where=weather_total > 0)
+
+        return (
+            KEYWORD_WEIGHT * keyword_similarity +
+            FREQ_WEIGHT * freq_similarity +
+            LIKE_WEIGHT * like_similarity +
+            WEATHER_WEIGHT * weather_similarity +
+            MOOD_WEIGHT * mood_similarity
+        )
+
+    def score(self, i: int, j: int) -> float:
+        return float(self.score_rows([i], [j])[0, 0])
+
+    def iter_blocks(self, start: int = 0, stop: Optional[int] = None) -> Iterator[Tuple[int, int, np.ndarray]]:
+        stop = len(self) if stop is None else min(stop, len(self))
+        for block_start in range(start, stop, self.block_size):
+            block_stop = min(block_start + self.block_size, stop)
+            yield block_start, block_stop, self.score_rows(np.arange(block_start, block_stop))
+
+    def top_k(self, k: int, start: int = 0, stop: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        # [start, stop) 每位用戶分數最高的 k 個對象（不含自己），回傳 (索引, 分數)，每列依分數遞減
+        n = len(self)
+        stop = n if stop is None else min(stop, n)
+        k = max(0, min(k, n - 1))
+        indices = np.zeros((stop - start, k), dtype=np.int64)
+        scores = np.zeros((stop - start, k), dtype=np.float64)
+        if k == 0:
+            return indices, scores
+        for block_start, block_stop, block in self.iter_blocks(start, stop):
+            block[np.arange(block_stop - block_start), np.arange(block_start, block_stop)] = -np.inf
+            top = np.argpartition(-block, k - 1, axis=1)[:, :k]
+            top_scores = np.take_along_axis(block, top, axis=1)
+            order = np.argsort(-top_scores, axis=1, kind='stable')
+            indices[block_start - start:block_stop - start] = np.take_along_axis(top, order, axis=1)
+            scores[block_start - start:block_stop - start] = np.take_along_axis(top_scores, order, axis=1)
+        return indices, scores
+
+    def greedy_pairs(self, candidates: Optional[Sequence[np.ndarray]] = None) -> List[Tuple[int, int]]:
+        # 與原本 daily_matching 的迴圈相同：取出最後一位，配對剩餘名單中第一個最高分的用戶
+        # 有 candidates（例如 KeywordLSH.top_k_candidates）時只計算候選鄰居，候選都已配對才退回整列
+        n = len(self)
+        alive = np.ones(n, dtype=bool)
+        remaining = n
+        last = n - 1
+        pairs = []
+        while remaining >= 2:
+            while not alive[last]:
+                last -= 1
+            i = last
+            alive[i] = False
+            j = None
+            if candidates is not None:
+                neighbours = np.sort(candidates[i])
+                neighbours = neighbours[alive[neighbours]]
+                if len(neighbours):
+                    j = int(neighbours[np.argmax(self.score_rows([i], neighbours)[0])])
+            if j is None:
+                scores = self.score_rows([i])[0]
+                scores[~alive] = -np.inf
+                j = int(np.argmax(scores))
+            alive[j] = False
+            remaining -= 2
+            pairs.append((i, j))
+        return pairs
@@ -0,0 +1,72 @@
+import re
+from functools import lru_cache
+from typing import FrozenSet, Iterable
+
+
+# 英文詞（可含撇號）與 CJK 連續字串（漢字、假名、韓文）分開處理
+_TOKEN = re.compile(r"[a-z][a-z0-9']*|[㐀-䶿一-鿿豈-﫿぀-ヿ가-힯]+")
+_CJK = re.compile(r"[㐀-䶿一-鿿豈-﫿぀-ヿ가-힯]")
+
+MIN_LATIN_LENGTH = 3
+
+ENGLISH_STOPWORDS = frozenset("""
+a about above after again against all also am an and any are aren't as at be because been before being below
+between both but by can can't cannot could couldn't did didn't do does doesn't doing don't down during each
+even ever every few for from further get gets got had hadn't has hasn't have haven't having he he'd he'll he's
+her here here's hers herself him himself his how how's however i i'd i'll i'm i've if in into is isn't it it's
+its itself just let's like made make many may me might more most much must mustn't my myself never no nor not
+now of off often on once one only or other ought our ours ourselves out over own really same shall shan't she
+she'd she'll she's should shouldn't since so some still such than that that's the their theirs them themselves
+then there there's these they they'd they'll they're they've this those though through thus to too under until
+up upon us very was wasn't we we'd we'll we're we've were weren't what what's when when's where where's which
+while who who's whom why why's will with won't would wouldn't yet you you'd you'll you're you've your yours
+yourself yourselves
+""".split())
+
+# 虛詞單字：把 CJK 字串在這些字切開，剩下的片段再切成雙字詞（繁簡皆列）
+CJK_STOP_CHARS = frozenset("的了是在和與与或及而也就都很著着跟把被給给讓让從从嗎吗呢吧啊呀喔哦嗯啦囉我你妳他她它們们這这那個个")
+
+# 切完後仍然太常見、沒有辨識度的雙字詞
+CJK_STOP_BIGRAMS = frozenset("""
+今天 明天 昨天 自己 因為 因为 所以 但是 可是 還是 还是 然後 然后 覺得 觉得 什麼 什么 怎麼 怎么 為什 为什 沒有 没有
+已經 已经 可以 不是 真的 知道 一個 一个 一些 一樣 一样 一直 一下 如果 雖然 虽然 其實 其实 時候 时候 現在 现在 大家 有點 有点
+""".split())
+
+
+def _cjk_bigrams(run: str) -> Iterable[str]:
+    segment = []
+    for char in run + "的":
+        if char in CJK_STOP_CHARS:
+            for i in range(len(segment) - 1):
+                bigram = segment[i] + segment[i + 1]
+                if bigram not in CJK_STOP_BIGRAMS:
+                    yield bigram
+            segment = []
+        else:
+            segment.append(char)
+
+
+def tokenize(text: str) -> FrozenSet[str]:
+    # 英文：小寫、去掉停用詞與過短的詞；中日韓：去掉虛詞後取相鄰雙字（不需要字典）
+    keywords = set()
+    for token in _TOKEN.findall((text or "").lower()):
+        if _CJK.match(token):
+            keywords.update(_cjk_bigrams(token))
+        else:
+            token = token.strip("'")
+            if len(token) >= MIN_LATIN_LENGTH and token not in ENGLISH_STOPWORDS:
+                keywords.add(token)
+    return frozenset(keywords)
+
+
+# 同一篇內容只斷詞一次（例如尚未回填關鍵字的舊日記）
+extract_keywords = lru_cache(maxsize=8192)(tokenize)
+
+
+def serialize_keywords(keywords: Iterable[str]) -> str:
+    # 關鍵字本身不含空白，以空白分隔存進 diary_entries.keywords
+    return " ".join(sorted(keywords))
+
+
+def parse_keywords(text: str) -> FrozenSet[str]:
+    return frozenset(text.split()) if text else frozenset()
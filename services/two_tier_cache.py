@@ -0,0 +1,213 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+from services.ws_broker import make_worker_id
+
+
+logger = logging.getLogger(__name__)
+
+# 第一層：每個 worker 自己的 LRU（有 TTL 與大小上限），命中時不需要 Redis 來回與 JSON 解碼
+# 第二層：Redis，所有 worker 共用
+# 寫入或失效時在頻道上廣播鍵名，其他 worker 清掉自己的副本；訊息遺失時最多舊 LOCAL_TTL 秒
+INVALIDATION_CHANNEL = "cache_invalidate"
+LOCAL_TTL = int(os.getenv("LOCAL_CACHE_TTL", "30"))
+LOCAL_MAX_ENTRIES = int(os.getenv("LOCAL_CACHE_MAX_ENTRIES", "10000"))
+LOCAL_MAX_BYTES = int(os.getenv("LOCAL_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+
+
+class LocalCache:
+    # 以 Redis 中 JSON 的長度估算每筆大小；超過筆數或位元組上限時淘汰最久沒用到的
+    def __init__(self, max_entries: int = LOCAL_MAX_ENTRIES, max_bytes: int = LOCAL_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.evictions = 0
+        self._items: "OrderedDict[str, Tuple[float, Any, int]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def get(self, key: str, now: Optional[float] = None) -> Tuple[bool, Any]:
+        item = self._items.get(key)
+        if item is None:
+            return False, None
+        expires_at, value, _ = item
+        if expires_at <= (now if now is not None else time.monotonic()):
+            self.delete(key)
+            return False, None
+        self._items.move_to_end(key)
+        return True, value
+
+    def set(self, key: str, value: Any, size: int, ttl: float, now: Optional[float] = None):
+        self.delete(key)
+        if size > self.max_bytes:
+            return
+        self._items[key] = ((now if now is not None else time.monotonic()) + ttl, value, size)
+        self.bytes += size
+        while len(self._items) > self.max_entries or self.bytes > self.max_bytes:
+            _, (_, _, evicted_size) = self._items.popitem(last=False)
+            self.bytes -= evicted_size
+            self.evictions += 1
+
+    def delete(self, key: str):
+        item = self._items.pop(key, None)
+        if item is not None:
+            self.bytes -= item[2]
+
+    def clear(self):
+        self._items.clear()
+        self.bytes = 0
+
+
+class TwoTierCache:
+    # 值以 JSON 存在 Redis；本地層存解碼後的物件，呼叫端不可修改取回的值
+    def __init__(self, redis_client, channel: str = INVALIDATION_CHANNEL, local_ttl: float = LOCAL_TTL,
+                 max_entries: int = LOCAL_MAX_ENTRIES, max_bytes: int = LOCAL_MAX_BYTES,
+                 worker_id: Optional[str] = None):
+        self.redis_client = redis_client
+        self.channel = channel
+        self.local_ttl = local_ttl
+        self.local = LocalCache(max_entries, max_bytes)
+        self.worker_id = worker_id or make_worker_id()
+        self.counters = {
+            "local_hits": 0,
+            "local_misses": 0,
+            "redis_hits": 0,
+            "redis_misses": 0,
+            "invalidations_sent": 0,
+            "invalidations_received": 0
+        }
+        self._pubsub = None
+        self._listener: Optional[asyncio.Task] = None
+
+    async def start(self):
+        if self._listener is not None:
+            return
+        self._pubsub = self.redis_client.pubsub()
+        await self._pubsub.subscribe(self.channel)
+        self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+        if self._pubsub is not None:
+            await self._pubsub.unsubscribe()
+            await self._pubsub.aclose()
+            self._pubsub = None
+        self.local.clear()
+
+    async def get(self, key: str, raw: bool = False) -> Optional[Any]:
+        # raw=True：取回（本地層也保存）未解碼的 JSON 字串，可直接作為回應內容
+        found, value = self.local.get(key)
+        if found:
+            self.counters["local_hits"] += 1
+            return value
+        self.counters["local_misses"] += 1
+
+        async with self.redis_client.pipeline(transaction=False) as pipe:
+            pipe.get(key)
+            pipe.ttl(key)
+            body, redis_ttl = await pipe.execute()
+        if body is None:
+            self.counters["redis_misses"] += 1
+            return None
+        self.counters["redis_hits"] += 1
+        value = body if raw else json.loads(body)
+        self.local.set(key, value, len(body), self._local_ttl(redis_ttl))
+        return value
+
+    async def set(self, key: str, value: Any, ttl: int, raw: bool = False):
+        # raw=True：value 已經是序列化好的 JSON（str 或 bytes）
+        body = value if raw else json.dumps(value)
+        await self.redis_client.set(key, body, ex=ttl)
+        self.local.set(key, value, len(body), self._local_ttl(ttl))
+        # 其他 worker 可能還留著舊值
+        await self._publish(key)
+
+    async def get_many(self, keys: List[str]) -> List[Optional[Any]]:
+        # 本地層沒有的鍵以一次 MGET 取回；MGET 不帶 TTL，本地副本只保留 local_ttl 秒
+        values: List[Optional[Any]] = [None] * len(keys)
+        remote = []
+        for i, key in enumerate(keys):
+            found, value = self.local.get(key)
+            if found:
+                self.counters["local_hits"] += 1
+                values[i] = value
+            else:
+                self.counters["local_misses"] += 1
+                remote.append(i)
+        if not remote:
+            return values
+        for i, body in zip(remote, await self.redis_client.mget([keys[i] for i in remote])):
+            if body is None:
+                self.counters["redis_misses"] += 1
+                continue
+            self.counters["redis_hits"] += 1
+            values[i] = json.loads(body)
+            self.local.set(keys[i], values[i], len(body), self.local_ttl)
+        return values
+
+    async def set_many(self, items: Dict[str, Any], ttl: int):
+        # 一次 pipeline 寫回，只廣播一則失效訊息
+        if not items:
+            return
+        async with self.redis_client.pipeline(transaction=False) as pipe:
+            for key, value in items.items():
+                body = json.dumps(value)
+                pipe.set(key, body, ex=ttl)
+                self.local.set(key, value, len(body), self._local_ttl(ttl))
+            await pipe.execute()
+        await self._publish(*items)
+
+    async def invalidate(self, *keys: str):
+        if not keys:
+            return
+        for key in keys:
+            self.local.delete(key)
+        await self.redis_client.delete(*keys)
+        await self._publish(*keys)
+
+    def _local_ttl(self, redis_ttl: int) -> float:
+        # 本地副本不會比 Redis 中的值活得更久
+        return min(self.local_ttl, redis_ttl) if redis_ttl and redis_ttl > 0 else self.local_ttl
+
+    async def _publish(self, *keys: str):
+        self.counters["invalidations_sent"] += 1
+        await self.redis_client.publish(self.channel, json.dumps({"origin": self.worker_id, "keys": keys}))
+
+    async def _listen(self):
+        while True:
+            try:
+                message = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                if message is None:
+                    continue
+                data = json.loads(message["data"])
+                if data["origin"] == self.worker_id:
+                    continue
+                self.counters["invalidations_received"] += 1
+                for key in data["keys"]:
+                    self.local.delete(key)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"處理快取失效訊息失敗: {str(e)}")
+                # 可能漏掉訊息，清空本地層避免讀到舊值
+                self.local.clear()
+                await asyncio.sleep(1)
+
+    def stats(self) -> Dict:
+        return {
+            **self.counters,
+            "local_entries": len(self.local),
+            "local_bytes": self.local.bytes,
+            "local_evictions": self.local.evictions
+        }
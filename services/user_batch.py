@@ -0,0 +1,74 @@
+from typing import Callable, Dict, List, Optional
+
+
+# 一次查詢多位用戶的頭像／個人資料：先查快取（一次 MGET），未命中的以一個 IN 查詢補齊，再以 pipeline 寫回
+# 快取鍵與內容和單筆的端點相同，兩邊互相共用
+MAX_BATCH_IDS = 300
+AVATAR_COLUMNS = ("avatar_url",)
+PROFILE_COLUMNS = ("avatar_url", "self_intro")
+AVATAR_CACHE_TTL = 3600
+PROFILE_CACHE_TTL = 300
+
+
+def avatar_key(user_id: int) -> str:
+    return f"user_avatar:{user_id}"
+
+
+def profile_key(user_id: int) -> str:
+    return f"user_profile:{user_id}"
+
+
+def parse_ids(raw: str, limit: int = MAX_BATCH_IDS) -> List[int]:
+    # "3,1,3" -> [3, 1]：去除重複並保留順序；格式錯誤或超過上限時拋出 ValueError
+    ids = list(dict.fromkeys(int(part) for part in raw.split(",") if part.strip()))
+    if not ids:
+        raise ValueError("沒有提供用戶 ID")
+    if len(ids) > limit:
+        raise ValueError(f"一次最多查詢 {limit} 位用戶")
+    return ids
+
+
+async def load_users_batch(cache, db, user_ids: List[int], columns: tuple,
+                           key_for: Callable[[int], str], ttl: int) -> Dict[int, Optional[Dict]]:
+    # 回傳 {user_id: 欄位}，找不到的用戶為 None
+    keys = [key_for(user_id) for user_id in user_ids]
+    result = dict(zip(user_ids, await cache.get_many(keys)))
+    misses = [user_id for user_id, value in result.items() if value is None]
+    if not misses:
+        return result
+
+    async with db.cursor(dictionary=True) as cursor:
+        await cursor.execute(
+            f"SELECT id, {', '.join(columns)} FROM users WHERE id IN ({', '.join(['%s'] * len(misses))})",
+            misses
+        )
+        rows = await cursor.fetchall()
+
+    backfill = {}
+    for row in rows:
+        user_id = row.pop('id')
+        result[user_id] = row
+        backfill[key_for(user_id)] = row
+    await cache.set_many(backfill, ttl)
+    return result
+
+
+async def forbidden_profile_ids(db, viewer_id: int, user_ids: List[int]) -> List[int]:
+    # 個人資料（self_intro）只有本人與目前配對中的夥伴能看，條件與 get_partner_info 相同
+    others = [user_id for user_id in user_ids if user_id != viewer_id]
+    if not others:
+        return []
+    async with db.cursor(dictionary=True) as cursor:
+        await cursor.execute("""
+            SELECT um.partner_id
+            FROM user_matches um
+            JOIN users u1 ON um.user_id = u1.id
+            JOIN users u2 ON um.partner_id = u2.id
+            WHERE um.user_id = %s AND um.status = 'accepted'
+            AND u1.is_matching = 1 AND u2.is_matching = 1
+            ORDER BY um.created_at DESC
+            LIMIT 1
+        """, (viewer_id,))
+        match = await cursor.fetchone()
+    partner_id = match['partner_id'] if match else None
+    return [user_id for user_id in others if user_id != partner_id]
@@ -0,0 +1,155 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+import uuid
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+# 用戶連在哪個 worker：ws_presence:{user_id} -> worker_id，由持有連線的 worker 定期續期
+PRESENCE_TTL = 90
+PRESENCE_REFRESH_INTERVAL = 30
+# 每個 worker 訂閱自己的頻道，其他 worker 把訊息批次轉送過來
+BATCH_INTERVAL = 0.01
+MAX_BATCH_SIZE = 200
+
+# 只有仍屬於自己的 presence 才刪除，避免用戶已重連到別的 worker 時被誤刪
+_RELEASE_PRESENCE = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def presence_key(user_id: int) -> str:
+    return f"ws_presence:{user_id}"
+
+
+def worker_channel(worker_id: str) -> str:
+    return f"ws_worker:{worker_id}"
+
+
+def make_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class WebSocketBroker:
+    # 多個 uvicorn worker / 節點之間轉送 WebSocket 訊息
+    def __init__(self, redis_client, deliver: Callable[[int, str], Awaitable[bool]],
+                 worker_id: Optional[str] = None,
+                 batch_interval: float = BATCH_INTERVAL,
+                 max_batch_size: int = MAX_BATCH_SIZE):
+        self.redis_client = redis_client
+        self.deliver = deliver
+        self.worker_id = worker_id or make_worker_id()
+        self.batch_interval = batch_interval
+        self.max_batch_size = max_batch_size
+        self.local_users: Set[int] = set()
+        self._outbox: Dict[str, List[Tuple[int, str]]] = {}
+        self._outbox_ready = asyncio.Event()
+        self._pubsub = None
+        self._tasks: List[asyncio.Task] = []
+        self._release = redis_client.register_script(_RELEASE_PRESENCE)
+
+    async def start(self):
+        if self._tasks:
+            return
+        self._pubsub = self.redis_client.pubsub()
+        await self._pubsub.subscribe(worker_channel(self.worker_id))
+        self._tasks = [
+            asyncio.create_task(self._listen()),
+            asyncio.create_task(self._flush_loop()),
+            asyncio.create_task(self._refresh_presence())
+        ]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+        await self._flush()
+        if self._pubsub is not None:
+            await self._pubsub.unsubscribe()
+            await self._pubsub.aclose()
+            self._pubsub = None
+        for user_id in list(self.local_users):
+            await self.unregister(user_id)
+
+    async def register(self, user_id: int):
+        self.local_users.add(user_id)
+        await self.redis_client.set(presence_key(user_id), self.worker_id, ex=PRESENCE_TTL)
+
+    async def unregister(self, user_id: int):
+        self.local_users.discard(user_id)
+        await self._release(keys=[presence_key(user_id)], args=[self.worker_id])
+
+    async def send(self, user_id: int, message: str) -> bool:
+        # 用戶連在本 worker 直接送出，否則放進對應 worker 的批次
+        if user_id in self.local_users:
+            return await self.deliver(user_id, message)
+        worker_id = await self.redis_client.get(presence_key(user_id))
+        if not worker_id or worker_id == self.worker_id:
+            return False
+        batch = self._outbox.setdefault(worker_id, [])
+        batch.append((user_id, message))
+        if len(batch) >= self.max_batch_size:
+            await self._flush()
+        else:
+            self._outbox_ready.set()
+        return True
+
+    async def _flush(self):
+        outbox, self._outbox = self._outbox, {}
+        self._outbox_ready.clear()
+        if not outbox:
+            return
+        async with self.redis_client.pipeline(transaction=False) as pipe:
+            for worker_id, batch in outbox.items():
+                pipe.publish(worker_channel(worker_id), json.dumps(batch, ensure_ascii=False))
+            await pipe.execute()
+
+    async def _flush_loop(self):
+        while True:
+            await self._outbox_ready.wait()
+            # 等一小段時間把同一時間產生的訊息合併成一次 publish
+            await asyncio.sleep(self.batch_interval)
+            try:
+                await self._flush()
+            except Exception as e:
+                logger.error(f"轉送 WebSocket 訊息失敗: {str(e)}")
+
+    async def _listen(self):
+        while True:
+            try:
+                message = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                if message is None:
+                    continue
+                for user_id, text in json.loads(message["data"]):
+                    if user_id in self.local_users:
+                        await self.deliver(user_id, text)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"處理轉送的 WebSocket 訊息失敗: {str(e)}")
+                await asyncio.sleep(1)
+
+    async def _refresh_presence(self):
+        while True:
+            await asyncio.sleep(PRESENCE_REFRESH_INTERVAL)
+            if not self.local_users:
+                continue
+            try:
+                async with self.redis_client.pipeline(transaction=False) as pipe:
+                    for user_id in self.local_users:
+                        pipe.set(presence_key(user_id), self.worker_id, ex=PRESENCE_TTL)
+                    await pipe.execute()
+            except Exception as e:
+                logger.error(f"更新 WebSocket presence 失敗: {str(e)}")
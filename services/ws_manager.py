@@ -0,0 +1,225 @@
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Set
+
+from fastapi import WebSocket, status
+
+from services.ws_broker import WebSocketBroker
+
+
+logger = logging.getLogger(__name__)
+
+# 每個連線最多排隊的訊息數；超過代表用戶端消化不了，直接斷線讓它用 resume token 補回
+MAX_QUEUE_SIZE = 256
+SEND_TIMEOUT = 10
+HEARTBEAT_INTERVAL = 25
+IDLE_TIMEOUT = 75
+# 這些事件只需要最新一筆（用戶端收到後會重新抓資料），排隊中的舊事件可以被取代
+COALESCE_TYPES = ("partner_diary_updated", "ping")
+
+PING_MESSAGE = json.dumps({"type": "ping"})
+CLOSE_TRY_AGAIN_LATER = 1013
+
+
+def coalesce_key(message: str) -> Optional[str]:
+    try:
+        event = json.loads(message)
+    except ValueError:
+        return None
+    event_type = event.get("type") if isinstance(event, dict) else None
+    if event_type not in COALESCE_TYPES:
+        return None
+    data = event.get("data") or {}
+    return f"{event_type}:{data.get('partner_id', '')}"
+
+
+class Connection:
+    __slots__ = ("websocket", "user_id", "queue", "wakeup", "sender", "last_seen", "closed")
+
+    def __init__(self, websocket: WebSocket, user_id: int):
+        self.websocket = websocket
+        self.user_id = user_id
+        self.queue: Deque[str] = deque()
+        self.wakeup = asyncio.Event()
+        self.sender: Optional[asyncio.Task] = None
+        self.last_seen = time.monotonic()
+        self.closed = False
+
+    def touch(self):
+        self.last_seen = time.monotonic()
+
+
+class ConnectionManager:
+    # 每個連線有自己的送出佇列與送出 task，慢的用戶端不會拖住發送端
+    def __init__(self, redis_client, decode_token: Callable[[str], Awaitable[Optional[Dict]]],
+                 max_queue_size: int = MAX_QUEUE_SIZE,
+                 heartbeat_interval: float = HEARTBEAT_INTERVAL,
+                 idle_timeout: float = IDLE_TIMEOUT,
+                 send_timeout: float = SEND_TIMEOUT):
+        self.active_connections: Dict[int, Connection] = {}
+        self.decode_token = decode_token
+        self.max_queue_size = max_queue_size
+        self.heartbeat_interval = heartbeat_interval
+        self.idle_timeout = idle_timeout
+        self.send_timeout = send_timeout
+        # 用戶可能連在其他 worker，訊息經由 broker 轉送
+        self.broker = WebSocketBroker(redis_client, self._deliver)
+        self.counters = {
+            "connections_opened": 0,
+            "connections_closed": 0,
+            "auth_failures": 0,
+            "messages_sent": 0,
+            "messages_coalesced": 0,
+            "messages_dropped": 0,
+            "evicted_slow": 0,
+            "evicted_idle": 0
+        }
+        self._heartbeat: Optional[asyncio.Task] = None
+        self._closing: Set[asyncio.Task] = set()
+
+    async def start(self):
+        await self.broker.start()
+        if self._heartbeat is None:
+            self._heartbeat = asyncio.create_task(self._heartbeat_loop())
+
+    async def stop(self):
+        if self._heartbeat is not None:
+            self._heartbeat.cancel()
+            try:
+                await self._heartbeat
+            except asyncio.CancelledError:
+                pass
+            self._heartbeat = None
+        for connection in list(self.active_connections.values()):
+            await self._close(connection, status.WS_1001_GOING_AWAY)
+        await self.broker.stop()
+
+    async def authenticate(self, websocket: WebSocket, user_id: int, token: Optional[str]) -> bool:
+        # 與 dependencies.get_current_user 相同的 JWT 檢查，且 token 必須屬於該 user_id
+        payload = await self.decode_token(token) if token else None
+        if payload is None or payload.get("id") != user_id:
+            self.counters["auth_failures"] += 1
+            # 先接受再以 1008 關閉，瀏覽器才看得到關閉原因而不會一直重連
+            await websocket.accept()
+            await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+            return False
+        return True
+
+    async def connect(self, websocket: WebSocket, user_id: int, token: Optional[str]) -> Optional[Connection]:
+        if not await self.authenticate(websocket, user_id, token):
+            return None
+        await websocket.accept()
+        previous = self.active_connections.get(user_id)
+        if previous is not None:
+            # 同一用戶只保留最新的連線
+            await self._close(previous, status.WS_1000_NORMAL_CLOSURE)
+        connection = Connection(websocket, user_id)
+        connection.sender = asyncio.create_task(self._drain(connection))
+        self.active_connections[user_id] = connection
+        self.counters["connections_opened"] += 1
+        await self.broker.register(user_id)
+        return connection
+
+    async def disconnect(self, connection: Connection):
+        await self._close(connection, None)
+
+    def _mark_closed(self, connection: Connection) -> bool:
+        # 同步地把連線標記為關閉並移出 active_connections，回傳是否為第一次關閉
+        if connection.closed:
+            return False
+        connection.closed = True
+        self.counters["connections_closed"] += 1
+        self.counters["messages_dropped"] += len(connection.queue)
+        connection.queue.clear()
+        if connection.sender is not None and connection.sender is not asyncio.current_task():
+            connection.sender.cancel()
+        if self.active_connections.get(connection.user_id) is connection:
+            del self.active_connections[connection.user_id]
+            self.broker.local_users.discard(connection.user_id)
+        return True
+
+    async def _close(self, connection: Connection, code: Optional[int]):
+        if self._mark_closed(connection):
+            await self._release(connection, code)
+
+    async def _release(self, connection: Connection, code: Optional[int]):
+        if connection.user_id not in self.active_connections:
+            await self.broker.unregister(connection.user_id)
+        if code is not None:
+            try:
+                await connection.websocket.close(code=code)
+            except Exception:
+                pass
+
+    def enqueue(self, connection: Connection, message: str) -> bool:
+        if connection.closed:
+            return False
+        queue = connection.queue
+        if queue:
+            key = coalesce_key(message)
+            if key is not None:
+                for i, queued in enumerate(queue):
+                    if coalesce_key(queued) == key:
+                        del queue[i]
+                        self.counters["messages_coalesced"] += 1
+                        break
+        if len(queue) >= self.max_queue_size:
+            # 佇列滿了：斷開這個慢連線，用戶端重連後會從 resume token 補送
+            self.counters["evicted_slow"] += 1
+            self._mark_closed(connection)
+            task = asyncio.create_task(self._release(connection, CLOSE_TRY_AGAIN_LATER))
+            self._closing.add(task)
+            task.add_done_callback(self._closing.discard)
+            return False
+        queue.append(message)
+        connection.wakeup.set()
+        return True
+
+    async def _deliver(self, user_id: int, message: str) -> bool:
+        connection = self.active_connections.get(user_id)
+        if connection is None:
+            return False
+        return self.enqueue(connection, message)
+
+    async def _drain(self, connection: Connection):
+        try:
+            while not connection.closed:
+                await connection.wakeup.wait()
+                connection.wakeup.clear()
+                while connection.queue and not connection.closed:
+                    message = connection.queue.popleft()
+                    await asyncio.wait_for(connection.websocket.send_text(message), self.send_timeout)
+                    self.counters["messages_sent"] += 1
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.info(f"WebSocket 送出失敗，關閉用戶 {connection.user_id} 的連線: {str(e)}")
+            self.counters["evicted_slow"] += 1
+            await self._close(connection, CLOSE_TRY_AGAIN_LATER)
+
+    async def _heartbeat_loop(self):
+        # 單一 task 負責所有連線的心跳與閒置清理
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            now = time.monotonic()
+            for connection in list(self.active_connections.values()):
+                if now - connection.last_seen > self.idle_timeout:
+                    self.counters["evicted_idle"] += 1
+                    await self._close(connection, status.WS_1001_GOING_AWAY)
+                else:
+                    self.enqueue(connection, PING_MESSAGE)
+
+    async def send_personal_message(self, message: str, user_id: int):
+        await self.broker.send(user_id, message)
+
+    def stats(self) -> Dict:
+        depths: List[int] = [len(connection.queue) for connection in self.active_connections.values()]
+        return {
+            **self.counters,
+            "connections": len(depths),
+            "queue_depth": sum(depths),
+            "max_queue_depth": max(depths, default=0)
+        }
@@ -95,7 +95,19 @@ async function checkMatchStatus() {
         );
 
         const data = await response.json();
-        
+        await renderMatchStatus(data);
+    } catch (error) {
+        showNotification('Your partner\'s diary is still empty! Maybe they\'re busy exploring a magical world');
+        if (partnerDiaryContent) {
+            partnerDiaryContent.innerHTML = '<p>Your partner\'s diary is still empty! Maybe they\'re busy exploring a magical world</p>';
+        }
+        enableExchangeButton(document.getElementById('exchangeBtn'));
+    }
+}
+
+// 依配對狀態更新畫面（來源可以是 /matching/status 或 WebSocket 事件）
+async function renderMatchStatus(data) {
+    try {
         updateExchangeButton(data);
 
         const partnerNameElement = document.querySelector('.partner-name');
@@ -348,6 +360,8 @@ async function loadPartnerDiary(partnerId) {
 
 // 建立WebSocket連接
 
+let webSocketRetryDelay = 1000;
+
 function connectWebSocket() {
     const userId = localStorage.getItem('user_id');
     if (!userId) {
@@ -355,16 +369,35 @@ function connectWebSocket() {
     }
 
     const wsProtocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
-    const wsUrl = `${wsProtocol}//${window.location.host}/ws/${userId}`;
+    // 帶上最後收到的事件 id，斷線期間錯過的事件會由伺服器補送
+    const resumeToken = localStorage.getItem('match_event_id');
+    const token = localStorage.getItem('token');
+    if (!token) {
+        return;
+    }
+    const resumeQuery = resumeToken ? `&resume=${encodeURIComponent(resumeToken)}` : '';
+    const wsUrl = `${wsProtocol}//${window.location.host}/ws/${userId}?token=${encodeURIComponent(token)}${resumeQuery}`;
     const ws = new WebSocket(wsUrl);
 
     ws.onopen = function() {
         console.log('WebSocket connection established');
+        webSocketRetryDelay = 1000;
     };
 
     ws.onmessage = function(event) {
-        const message = event.data;
-        showNotification(message);
+        let message;
+        try {
+            message = JSON.parse(event.data);
+        } catch (error) {
+            showNotification(event.data);
+            return;
+        }
+        // 回應伺服器的心跳，避免被當作閒置連線
+        if (message.type === 'ping') {
+            ws.send('pong');
+            return;
+        }
+        handleMatchEvent(message);
     };
 
     ws.onerror = function(error) {
@@ -373,12 +406,80 @@ function connectWebSocket() {
 
     ws.onclose = function(event) {
         console.log('WebSocket connection closed:', event);
+        // 非主動關閉時自動重連（驗證失敗則不重連）
+        if (window.matchWebSocket === ws && event.code !== 1008) {
+            setTimeout(connectWebSocket, webSocketRetryDelay);
+            webSocketRetryDelay = Math.min(webSocketRetryDelay * 2, 30000);
+        }
     };
 
     // 將 WebSocket 實例存儲在全局變量
     window.matchWebSocket = ws;
 }
     
+// 處理伺服器推送的配對事件
+async function handleMatchEvent(message) {
+    if (!message || !message.type) {
+        return;
+    }
+    // 重連補送時可能收到重複事件，以事件 id 去重
+    const lastEventId = localStorage.getItem('match_event_id');
+    if (message.id) {
+        if (message.id === lastEventId || isEventSeen(message.id, lastEventId)) {
+            return;
+        }
+        localStorage.setItem('match_event_id', message.id);
+    }
+
+    const data = message.data || {};
+    switch (message.type) {
+        case 'request_received':
+            showMatchRequestNotification({ requester_id: data.requester_id, user_name: data.requester_name });
+            if (data.status) {
+                await renderMatchStatus(data.status);
+            }
+            break;
+        case 'request_accepted':
+        case 'request_rejected':
+        case 'request_expired':
+            if (message.type === 'request_rejected') {
+                showNotification('Your match request was declined');
+            } else if (message.type === 'request_expired') {
+                showNotification('The match request has expired');
+                const notification = document.querySelector('.match-request-notification');
+                if (notification) {
+                    notification.remove();
+                }
+            }
+            if (data.status) {
+                await renderMatchStatus(data.status);
+            } else {
+                await checkMatchStatus();
+            }
+            break;
+        case 'partner_diary_updated':
+            if (partnerDiaryContent && data.partner_id === currentPartnerId) {
+                const partnerDiary = await loadPartnerDiary(data.partner_id);
+                if (partnerDiary) {
+                    partnerDiaryContent.innerHTML = partnerDiary;
+                }
+            }
+            break;
+        default:
+            console.log('Unknown match event:', message);
+    }
+}
+
+// Redis stream id 格式為 "毫秒-序號"，比較是否不晚於已處理的事件
+function isEventSeen(eventId, lastEventId) {
+    if (!lastEventId) {
+        return false;
+    }
+    const [ms, seq] = eventId.split('-').map(Number);
+    const [lastMs, lastSeq] = lastEventId.split('-').map(Number);
+    return ms < lastMs || (ms === lastMs && seq <= lastSeq);
+}
+
 // 顯示通知的函數
 function showNotification(message) {
     const notification = document.createElement('div');
@@ -456,10 +557,6 @@ async function respondToMatchRequest(requesterId, action) {
 
         const data = await response.json();
         showNotification(data.message);
-         // 關閉 WebSocket 連接
-        if (window.matchWebSocket) {
-            window.matchWebSocket.close();
-        }
 
         // 移除通知元素
         const notification = document.querySelector('.match-request-notification');
@@ -1016,17 +1113,21 @@ document.addEventListener('DOMContentLoaded', async () => {
                     return;
                 }
                 
-                const format = prompt('Type one of download formats (json, csv, pdf):').toLowerCase();
+                const format = prompt('Type one of download formats (json, ndjson, csv, pdf):').toLowerCase();
 
-                if (!['json', 'csv', 'pdf'].includes(format)) {
+                if (!['json', 'ndjson', 'csv', 'pdf'].includes(format)) {
                     showMessage(document.querySelector('.fail-message'), `Please type one format`);
                     return;
                 }
 
-                fetch(`/api/v1/diary_entries/export?format=${format}`, {
-                    method: 'GET',
-                    headers: { 'Authorization': `Bearer ${token}` }
-                })
+                const exportRequest = format === 'pdf'
+                    ? downloadPdfExport(token)
+                    : fetch(`/api/v1/diary_entries/export?format=${format}`, {
+                        method: 'GET',
+                        headers: { 'Authorization': `Bearer ${token}` }
+                    });
+
+                exportRequest
                 .then (response => {
                     if (!response.ok) {
                         throw new Error('Download Failed');
@@ -1043,6 +1144,35 @@ document.addEventListener('DOMContentLoaded', async () => {
             });
         }
 
+        // PDF 在伺服器端背景產生：先取得 job id，輪詢到完成後再下載
+        // 超過期限仍未完成就停止輪詢（伺服器端也會把停住的工作標記為失敗）
+        const PDF_EXPORT_TIMEOUT_MS = 5 * 60 * 1000;
+
+        async function downloadPdfExport(token) {
+            const headers = { 'Authorization': `Bearer ${token}` };
+            const response = await fetch('/api/v1/diary_entries/export?format=pdf', { headers });
+            if (!response.ok) {
+                throw new Error('Download Failed');
+            }
+            const deadline = Date.now() + PDF_EXPORT_TIMEOUT_MS;
+            let job = await response.json();
+            while (job.status !== 'done') {
+                if (job.status === 'failed') {
+                    throw new Error(job.error || 'Download Failed');
+                }
+                if (Date.now() > deadline) {
+                    throw new Error('PDF export timed out');
+                }
+                await new Promise(resolve => setTimeout(resolve, 1000));
+                const statusResponse = await fetch(`/api/v1/diary_entries/export/jobs/${job.job_id}`, { headers });
+                if (!statusResponse.ok) {
+                    throw new Error('Download Failed');
+                }
+                job = await statusResponse.json();
+            }
+            return fetch(job.download_url, { headers });
+        }
+
         function downloadBlob(blob, filename) {
             const url = window.URL.createObjectURL(blob);
             const a = document.createElement('a');
@@ -1610,7 +1740,8 @@ document.addEventListener('DOMContentLoaded', async () => {
             return;
         }
 
-        fetch('/api/v1/diary_entries', {
+        // 只需要最近 5 篇，以分頁 API 取第一頁
+        fetch('/api/v1/diary_entries/page?limit=5', {
             headers: {
                 'Authorization': `Bearer ${token}`
             }
@@ -1621,9 +1752,9 @@ document.addEventListener('DOMContentLoaded', async () => {
             }
             return response.json();
         })
-        .then(entries => {
+        .then(page => {
             recentDiariesContainer.innerHTML = ''; // 清空現有內容
-            entries.slice(0, 5).forEach(entry => { // 只顯示最近5篇
+            page.entries.forEach(entry => {
                 const entryElement = document.createElement('div');
                 entryElement.classList.add('recent-diary-entry');
                 entryElement.innerHTML = `
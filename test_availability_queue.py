@@ -0,0 +1,97 @@
+import asyncio
+import fakeredis
+import pytest
+from services.availability_queue import (
+    AVAILABLE_KEY, SEEDED_KEY, claim_partner, claim_specific_partner, ensure_availability_seeded, mark_available
+)
+
+class FakeCursor:
+    def __init__(self, db):
+        self.db = db
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        pass
+
+    async def execute(self, query, params=()):
+        if self.db.error:
+            raise self.db.error
+
+    async def fetchall(self):
+        return [{"id": user_id} for user_id in self.db.user_ids]
+
+class FakeDB:
+    def __init__(self, user_ids=(), error=None):
+        self.user_ids, self.error = list(user_ids), error
+
+    def cursor(self, dictionary=False):
+        return FakeCursor(self)
+
+def test_concurrent_claims_get_distinct_partners():
+    async def run():
+        client = fakeredis.FakeAsyncRedis(decode_responses=True)
+        for user_id in range(1, 11):
+            await mark_available(client, user_id, since=float(user_id))
+        # 二十位請求者同時搶十位用戶：每位用戶只會被取走一次，也不會取到自己
+        requesters = list(range(101, 121))
+        claims = await asyncio.gather(*[claim_partner(client, user_id) for user_id in requesters])
+        partners = [claim[0] for claim in claims if claim]
+        assert len(partners) == len(set(partners)) >= 10
+        assert all(claim[0] != requester for requester, claim in zip(requesters, claims) if claim)
+        assert set(range(1, 11)) <= set(partners)
+        # 被取走的用戶不會留在集合中
+        assert not {str(partner_id) for partner_id in partners} & set(await client.zrange(AVAILABLE_KEY, 0, -1))
+    asyncio.run(run())
+
+def test_claim_takes_longest_waiting():
+    async def run():
+        client = fakeredis.FakeAsyncRedis(decode_responses=True)
+        await mark_available(client, 1, since=100.0)
+        await mark_available(client, 2, since=50.0)
+        await mark_available(client, 3, since=75.0)
+        # 已在排隊的用戶保留原本的等待時間
+        await mark_available(client, 2, since=200.0)
+        assert await claim_partner(client, 3) == (2, 50.0)
+        assert await client.zrange(AVAILABLE_KEY, 0, -1) == ["1"]
+    asyncio.run(run())
+
+def test_requester_restored_when_nobody_available():
+    async def run():
+        client = fakeredis.FakeAsyncRedis(decode_responses=True)
+        await mark_available(client, 1, since=42.0)
+        assert await claim_partner(client, 1) is None
+        assert await client.zscore(AVAILABLE_KEY, "1") == 42.0
+
+        # 請求者原本不在集合中：以現在時間放入
+        await client.delete(AVAILABLE_KEY)
+        assert await claim_partner(client, 5) is None
+        assert await client.zscore(AVAILABLE_KEY, "5") > 42.0
+    asyncio.run(run())
+
+def test_claim_specific_partner():
+    async def run():
+        client = fakeredis.FakeAsyncRedis(decode_responses=True)
+        await mark_available(client, 1, 2, since=10.0)
+        assert await claim_specific_partner(client, 1, 3) is None
+        assert await claim_specific_partner(client, 1, 2) == (2, 10.0)
+        assert await client.zcard(AVAILABLE_KEY) == 0
+        # 已被取走的人選不能再取一次
+        assert await claim_specific_partner(client, 4, 2) is None
+    asyncio.run(run())
+
+def test_seed_once_and_retry_after_failure():
+    async def run():
+        client = fakeredis.FakeAsyncRedis(decode_responses=True)
+        with pytest.raises(RuntimeError):
+            await ensure_availability_seeded(client, FakeDB(error=RuntimeError("db down")))
+        # 查詢失敗時旗標被清掉，下一次會重新建立
+        assert not await client.exists(SEEDED_KEY)
+
+        await ensure_availability_seeded(client, FakeDB([3, 1, 2]))
+        assert await client.zrange(AVAILABLE_KEY, 0, -1) == ["1", "2", "3"]
+        assert await client.exists(SEEDED_KEY)
+        await ensure_availability_seeded(client, FakeDB([4]))
+        assert await client.zcard(AVAILABLE_KEY) == 3
+    asyncio.run(run())
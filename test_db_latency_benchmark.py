@@ -0,0 +1,61 @@
+import asyncio
+import importlib
+import json
+import pytest
+from fastapi import HTTPException
+from mysql.connector import pooling
+import services.async_db
+from benchmarks.db_latency import SimulatedSyncPool, run_benchmarks, run_workload, AsyncDriver, simulated_database
+
+def test_slow_queries_only_stall_the_blocking_driver():
+    report = run_benchmarks(fast_requests=100, fast_interval=0.002, fast_query=0.001, slow_every=20, slow_query=0.05)
+    json.dumps(report)
+    blocking, async_ = report["results"]
+    assert blocking["driver"] == "blocking" and async_["driver"] == "async"
+    assert blocking["fast"]["count"] == async_["fast"]["count"] == 100
+    # 同步驅動的慢查詢讓排在後面的快查詢一起等待；asyncio 驅動的快查詢不受影響
+    assert blocking["fast"]["p99_ms"] > async_["fast"]["p99_ms"]
+    assert blocking["seconds"] > async_["seconds"]
+
+def test_async_driver_goes_through_async_database():
+    async def run():
+        database = simulated_database(pool_size=2)
+        result = await run_workload(AsyncDriver(database), 20, 0.001, 0.001, 5, 0.01)
+        # 每個查詢都從連線池取得並歸還連線
+        assert result["fast"]["count"] == 20 and result["slow"]["count"] == 4
+        assert database.pool.acquired == database.pool.released == 24
+    asyncio.run(run())
+
+@pytest.fixture
+def dependencies(monkeypatch):
+    # 沒有資料庫時同步連線池無法建立，import 前以模擬的連線池代替
+    monkeypatch.setattr(pooling, "MySQLConnectionPool", lambda **kwargs: SimulatedSyncPool())
+    module = importlib.import_module("dependencies")
+    monkeypatch.setattr(module, "async_db", simulated_database(pool_size=1))
+    return module
+
+def test_get_db_acquires_and_releases(dependencies):
+    async def run():
+        pool = dependencies.async_db.pool
+        dependency = dependencies.get_db()
+        connection = await dependency.__anext__()
+        assert isinstance(connection, services.async_db.AsyncConnection)
+        assert pool.acquired == 1 and pool.released == 0
+        with pytest.raises(StopAsyncIteration):
+            await dependency.__anext__()
+        assert pool.released == 1
+    asyncio.run(run())
+
+def test_get_db_returns_503_when_pool_exhausted(dependencies, monkeypatch):
+    monkeypatch.setattr(services.async_db, "ACQUIRE_TIMEOUT", 0.01)
+
+    async def run():
+        holder = dependencies.get_db()
+        await holder.__anext__()
+        # 唯一的連線被佔住，等待逾時後回傳 503
+        with pytest.raises(HTTPException) as exc:
+            await dependencies.get_db().__anext__()
+        assert exc.value.status_code == 503
+        await holder.aclose()
+        assert dependencies.async_db.pool.released == 1
+    asyncio.run(run())
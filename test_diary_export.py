@@ -0,0 +1,97 @@
+import asyncio
+import csv
+import gzip
+import io
+import json
+from contextlib import asynccontextmanager
+from datetime import date, datetime
+from services.diary_export import export_query, stream_export
+
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        # 未緩衝的 cursor 關閉時讀掉剩下的結果
+        self.connection.pending = []
+
+    async def execute(self, query, params):
+        self.connection.executed = (query, params)
+        self.connection.pending = list(self.connection.rows)
+
+    async def fetchmany(self, size):
+        batch, self.connection.pending = self.connection.pending[:size], self.connection.pending[size:]
+        self.connection.batches += 1
+        return batch
+
+class FakeConnection:
+    def __init__(self, rows):
+        self.rows, self.pending, self.batches, self.closed = rows, [], 0, False
+
+    def cursor(self, dictionary=False, buffered=True):
+        assert dictionary and not buffered
+        return FakeCursor(self)
+
+class FakePool:
+    def __init__(self, rows):
+        self.conn = FakeConnection(rows)
+
+    @asynccontextmanager
+    async def connection(self):
+        # 取用連線時重設狀態，離開時視為放回連線池
+        self.conn.closed = False
+        try:
+            yield self.conn
+        finally:
+            self.conn.closed = True
+
+def make_rows(count):
+    return [{"id": i, "user_id": 1, "title": f"t{i}", "content": "海邊 散步, \"quoted\"", "image_url": None,
+             "is_public": 0, "date": date(2024, 1, 1), "created_at": datetime(2024, 1, 1, 8),
+             "updated_at": datetime(2024, 1, 1, 9)} for i in range(count)]
+
+def collect(pool, format, **kwargs):
+    async def run():
+        chunks, media_type, filename = stream_export(pool, 1, format, batch_size=3, **kwargs)
+        parts = [chunk async for chunk in chunks]
+        return parts, media_type, filename
+    return asyncio.run(run())
+
+def test_formats_stream_in_batches():
+    pool = FakePool(make_rows(7))
+    parts, media_type, _ = collect(pool, "json")
+    entries = json.loads("".join(parts))
+    assert [e["id"] for e in entries] == list(range(7)) and entries[0]["date"] == "2024-01-01"
+    assert pool.conn.batches == 4 and pool.conn.closed
+
+    parts, media_type, _ = collect(FakePool(make_rows(7)), "ndjson")
+    assert media_type == "application/x-ndjson"
+    assert [json.loads(line)["id"] for line in "".join(parts).splitlines()] == list(range(7))
+
+    parts, _, _ = collect(FakePool(make_rows(7)), "csv")
+    rows = list(csv.DictReader(io.StringIO("".join(parts))))
+    assert len(rows) == 7 and rows[0]["content"] == "海邊 散步, \"quoted\""
+
+def test_empty_history_and_gzip():
+    assert json.loads("".join(collect(FakePool([]), "json")[0])) == []
+    assert "".join(collect(FakePool([]), "csv")[0]).startswith("id,user_id,title")
+    parts, media_type, filename = collect(FakePool(make_rows(5)), "ndjson", gzip=True)
+    assert media_type == "application/gzip" and filename == "my_moods.ndjson.gz"
+    assert len(gzip.decompress(b"".join(parts)).decode().splitlines()) == 5
+
+def test_client_disconnect_releases_connection():
+    pool = FakePool(make_rows(10))
+    async def run():
+        chunks, _, _ = stream_export(pool, 1, "ndjson", batch_size=3)
+        await chunks.__anext__()
+        await chunks.aclose()
+        assert pool.conn.closed and pool.conn.batches == 1
+    asyncio.run(run())
+
+def test_date_range_filter():
+    query, params = export_query(1, date(2024, 1, 1), date(2024, 1, 31))
+    assert "date >= %s" in query and "date <= %s" in query
+    assert params == [1, date(2024, 1, 1), date(2024, 1, 31)]
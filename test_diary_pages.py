@@ -0,0 +1,69 @@
+import asyncio
+from datetime import date, timedelta
+import fakeredis
+import pytest
+from services.diary_cache import bump_generation, diary_page_key, generation_key, get_generation
+from services.diary_pages import InvalidCursor, decode_cursor, encode_cursor, load_diary_page
+
+class FakeCursor:
+    # 以 Python 模擬 keyset 查詢：(date, id) 由新到舊，只回傳游標之後的 limit 列
+    def __init__(self, rows):
+        self.rows = rows
+        self.result = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        pass
+
+    async def execute(self, query, params):
+        rows = sorted(self.rows, key=lambda r: (r['date'], r['id']), reverse=True)
+        if len(params) == 5:
+            _, after_date, _, after_id, limit = params
+            rows = [r for r in rows if (r['date'].isoformat(), r['id']) < (after_date, after_id)]
+        else:
+            limit = params[1]
+        self.result = rows[:limit]
+
+    async def fetchall(self):
+        return self.result
+
+class FakeDB:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def cursor(self, dictionary=False):
+        return FakeCursor(self.rows)
+
+def test_cursor_round_trip_and_validation():
+    cursor = encode_cursor(date(2024, 5, 1), 42)
+    assert decode_cursor(cursor) == ("2024-05-01", 42)
+    with pytest.raises(InvalidCursor):
+        decode_cursor("not-a-cursor")
+
+def test_pages_walk_every_entry_once():
+    # 同一天多篇日記，以 id 決定先後
+    rows = [{"id": i, "date": date(2024, 1, 1) + timedelta(days=i // 3)} for i in range(1, 24)]
+    db = FakeDB(rows)
+    async def run():
+        seen, cursor = [], None
+        while True:
+            entries, cursor = await load_diary_page(db, 1, 5, cursor)
+            seen.extend(entry['id'] for entry in entries)
+            if cursor is None:
+                return seen
+    seen = asyncio.run(run())
+    assert seen == [r['id'] for r in sorted(rows, key=lambda r: (r['date'], r['id']), reverse=True)]
+
+def test_page_cache_keys_follow_generation():
+    async def run():
+        client = fakeredis.FakeAsyncRedis(decode_responses=True)
+        generation = await get_generation(client, 1)
+        first, second = diary_page_key(1, generation, 20, None), diary_page_key(1, generation, 20, encode_cursor(date(2024, 1, 1), 3))
+        assert len({first, second, diary_page_key(1, generation, 10, None)}) == 3
+        # 寫入只需要一次 INCR，之後的讀取都換到新的鍵
+        assert await bump_generation(client, 1) == generation + 1
+        assert diary_page_key(1, await get_generation(client, 1), 20, None) != first
+        assert await client.ttl(generation_key(1)) > 0
+    asyncio.run(run())
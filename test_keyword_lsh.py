@@ -0,0 +1,70 @@
+import random
+import numpy as np
+from services.keyword_lsh import KeywordLSH
+
+def make_corpus(count=600, topics=30, seed=3):
+    # 每位用戶從某個主題的關鍵字集合出發，再隨機增減幾個字
+    rng = random.Random(seed)
+    vocabulary = [f"word{i}" for i in range(2000)]
+    topic_sets = [set(rng.sample(vocabulary, 20)) for _ in range(topics)]
+    corpus = []
+    for _ in range(count):
+        keywords = set(rng.choice(topic_sets))
+        for word in rng.sample(sorted(keywords), rng.randint(0, 5)):
+            keywords.discard(word)
+        keywords.update(rng.sample(vocabulary, rng.randint(0, 5)))
+        corpus.append(keywords)
+    corpus.append(set())
+    return corpus
+
+def exact_neighbours(corpus, threshold):
+    neighbours = []
+    for i, a in enumerate(corpus):
+        found = set()
+        for j, b in enumerate(corpus):
+            if i != j and a | b and len(a & b) / len(a | b) >= threshold:
+                found.add(j)
+        neighbours.append(found)
+    return neighbours
+
+def measure(corpus, truth, bands, rows_per_band):
+    lsh = KeywordLSH(bands=bands, rows_per_band=rows_per_band).fit_sets(corpus)
+    hits = total = candidates = 0
+    for i, expected in enumerate(truth):
+        found = set(lsh.candidates(i).tolist())
+        hits += len(expected & found)
+        total += len(expected)
+        candidates += len(found)
+    return hits / total, candidates
+
+def test_lsh_recall_against_exact_jaccard():
+    corpus = make_corpus()
+    truth = exact_neighbours(corpus, 0.5)
+    recall, _ = measure(corpus, truth, bands=32, rows_per_band=2)
+    assert recall >= 0.95
+
+def test_bands_trade_recall_for_speed():
+    corpus = make_corpus()
+    truth = exact_neighbours(corpus, 0.5)
+    high_recall, high_candidates = measure(corpus, truth, bands=32, rows_per_band=2)
+    low_recall, low_candidates = measure(corpus, truth, bands=4, rows_per_band=8)
+    assert low_candidates < high_candidates
+    assert low_recall <= high_recall
+
+def test_top_k_candidates():
+    corpus = make_corpus(count=200)
+    lsh = KeywordLSH().fit_sets(corpus)
+    top = lsh.top_k_candidates(5)
+    assert len(top) == len(corpus)
+    assert all(len(found) <= 5 and i not in found for i, found in enumerate(top))
+    assert len(top[-1]) == 0  # 沒有關鍵字的用戶沒有候選
+    estimates = lsh.estimated_jaccard(0, np.arange(1, len(corpus)))
+    assert ((0 <= estimates) & (estimates <= 1)).all()
+
+def test_signatures_do_not_depend_on_chunk_size(monkeypatch):
+    from services import keyword_lsh
+    corpus = make_corpus(200)
+    whole = KeywordLSH().fit_sets(corpus).signatures
+    # 每批只容納幾位用戶的關鍵字，結果與一次算完相同
+    monkeypatch.setattr(keyword_lsh, "_HASH_CHUNK_BYTES", 64 * 8 * 50)
+    assert np.array_equal(KeywordLSH().fit_sets(corpus).signatures, whole)
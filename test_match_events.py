@@ -0,0 +1,36 @@
+import asyncio
+import json
+import fakeredis
+import pytest
+from services.match_events import MatchEventPublisher, REQUEST_RECEIVED, REQUEST_ACCEPTED
+
+
+def test_publish_sends_and_replays_after_resume_token():
+    async def run():
+        sent = []
+
+        async def send(message, user_id):
+            sent.append((user_id, json.loads(message)))
+
+        publisher = MatchEventPublisher(fakeredis.FakeAsyncRedis(decode_responses=True), send)
+        first = await publisher.publish(2, REQUEST_RECEIVED, {"requester_id": 1})
+        second = await publisher.publish(2, REQUEST_ACCEPTED, {"partner_id": 1})
+
+        assert [event["id"] for _, event in sent] == [first, second]
+        assert sent[0][1]["data"] == {"requester_id": 1}
+
+        replayed = [json.loads(message) for message in await publisher.replay(2, first)]
+        assert [event["id"] for event in replayed] == [second]
+        assert replayed[0]["type"] == REQUEST_ACCEPTED
+        assert await publisher.replay(2, None) == []
+        assert await publisher.replay(2, "not-a-token") == []
+
+    asyncio.run(run())
+
+def test_unknown_event_type_is_rejected():
+    async def send(message, user_id):
+        pass
+
+    publisher = MatchEventPublisher(fakeredis.FakeAsyncRedis(decode_responses=True), send)
+    with pytest.raises(ValueError):
+        asyncio.run(publisher.publish(1, "unknown", {}))
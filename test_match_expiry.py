@@ -0,0 +1,146 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+import fakeredis
+from services.availability_queue import AVAILABLE_KEY
+from services.match_expiry import EXPIRY_KEY, MatchExpiryScheduler, cancel_expiry, schedule_expiry
+from services.match_status import NONE, get_cached_match_status
+
+class FakeCursor:
+    def __init__(self, db):
+        self.db = db
+        self.rowcount = 0
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        pass
+
+    async def execute(self, query, params=()):
+        if query.strip().startswith("UPDATE"):
+            request = self.db.requests.get(params[0])
+            self.rowcount = 0
+            if request and request["status"] == "pending":
+                request["status"] = "expired"
+                self.rowcount = 1
+
+    async def fetchall(self):
+        return [dict(row, id=request_id) for request_id, row in self.db.requests.items() if row["status"] == "pending"]
+
+class FakeDB:
+    def __init__(self, requests):
+        self.requests = requests
+        self.commits = 0
+
+    def cursor(self, dictionary=False):
+        return FakeCursor(self)
+
+    async def commit(self):
+        self.commits += 1
+
+class FakeDatabase:
+    def __init__(self, requests):
+        self.db = FakeDB(requests)
+
+    @asynccontextmanager
+    async def connection(self):
+        yield self.db
+
+def make_request(requester_id, recipient_id, age, status="pending"):
+    created_at = datetime.utcnow() - age
+    return {"requester_id": requester_id, "recipient_id": recipient_id, "created_at": created_at, "status": status}
+
+def test_load_pending_and_expire_due():
+    async def run():
+        client = fakeredis.FakeAsyncRedis(decode_responses=True)
+        database = FakeDatabase({
+            1: make_request(10, 11, timedelta(hours=25)),
+            2: make_request(20, 21, timedelta(hours=1)),
+            3: make_request(30, 31, timedelta(hours=30), status="accepted")
+        })
+        notified = []
+
+        async def on_expired(*ids):
+            notified.append(ids)
+        scheduler = MatchExpiryScheduler(client, database, on_expired)
+        await scheduler.load_pending()
+        # 只有待處理的請求會排入，分數為到期時間
+        assert await client.zrange(EXPIRY_KEY, 0, -1) == ["1:10:11", "2:20:21"]
+        assert await client.zscore(EXPIRY_KEY, "2:20:21") > time.time()
+
+        assert await scheduler.expire_due() == 1
+        assert database.db.requests[1]["status"] == "expired" and database.db.requests[2]["status"] == "pending"
+        assert await client.zrange(EXPIRY_KEY, 0, -1) == ["2:20:21"]
+        assert notified == [(1, 10, 11)]
+        # 雙方回到可配對狀態
+        assert (await get_cached_match_status(client, 10))["state"] == NONE
+        assert (await get_cached_match_status(client, 11))["state"] == NONE
+        assert set(await client.zrange(AVAILABLE_KEY, 0, -1)) == {"10", "11"}
+        # 沒有到期的項目時不做任何事
+        assert await scheduler.expire_due() == 0
+    asyncio.run(run())
+
+def test_already_answered_request_is_not_expired():
+    async def run():
+        client = fakeredis.FakeAsyncRedis(decode_responses=True)
+        request = make_request(10, 11, timedelta(hours=25), status="accepted")
+        database = FakeDatabase({1: request})
+        await schedule_expiry(client, 1, 10, 11, request["created_at"])
+        scheduler = MatchExpiryScheduler(client, database)
+        # 請求已被接受：_mark_expired 不更新，也不把雙方放回佇列
+        assert await scheduler._mark_expired(1) is False
+        assert await scheduler.expire_due() == 0
+        assert request["status"] == "accepted"
+        assert await client.zcard(EXPIRY_KEY) == 0 and await client.zcard(AVAILABLE_KEY) == 0
+        assert await get_cached_match_status(client, 10) is None
+    asyncio.run(run())
+
+def test_concurrent_workers_expire_once():
+    async def run():
+        client = fakeredis.FakeAsyncRedis(decode_responses=True)
+        requests = {i: make_request(100 + i, 200 + i, timedelta(hours=25)) for i in range(1, 21)}
+        database = FakeDatabase(requests)
+        for request_id, row in requests.items():
+            await schedule_expiry(client, request_id, row["requester_id"], row["recipient_id"], row["created_at"])
+        await cancel_expiry(client, 20, 120, 220)
+        notified = []
+
+        async def on_expired(*ids):
+            notified.append(ids)
+        workers = [MatchExpiryScheduler(client, database, on_expired) for _ in range(3)]
+        counts = await asyncio.gather(*[worker.expire_due() for worker in workers])
+        # 每個請求只被一個 worker 處理；取消排程的請求不會過期
+        assert sum(counts) == 19 and len(notified) == 19 and database.db.commits == 19
+        assert requests[20]["status"] == "pending"
+    asyncio.run(run())
+
+def test_failed_update_is_retried(monkeypatch):
+    execute = FakeCursor.execute
+    failures = []
+
+    async def fail_once(self, query, params=()):
+        if not failures:
+            failures.append(params)
+            raise RuntimeError("lock wait timeout")
+        await execute(self, query, params)
+    monkeypatch.setattr(FakeCursor, "execute", fail_once)
+
+    async def run():
+        client = fakeredis.FakeAsyncRedis(decode_responses=True)
+        requests = {1: make_request(10, 11, timedelta(hours=26)), 2: make_request(20, 21, timedelta(hours=25))}
+        database = FakeDatabase(requests)
+        for request_id, row in requests.items():
+            await schedule_expiry(client, request_id, row["requester_id"], row["recipient_id"], row["created_at"])
+        score = await client.zscore(EXPIRY_KEY, "1:10:11")
+
+        scheduler = MatchExpiryScheduler(client, database)
+        # 第一個請求寫入失敗：放回佇列（保留原本的到期時間），同一批的第二個照常過期
+        assert await scheduler.expire_due() == 1 and scheduler.retry_pending
+        assert requests[1]["status"] == "pending" and requests[2]["status"] == "expired"
+        assert await client.zscore(EXPIRY_KEY, "1:10:11") == score
+
+        assert await scheduler.expire_due() == 1 and not scheduler.retry_pending
+        assert requests[1]["status"] == "expired" and await client.zcard(EXPIRY_KEY) == 0
+    asyncio.run(run())
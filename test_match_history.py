@@ -0,0 +1,50 @@
+import asyncio
+import numpy as np
+import fakeredis
+from services.match_history import PairBloom, PartnerHistory, history_key, record_partners, recent_partners
+from services.matching import match_users
+from services.similarity_engine import SimilarityEngine
+from test_similarity_engine import make_users
+
+def test_bloom_has_no_false_negatives_and_few_false_positives():
+    rng = np.random.default_rng(0)
+    a, b = rng.integers(1, 1_000_000, 5000), rng.integers(1, 1_000_000, 5000)
+    bloom = PairBloom(len(a))
+    bloom.add(a, b)
+    # 無序：(a, b) 與 (b, a) 是同一對
+    assert bloom.contains(a, b).all() and bloom.contains(b, a).all()
+    other_a, other_b = rng.integers(2_000_000, 3_000_000, 20000), rng.integers(1, 1_000_000, 20000)
+    assert bloom.contains(other_a, other_b).mean() < 0.03
+
+def test_history_excludes_pairs_from_every_scoring_path():
+    users = make_users(40, seed=7)
+    engine = SimilarityEngine(users)
+    i, j = 0, int(np.argmax(np.where(np.arange(40) == 0, -np.inf, engine.score_rows([0])[0])))
+    engine.exclude_pairs([users[i].id], [users[j].id])
+    assert engine.score_rows([i])[0, j] < 0
+    assert engine.score_rows([j], [i])[0, 0] < 0
+    assert engine.score_pairs([i], [j])[0] < 0
+    assert engine.score_pairs([i], [j], exclude_history=False)[0] > 0
+    assert j not in engine.top_k(5, 0, 1)[0][0]
+    assert list(PartnerHistory(engine.ids, [users[i].id, 999], [users[j].id, users[i].id]).partners(i)) == [j]
+
+def test_match_users_skips_recent_partners():
+    users = make_users(30, seed=11)
+    first, _ = match_users(users, pairing="greedy")
+    history = ([a.id for a, _ in first], [b.id for _, b in first])
+    for pairing in ("greedy", "sorted_edge", "exact"):
+        again, result = match_users(users, pairing=pairing, history=history)
+        previous = {frozenset((a.id, b.id)) for a, b in first}
+        assert not previous & {frozenset((a.id, b.id)) for a, b in again}
+        assert result.total_similarity > 0
+
+def test_recent_partners_in_redis():
+    async def run():
+        client = fakeredis.FakeAsyncRedis(decode_responses=True)
+        await record_partners(client, (1, 2), (1, 3))
+        assert await recent_partners(client, 1) == {2, 3}
+        assert await recent_partners(client, 2) == {1}
+        # 冷卻期以前的紀錄不算
+        await client.zadd(history_key(1), {"4": 0})
+        assert await recent_partners(client, 1) == {2, 3}
+    asyncio.run(run())
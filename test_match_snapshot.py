@@ -0,0 +1,50 @@
+import numpy as np
+from services.matching import User, calculate_similarity
+from services.match_snapshot import MatchSnapshot, MatchSnapshotBuilder
+from services.similarity_engine import SimilarityEngine
+from test_similarity_engine import make_users
+
+def test_snapshot_roundtrip_with_mmap(tmp_path):
+    users = make_users(50, seed=4)
+    snapshot = MatchSnapshot.from_users(users)
+    path = str(tmp_path / "snapshot")
+    snapshot.save(path)
+
+    loaded = MatchSnapshot.load(path)
+    assert isinstance(loaded.ids, np.memmap)
+    assert loaded.ids.tolist() == [user.id for user in users]
+    assert loaded.weather_types == snapshot.weather_types
+    for row, user in enumerate(users):
+        assert set(loaded.keywords(row)) == user.get_all_keywords()
+
+    engine = SimilarityEngine.from_snapshot(loaded, target_keyword="olympic")
+    for i in range(0, 50, 7):
+        for j in range(50):
+            assert engine.score(i, j) == calculate_similarity(users[i], users[j], "olympic")
+
+def test_builder_interns_keywords_and_new_weather_types():
+    builder = MatchSnapshotBuilder()
+    builder.add(1, 0.5, 3, 2.0, {'sunny': 2}, {"coffee", "music"})
+    builder.add(2, 0.2, 1, 4.0, {'foggy': 5}, {"music"})
+    snapshot = builder.build()
+    assert snapshot.vocabulary.count("music") == 1
+    assert snapshot.keyword_indices.dtype == np.int32
+    assert snapshot.weather_types[-1] == 'foggy'
+    assert snapshot.weather[:, -1].tolist() == [0, 5]
+    assert snapshot.weather.dtype == np.int32
+
+def test_empty_snapshot():
+    snapshot = MatchSnapshot.from_users([])
+    assert len(snapshot) == 0
+    assert len(SimilarityEngine.from_snapshot(snapshot)) == 0
+
+def test_save_replaces_existing_snapshot(tmp_path):
+    path = str(tmp_path / "snapshot")
+    MatchSnapshot.from_users(make_users(10, seed=1)).save(path)
+    old = MatchSnapshot.load(path)
+    users = make_users(20, seed=2)
+    MatchSnapshot.from_users(users).save(path)
+    # 已開啟的舊快照仍可讀取；新快照換上後不留下暫存或舊目錄
+    assert len(old.ids.tolist()) == 10
+    assert MatchSnapshot.load(path).ids.tolist() == [user.id for user in users]
+    assert [p.name for p in tmp_path.iterdir()] == ["snapshot"]
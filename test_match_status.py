@@ -0,0 +1,90 @@
+import asyncio
+from datetime import datetime, timedelta
+import fakeredis
+from services.availability_queue import AVAILABLE_KEY
+from services.match_status import (
+    NONE, OUTGOING, INCOMING, ACCEPTED, get_cached_match_status, make_record, refresh_match_status, to_response
+)
+
+class FakeCursor:
+    def __init__(self, db):
+        self.db = db
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        pass
+
+    async def execute(self, query, params=()):
+        if query.strip().startswith("UPDATE"):
+            self.db.updates.append(params)
+
+    async def fetchone(self):
+        return dict(self.db.row)
+
+class FakeDB:
+    def __init__(self, **row):
+        self.row = {"is_matching": 0, "requester_id": None, "recipient_id": None, "request_created_at": None,
+                    "match_status": None, "partner_id": None, "match_created_at": None,
+                    "partner_user_id": None, "partner_name": None, **row}
+        self.updates = []
+        self.commits = 0
+
+    def cursor(self, dictionary=False):
+        return FakeCursor(self)
+
+    async def commit(self):
+        self.commits += 1
+
+def test_pending_records_count_down_from_deadline():
+    created_at = datetime.utcnow() - timedelta(hours=1)
+    outgoing = to_response(make_record(OUTGOING, 2, "Bob", created_at))
+    assert outgoing["status"] == "pending"
+    assert outgoing["recipient_id"] == 2
+    assert 23 * 3600 - 5 < outgoing["remaining_time_seconds"] <= 23 * 3600
+
+    incoming = to_response(make_record(INCOMING, 1, "Alice", created_at))
+    assert incoming["status"] == "incoming_request"
+    assert incoming["requester_name"] == "Alice"
+    assert incoming["created_at"] == created_at.isoformat()
+
+def test_expired_pending_record_reads_as_no_match():
+    created_at = datetime.utcnow() - timedelta(hours=25)
+    assert to_response(make_record(INCOMING, 1, "Alice", created_at))["status"] == "no_match"
+
+def test_accepted_and_none_records():
+    matched_at = datetime(2024, 9, 1, 12, 0)
+    accepted = to_response(make_record(ACCEPTED, 3, "Carol", matched_at))
+    assert accepted == {"status": "accepted", "partner_id": 3, "partner_name": "Carol", "match_date": "2024-09-01T12:00:00"}
+    assert to_response(make_record(NONE))["status"] == "no_match"
+
+def test_refresh_only_queues_users_who_are_not_matching():
+    async def run():
+        client = fakeredis.FakeAsyncRedis(decode_responses=True)
+        # 已接受的配對：寫回快取，不放回佇列
+        db = FakeDB(is_matching=1, match_status="accepted", partner_id=2, partner_name="Bob",
+                    match_created_at=datetime(2024, 9, 1))
+        assert (await refresh_match_status(client, db, 1))["state"] == ACCEPTED
+        assert (await get_cached_match_status(client, 1))["partner_id"] == 2
+        # 有待處理請求的用戶也不放回佇列
+        db = FakeDB(requester_id=3, recipient_id=4, partner_user_id=4, request_created_at=datetime.utcnow())
+        assert (await refresh_match_status(client, db, 3))["state"] == OUTGOING
+        # 沒有配對紀錄卻仍是 is_matching = 1：不重設，也不放回佇列
+        db = FakeDB(is_matching=1)
+        assert (await refresh_match_status(client, db, 5))["state"] == NONE
+        assert db.updates == [] and await client.zcard(AVAILABLE_KEY) == 0
+
+        db = FakeDB(is_matching=0)
+        assert (await refresh_match_status(client, db, 6))["state"] == NONE
+        assert db.updates == [] and await client.zrange(AVAILABLE_KEY, 0, -1) == ["6"]
+    asyncio.run(run())
+
+def test_refresh_resets_is_matching_after_match_ends():
+    async def run():
+        client = fakeredis.FakeAsyncRedis(decode_responses=True)
+        db = FakeDB(is_matching=1, match_status="rejected", partner_id=2)
+        assert (await refresh_match_status(client, db, 1))["state"] == NONE
+        assert db.updates == [(1,)] and db.commits == 1
+        assert await client.zrange(AVAILABLE_KEY, 0, -1) == ["1"]
+    asyncio.run(run())
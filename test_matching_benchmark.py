@@ -0,0 +1,25 @@
+import json
+from benchmarks.matching import run_benchmarks, run_size, PRESETS
+from benchmarks.synthetic import make_population
+
+def test_population_is_deterministic_and_realistic():
+    users = make_population(300, seed=7)
+    again = make_population(300, seed=7)
+    assert [u.diary_entries for u in users] == [u.diary_entries for u in again]
+    assert all(1 <= u.avg_mood_score <= 5 for u in users)
+    assert all(sum(u.weather_counts.values()) >= 1 for u in users)
+    # 同時包含英文與中文詞彙
+    words = " ".join(e.content for u in users for e in u.diary_entries).split()
+    assert any(w.isascii() for w in words) and any(not w.isascii() for w in words)
+
+def test_run_size_reports_json_metrics():
+    result = run_size("tiny", 200, seed=1)
+    json.dumps(result)
+    assert result["daily_matching"]["pairs"] == 100
+    assert result["daily_matching"]["total_similarity"] > 0
+    assert result["calculate_similarity"]["pairs_per_second"] > 0
+    assert result["keyword_union"]["mean_keywords_per_user"] > 0
+    assert result["memory"]["peak_rss_mb"] > 0
+
+def test_presets_cover_requested_sizes():
+    assert [PRESETS[name]["users"] for name in ("1k", "10k", "100k")] == [1000, 10000, 100000]
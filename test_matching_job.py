@@ -0,0 +1,159 @@
+import asyncio
+import json
+import os
+from datetime import date
+import fakeredis
+import numpy as np
+import pytest
+from benchmarks.synthetic import make_population
+from services.match_snapshot import MatchSnapshot
+from services.matching_job import MatchingJob
+from services.matching_queue import MATCHING_JOB_QUEUE, enqueue_matching_job, get_matching_job_status, job_key
+
+MATCH_DATE = date(2024, 3, 1)
+
+class FakeCursor:
+    def __init__(self, db):
+        self.db = db
+        self.rows = []
+
+    def execute(self, query, params=()):
+        if "INSERT INTO user_matches" in query:
+            self.db.inserted.extend(params)
+        elif "FROM mood_entries" in query or "JOIN mood_entries" in query:
+            self.rows = self.db.users
+        elif "FROM diary_entries" in query:
+            self.rows = [row for row in self.db.diaries if row[0] in params[:-1]]
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def fetchall(self):
+        # 沒有冷卻期紀錄，也沒有當天已寫入的配對
+        return []
+
+    def close(self):
+        pass
+
+class FakeDB:
+    def __init__(self, users=(), diaries=()):
+        self.inserted = []
+        self.users, self.diaries = list(users), list(diaries)
+
+    def cursor(self, dictionary=False, buffered=True):
+        return FakeCursor(self)
+
+    def start_transaction(self):
+        pass
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+class Killed(Exception):
+    pass
+
+def make_job(job_root, keyword=None, on_progress=None, **options):
+    users = make_population(60, seed=3)
+    return MatchingJob(MATCH_DATE, keyword, workers=1, k=5, shard_size=20, job_root=str(job_root),
+                       on_progress=on_progress, load_snapshot=lambda db, today: MatchSnapshot.from_users(users), **options)
+
+def test_resume_after_kill_matches_uninterrupted_run(tmp_path):
+    baseline_db = FakeDB()
+    baseline = make_job(tmp_path / "baseline").run(lambda: baseline_db)
+    assert baseline["status"] == "done" and baseline["shards_total"] == 3
+
+    def kill_after_first_shard(state):
+        if state.get("shards_done") == 1 and state["status"] == "running":
+            raise Killed()
+    job = make_job(tmp_path / "resumed", on_progress=kill_after_first_shard)
+    with pytest.raises(Killed):
+        job.run(FakeDB)
+    # 行程在第一片寫入檢查點後被終止：其餘分片還沒寫出
+    job_dir = tmp_path / "resumed" / job.job_id
+    shards = sorted(p.name for p in job_dir.glob("topk_*.npz"))
+    for name in shards[1:]:
+        os.remove(job_dir / name)
+    first_shard = job_dir / shards[0]
+    first_mtime = first_shard.stat().st_mtime_ns
+    assert json.loads((job_dir / "state.json").read_text())["status"] == "failed"
+
+    states, db = [], FakeDB()
+    resumed = make_job(tmp_path / "resumed", on_progress=states.append).run(lambda: db)
+    assert resumed["status"] == "done"
+    # 只重算缺少的分片，合併後的結果與沒有中斷的執行相同
+    assert first_shard.stat().st_mtime_ns == first_mtime
+    assert states[1]["shards_done"] == 1 and states[1]["shards_total"] == 3
+    assert np.array_equal(np.load(job_dir / "pairs.npy"), np.load(tmp_path / "baseline" / job.job_id / "pairs.npy"))
+    assert db.inserted and db.inserted == baseline_db.inserted and resumed["pairs"] == baseline["pairs"]
+
+    # 已完成的工作重跑時直接回報 done
+    states.clear()
+    assert make_job(tmp_path / "resumed", on_progress=states.append).run(FakeDB)["status"] == "done"
+    assert [state["status"] for state in states] == ["done"]
+
+def test_keyword_mismatch_reports_failed(tmp_path):
+    make_job(tmp_path).run(FakeDB)
+    states = []
+    job = make_job(tmp_path, keyword="olympic", on_progress=states.append)
+    with pytest.raises(ValueError):
+        job.run(FakeDB)
+    assert states[-1]["status"] == "failed" and states[-1]["target_keyword"] == "olympic"
+    # 原本的檢查點不受影響
+    assert make_job(tmp_path).state["status"] == "done"
+
+def test_enqueue_is_idempotent_and_requeues_failed_jobs():
+    async def run():
+        client = fakeredis.FakeAsyncRedis(decode_responses=True)
+        first = await enqueue_matching_job(client, MATCH_DATE)
+        again = await enqueue_matching_job(client, MATCH_DATE, "olympic")
+        assert first["status"] == again["status"] == "queued" and again["target_keyword"] is None
+        assert await client.llen(MATCHING_JOB_QUEUE) == 1
+
+        failed = dict(first, status="failed")
+        await client.set(job_key(first["job_id"]), json.dumps(failed))
+        await enqueue_matching_job(client, MATCH_DATE)
+        assert await client.llen(MATCHING_JOB_QUEUE) == 2
+        assert (await get_matching_job_status(client, first["job_id"]))["status"] == "queued"
+    asyncio.run(run())
+
+def test_pairing_options_reach_the_job(tmp_path):
+    sorted_edge = make_job(tmp_path / "sorted_edge").run(FakeDB)
+    exact = make_job(tmp_path / "exact", pairing="exact", time_budget=60).run(FakeDB)
+    assert sorted_edge["pairing_used"] == "sorted_edge" and exact["pairing_used"] == "exact"
+    assert exact["pairs"] == 30 and exact["total_similarity"] >= sorted_edge["total_similarity"] - 1e-9
+    # 同一天的檢查點不能換成別的配對方式
+    with pytest.raises(ValueError):
+        make_job(tmp_path / "exact", pairing="greedy").run(FakeDB)
+
+def test_enqueue_carries_pairing_options():
+    async def run():
+        client = fakeredis.FakeAsyncRedis(decode_responses=True)
+        with pytest.raises(ValueError):
+            await enqueue_matching_job(client, MATCH_DATE, pairing="random")
+        assert await client.llen(MATCHING_JOB_QUEUE) == 0
+        status = await enqueue_matching_job(client, MATCH_DATE, "olympic", pairing="auto", time_budget=5, candidate_k=20)
+        assert status["pairing"] == "auto"
+        payload = json.loads(await client.lpop(MATCHING_JOB_QUEUE))
+        assert payload["pairing"] == "auto" and payload["time_budget"] == 5 and payload["candidate_k"] == 20
+    asyncio.run(run())
+
+def test_default_loader_streams_rows_into_snapshot(tmp_path, monkeypatch):
+    from services import matching
+    from test_matching_loader import make_rows
+
+    def no_users(*args, **kwargs):
+        raise AssertionError("不應該建立 User 物件")
+    monkeypatch.setattr(matching.User, "__init__", no_users)
+    users, diaries = make_rows()
+    db = FakeDB(users, diaries)
+    job = MatchingJob(MATCH_DATE, workers=1, k=3, shard_size=4, job_root=str(tmp_path))
+    assert job.run(lambda: db)["status"] == "done"
+    assert MatchSnapshot.load(job.snapshot_path).ids.tolist() == list(range(1, 8))
+    # 七位候選人配成三對，每對寫入兩列
+    assert len(db.inserted) == 3 * 8
@@ -0,0 +1,84 @@
+from datetime import date, timedelta
+import numpy as np
+from services import matching
+from services.diary_loader import MatchDiaryEntry
+from services.match_snapshot import MatchSnapshot
+from services.matching import User
+from services.matching_loader import load_matching_snapshot
+
+TODAY = date(2024, 3, 1)
+
+class FakeCursor:
+    def __init__(self, db, dictionary):
+        self.db = db
+        self.dictionary = dictionary
+        self.rows = []
+
+    def execute(self, query, params=()):
+        self.db.queries.append(query)
+        if "diary_entries" in query:
+            *user_ids, limit = params
+            self.rows = [row for row in self.db.diaries if row[0] in user_ids]
+        else:
+            self.rows = self.db.users
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def close(self):
+        pass
+
+class FakeDB:
+    def __init__(self, users, diaries):
+        self.users, self.diaries, self.queries = users, diaries, []
+
+    def cursor(self, dictionary=False, buffered=True):
+        # 候選人與日記都以非緩衝游標逐列讀取
+        assert not buffered
+        return FakeCursor(self, dictionary)
+
+def make_rows():
+    users, diaries = [], []
+    for user_id in range(1, 8):
+        users.append({"id": user_id, "partner_id": None, "match_date": None, "like_count": user_id,
+                      "mood_score": 3.0, "sunny_count": user_id % 3, "cloudy_count": 1, "rainy_count": 0,
+                      "snowy_count": None, "windy_count": 2})
+        for day in range(user_id):
+            keywords = "coffee running" if day % 2 else None
+            diaries.append((user_id, TODAY - timedelta(days=2 * day), f"海邊 散步 day{day}", keywords))
+    # 今天已經配對過的用戶不是候選人
+    users.append({"id": 8, "partner_id": 1, "match_date": TODAY, "like_count": 0, "mood_score": None,
+                  "sunny_count": 0, "cloudy_count": 0, "rainy_count": 0, "snowy_count": 0, "windy_count": 0})
+    return users, diaries
+
+def expected_snapshot(users, diaries):
+    built = []
+    for row in users[:-1]:
+        user = User(row["id"])
+        user.like_count = row["like_count"]
+        user.weather_counts = {weather: row[f"{weather}_count"] or 0 for weather in user.weather_counts}
+        user.diary_entries = [MatchDiaryEntry(d.isoformat(), content if keywords is None else "",
+                                              frozenset(keywords.split()) if keywords is not None else None)
+                              for user_id, d, content, keywords in diaries if user_id == row["id"]]
+        user.calculate_posting_frequency()
+        built.append(user)
+    return MatchSnapshot.from_users(built)
+
+def test_snapshot_built_from_rows_without_users(monkeypatch):
+    users, diaries = make_rows()
+    expected = expected_snapshot(users, diaries)
+
+    def no_users(*args, **kwargs):
+        raise AssertionError("不應該建立 User 物件")
+    monkeypatch.setattr(matching.User, "__init__", no_users)
+    db = FakeDB(users, diaries)
+    # 日記分批載入：每批三位用戶
+    snapshot = load_matching_snapshot(db, TODAY, chunk_size=3)
+    assert sum("diary_entries" in query for query in db.queries) == 3
+
+    assert snapshot.ids.tolist() == list(range(1, 8))
+    assert snapshot.weather_types == expected.weather_types
+    for column in ("posting_frequency", "like_count", "avg_mood_score", "weather", "keyword_indptr"):
+        assert np.array_equal(getattr(snapshot, column), getattr(expected, column)), column
+    for row in range(len(snapshot)):
+        assert set(snapshot.keywords(row)) == set(expected.keywords(row))
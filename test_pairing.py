@@ -0,0 +1,37 @@
+from test_similarity_engine import make_users
+from services.similarity_engine import SimilarityEngine
+from services.pairing import pair_users, total_similarity, exact_pairing, sorted_edge_pairing
+
+def assert_valid(pairs, count):
+    matched = [index for pair in pairs for index in pair]
+    assert len(matched) == len(set(matched))
+    assert len(pairs) == count // 2
+
+def test_exact_beats_greedy():
+    engine = SimilarityEngine(make_users(40, seed=5), target_keyword="olympic")
+    greedy = pair_users(engine, 'greedy')
+    exact = pair_users(engine, 'exact')
+    assert_valid(exact.pairs, 40)
+    assert exact.strategy == 'exact'
+    assert exact.total_similarity >= greedy.total_similarity - 1e-9
+
+def test_sorted_edge_pairs_everyone():
+    engine = SimilarityEngine(make_users(51, seed=9))
+    result = pair_users(engine, 'sorted_edge', k=3)
+    assert_valid(result.pairs, 51)
+    assert abs(result.total_similarity - total_similarity(engine, result.pairs)) < 1e-9
+    assert abs(result.total_similarity - sum(engine.score(i, j) for i, j in result.pairs)) < 1e-9
+
+def test_auto_falls_back_when_over_budget():
+    engine = SimilarityEngine(make_users(30, seed=2))
+    assert exact_pairing(engine, time_budget=0) is None
+    result = pair_users(engine, 'auto', time_budget=0)
+    assert result.strategy == 'sorted_edge'
+    assert_valid(result.pairs, 30)
+    assert pair_users(engine, 'auto', exact_max_users=10).strategy == 'sorted_edge'
+
+def test_exact_with_budget_runs_in_child_process():
+    engine = SimilarityEngine(make_users(20, seed=4))
+    # 有時間預算時在 spawn 啟動的子行程中計算，結果與行程內計算相同；來不及完成時回傳 None
+    assert exact_pairing(engine, time_budget=60) == exact_pairing(engine)
+    assert exact_pairing(engine, time_budget=0.001) is None
@@ -0,0 +1,99 @@
+import asyncio
+import fakeredis
+from services.diary_loader import MatchDiaryEntry
+from services.matching import calculate_similarity
+from services import partner_index
+from services.partner_index import PartnerIndex, PartnerIndexUpdater
+from test_similarity_engine import make_users
+
+def build_index(users):
+    index = PartnerIndex(capacity=4)
+    for user in users:
+        index.upsert(user)
+    index.set_available([user.id for user in users])
+    return index
+
+def test_scores_follow_calculate_similarity():
+    users = make_users(60, seed=3)
+    # 關鍵字以 sketch 估計；"olympic" 與 "running" 雜湊到同一個位元，換掉其一後應與原本的分數一致
+    for user in users:
+        user.diary_entries = [
+            MatchDiaryEntry(entry.date, entry.content.replace("running", "jogging")) for entry in user.diary_entries
+        ]
+    index = build_index(users)
+    scores = index.scores(users[0].id)
+    expected = [calculate_similarity(users[0], other) for other in users]
+    assert max(abs(a - b) for a, b in zip(scores, expected)) < 1e-9
+
+def test_best_partners_filters_inside_query():
+    users = make_users(60, seed=5)
+    index = build_index(users)
+    best = index.best_partners(1, k=3)
+    assert len(best) == 3 and 1 not in best
+    ranked = sorted((u for u in users if u.id != 1), key=lambda u: -calculate_similarity(users[0], u))
+    assert best[0] == ranked[0].id
+
+    index.set_available([best[0]], False)
+    after = index.best_partners(1, k=3, exclude=[best[1]])
+    assert best[0] not in after and best[1] not in after
+
+    index.sync_available([2])
+    assert index.best_partners(1, k=3) == [2]
+    index.sync_available([])
+    assert index.best_partners(1, k=3) == []
+
+def test_upsert_updates_existing_rows():
+    users = make_users(10, seed=1)
+    index = build_index(users)
+    users[3].like_count = 999
+    index.upsert(users[3])
+    assert len(index) == 10
+    assert index.like_count[index.rows[users[3].id]] == 999
+
+def test_claim_specific_partner_is_atomic():
+    from services.availability_queue import mark_available, claim_specific_partner, AVAILABLE_KEY
+
+    async def run():
+        client = fakeredis.FakeAsyncRedis(decode_responses=True)
+        await mark_available(client, 1, 2, since=100.0)
+        assert await claim_specific_partner(client, 1, 2) == (2, 100.0)
+        assert await claim_specific_partner(client, 3, 2) is None
+        assert await client.zcard(AVAILABLE_KEY) == 0
+
+    asyncio.run(run())
+
+class FakeConnection:
+    def close(self):
+        pass
+
+class FakePool:
+    def get_connection(self):
+        return FakeConnection()
+
+def test_updater_retries_rebuild_until_ready(monkeypatch):
+    monkeypatch.setattr(partner_index, "REBUILD_RETRY_SECONDS", 0.01)
+    users = make_users(6, seed=3)
+    calls = []
+
+    def load_users(db, user_ids=None):
+        calls.append(user_ids)
+        if len(calls) <= 2:
+            raise ConnectionError("資料庫暫時無法連線")
+        return users if user_ids is None else [user for user in users if user.id in user_ids]
+
+    async def run():
+        updater = PartnerIndexUpdater(PartnerIndex(), fakeredis.FakeAsyncRedis(decode_responses=True), FakePool(), load_users)
+        updater.start()
+        try:
+            for _ in range(200):
+                if updater.ready:
+                    break
+                await asyncio.sleep(0.01)
+            # 前兩次失敗後重試成功，之後的增量更新照常進行
+            assert updater.ready and len(updater.index) == 6 and calls[:3] == [None, None, None]
+            updater.schedule_refresh(users[0].id)
+            await asyncio.gather(*updater._refreshes)
+            assert calls[-1] == [users[0].id]
+        finally:
+            await updater.stop()
+    asyncio.run(run())
@@ -0,0 +1,55 @@
+import asyncio
+import json
+from datetime import datetime, timedelta
+import fakeredis
+from services import pdf_export
+from services.pdf_export import PdfExporter, render_pdf
+from test_diary_export import FakePool, make_rows
+
+def test_render_pdf_streams_tables(tmp_path):
+    spool = tmp_path / "entries.ndjson"
+    with open(spool, "w", encoding="utf-8") as f:
+        for i in range(pdf_export.ROWS_PER_TABLE * 3 + 7):
+            f.write(json.dumps({"date": "2024-01-01", "content": f"第 {i} 篇 <心情> & 天氣"}, ensure_ascii=False) + "\n")
+    out = tmp_path / "out.pdf"
+    render_pdf(str(spool), str(out))
+    data = out.read_bytes()
+    assert data.startswith(b"%PDF") and data.count(b"/Type /Page\n") > 1
+
+def test_export_job_lifecycle(tmp_path):
+    async def run():
+        client = fakeredis.FakeAsyncRedis(decode_responses=True)
+        exporter = PdfExporter(client, FakePool(make_rows(120)), workers=1, export_dir=str(tmp_path))
+        await exporter.start()
+        try:
+            job = await exporter.submit(1)
+            assert job["status"] == "pending"
+            # 其他用戶看不到這個工作
+            assert await exporter.get_status(job["job_id"], 2) is None
+            for _ in range(300):
+                status = await exporter.get_status(job["job_id"], 1)
+                if status["status"] in ("done", "failed"):
+                    break
+                await asyncio.sleep(0.05)
+            assert status["status"] == "done", status
+            with open(exporter.file_path(job["job_id"]), "rb") as f:
+                assert f.read(4) == b"%PDF"
+            # 暫存的日記檔在產生 PDF 後刪除
+            assert sorted(p.name for p in tmp_path.iterdir()) == [f"{job['job_id']}.pdf"]
+        finally:
+            await exporter.stop()
+    asyncio.run(run())
+
+def test_stalled_job_reported_as_failed(tmp_path):
+    async def run():
+        client = fakeredis.FakeAsyncRedis(decode_responses=True)
+        exporter = PdfExporter(client, FakePool([]), workers=1, export_dir=str(tmp_path))
+        await exporter._set_status({"job_id": "fresh", "user_id": 1, "status": "rendering"})
+        assert (await exporter.get_status("fresh", 1))["status"] == "rendering"
+        # 負責的 worker 重啟後工作停在 rendering：超過期限時回報失敗，並寫回 Redis
+        stalled = {"job_id": "stalled", "user_id": 1, "status": "rendering",
+                   "updated_at": (datetime.utcnow() - timedelta(seconds=pdf_export.PDF_JOB_TIMEOUT + 1)).isoformat()}
+        await client.set(pdf_export.pdf_job_key("stalled"), json.dumps(stalled))
+        assert (await exporter.get_status("stalled", 1))["status"] == "failed"
+        assert json.loads(await client.get(pdf_export.pdf_job_key("stalled")))["status"] == "failed"
+    asyncio.run(run())
@@ -0,0 +1,34 @@
+import asyncio
+import json
+import fakeredis
+from benchmarks.response_cache import legacy_hit, make_entries, run_benchmarks
+from models.diary import DiaryEntryResponse
+from services.response_cache import dump_entries, dump_entry, json_response
+from services.two_tier_cache import TwoTierCache
+
+def test_cached_bytes_match_response_model_output():
+    rows = make_entries(5)
+    body = dump_entries(rows)
+    # 與原本經過 response_model 的輸出相同（is_public 由 0/1 轉成布林、mood_data 巢狀）
+    assert json.loads(body) == json.loads(legacy_hit(json.dumps([DiaryEntryResponse(**row).dict() for row in rows])))
+    assert json.loads(dump_entry(rows[1]))["is_public"] is True
+    response = json_response(body.decode())
+    assert response.media_type == "application/json" and response.body == body
+
+def test_two_tier_cache_keeps_raw_json():
+    async def run():
+        client = fakeredis.FakeAsyncRedis(decode_responses=True)
+        cache = TwoTierCache(client, worker_id="w1")
+        body = dump_entries(make_entries(3))
+        await cache.set("partner_diary:1:g0", body, ttl=60, raw=True)
+        assert await cache.get("partner_diary:1:g0", raw=True) == body
+        cache.local.clear()
+        assert await cache.get("partner_diary:1:g0", raw=True) == body.decode()
+    asyncio.run(run())
+
+def test_benchmark_reports_cpu_per_request():
+    report = run_benchmarks(entries=100, iterations=5)
+    json.dumps(report)
+    results = report["results"]
+    assert report["entries"] == 100 and results["fast_hit"]["cpu_us_per_request"] >= 0
+    assert set(results) >= {"legacy_hit", "fast_hit", "legacy_miss", "fast_miss", "hit_speedup", "miss_speedup"}
@@ -0,0 +1,65 @@
+import random
+from services.matching import User, calculate_similarity
+from services.similarity_engine import SimilarityEngine
+from models.diary import DiaryEntryResponse
+
+WORDS = ["olympic", "running", "coffee", "rainy", "python", "music", "travel", "family", "sunset", "study"]
+
+def make_users(count, seed=42):
+    rng = random.Random(seed)
+    users = []
+    for user_id in range(1, count + 1):
+        user = User(user_id)
+        user.diary_entries = [
+            DiaryEntryResponse(id=user_id * 10 + i, user_id=user_id, title=f"Entry {i}",
+                               content=" ".join(rng.choices(WORDS, k=rng.randint(0, 6))),
+                               image_url=None, is_public=True, date=f"2023-01-{i + 1:02d}",
+                               created_at="2023-01-01T00:00:00", updated_at="2023-01-01T00:00:00")
+            for i in range(rng.randint(0, 3))
+        ]
+        user.calculate_posting_frequency()
+        user.like_count = rng.randint(0, 20)
+        user.weather_counts = {w: rng.randint(0, 5) for w in ['sunny', 'cloudy', 'rainy', 'snowy', 'windy']}
+        user.mood_scores = [float(rng.randint(1, 5)) for _ in range(rng.randint(0, 4))]
+        user.calculate_avg_mood_score()
+        users.append(user)
+    return users
+
+def test_engine_matches_calculate_similarity():
+    users = make_users(40)
+    engine = SimilarityEngine(users, target_keyword="olympic", block_size=16)
+    for start, stop, block in engine.iter_blocks():
+        for i in range(start, stop):
+            for j in range(len(users)):
+                assert block[i - start, j] == calculate_similarity(users[i], users[j], "olympic")
+
+def test_engine_partial_weather_keys():
+    user1 = User(1)
+    user2 = User(2)
+    user1.weather_counts = {'sunny': 5, 'cloudy': 3, 'rainy': 2}
+    user2.weather_counts = {'sunny': 4, 'foggy': 4}
+    engine = SimilarityEngine([user1, user2])
+    assert engine.score(0, 1) == calculate_similarity(user1, user2)
+
+def test_greedy_pairs_same_as_original_loop():
+    users = make_users(31, seed=7)
+    expected = []
+    remaining = list(users)
+    while len(remaining) >= 2:
+        user1 = remaining.pop()
+        best_match = max(remaining, key=lambda u: calculate_similarity(user1, u, "olympic"))
+        remaining.remove(best_match)
+        expected.append((user1.id, best_match.id))
+
+    engine = SimilarityEngine(users, target_keyword="olympic")
+    assert [(users[i].id, users[j].id) for i, j in engine.greedy_pairs()] == expected
+
+def test_greedy_pairs_with_lsh_candidates():
+    from services.keyword_lsh import KeywordLSH
+    users = make_users(60, seed=11)
+    engine = SimilarityEngine(users, target_keyword="olympic")
+    candidates = KeywordLSH(bands=32, rows_per_band=2).fit(engine.keywords).top_k_candidates(10)
+    pairs = engine.greedy_pairs(candidates)
+    matched = [index for pair in pairs for index in pair]
+    assert len(pairs) == 30
+    assert len(set(matched)) == 60
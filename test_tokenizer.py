@@ -0,0 +1,73 @@
+from services.tokenizer import tokenize, serialize_keywords, parse_keywords
+from services.diary_loader import MatchDiaryEntry
+from services.matching import User
+
+def test_english_stopwords_and_punctuation():
+    assert tokenize("Today is a GOOD day, and I love programming!") == {"today", "good", "day", "love", "programming"}
+
+def test_chinese_text_becomes_bigrams_without_function_words():
+    keywords = tokenize("今天下雨了，我和朋友去咖啡店看書")
+    assert {"下雨", "朋友", "咖啡", "看書"} <= keywords
+    assert "今天" not in keywords
+    assert not any(char in keyword for keyword in keywords for char in "了我和")
+
+def test_keywords_round_trip_through_column():
+    keywords = tokenize("週末跟家人去海邊散步 weekend walk")
+    assert parse_keywords(serialize_keywords(keywords)) == keywords
+    assert parse_keywords(None) == frozenset()
+
+def test_user_prefers_precomputed_keywords():
+    user = User(1)
+    user.diary_entries = [
+        MatchDiaryEntry(date="2023-01-01", keywords=frozenset({"咖啡", "running"})),
+        MatchDiaryEntry(date="2023-01-02", content="海邊 散步")
+    ]
+    assert user.get_all_keywords() == {"咖啡", "running", "海邊", "散步"}
+    user.diary_entries = user.diary_entries[:1]
+    assert user.get_all_keywords() == {"咖啡", "running"}
+    # 同一份清單只取一次聯集；換上新的清單時重新計算
+    assert user.get_all_keywords() is user.get_all_keywords()
+    user.diary_entries = [MatchDiaryEntry(date="2023-01-01", content="海邊")]
+    assert user.get_all_keywords() == {"海邊"}
+
+def test_keywords_column_created_once():
+    import mysql.connector
+    from services.diary_keywords import ensure_keywords_schema
+
+    class Cursor:
+        def __init__(self, db):
+            self.db = db
+
+        def execute(self, query, params=()):
+            if query.startswith("ALTER"):
+                # 其他 worker 已經加上欄位
+                if self.db.race:
+                    raise mysql.connector.Error(errno=1060)
+                self.db.altered = True
+
+        def fetchone(self):
+            return (int(self.db.altered),)
+
+        def close(self):
+            pass
+
+    class DB:
+        def __init__(self, race=False):
+            self.altered, self.race = False, race
+
+        def cursor(self):
+            return Cursor(self)
+
+        def close(self):
+            pass
+
+    class Pool:
+        def __init__(self, db):
+            self.db = db
+
+        def get_connection(self):
+            return self.db
+
+    pool = Pool(DB())
+    assert ensure_keywords_schema(pool) is True and ensure_keywords_schema(pool) is False
+    assert ensure_keywords_schema(Pool(DB(race=True))) is False
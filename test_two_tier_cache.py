@@ -0,0 +1,51 @@
+import asyncio
+import fakeredis
+from services.two_tier_cache import LocalCache, TwoTierCache
+
+def test_local_cache_ttl_and_size_limits():
+    cache = LocalCache(max_entries=3, max_bytes=100)
+    cache.set("a", 1, 40, ttl=10, now=0)
+    cache.set("b", 2, 40, ttl=10, now=0)
+    assert cache.get("a", now=1) == (True, 1)
+    # 超過位元組上限時淘汰最久沒用到的 b
+    cache.set("c", 3, 40, ttl=10, now=1)
+    assert cache.get("b", now=1) == (False, None) and cache.bytes == 80 and cache.evictions == 1
+    assert cache.get("a", now=11) == (False, None) and cache.bytes == 40
+    cache.set("huge", 4, 500, ttl=10, now=1)
+    assert cache.get("huge", now=1) == (False, None)
+
+def test_tiers_and_cross_worker_invalidation():
+    async def run():
+        server = fakeredis.FakeServer()
+        first = TwoTierCache(fakeredis.FakeAsyncRedis(server=server, decode_responses=True), worker_id="w1")
+        second = TwoTierCache(fakeredis.FakeAsyncRedis(server=server, decode_responses=True), worker_id="w2")
+        await first.start()
+        await second.start()
+        try:
+            assert await second.get("user_avatar:1") is None
+            await first.set("user_avatar:1", {"avatar_url": "a.png"}, ttl=3600)
+            assert await second.get("user_avatar:1") == {"avatar_url": "a.png"}
+            assert await second.get("user_avatar:1") == {"avatar_url": "a.png"}
+            assert second.stats()["redis_misses"] == 1 and second.stats()["redis_hits"] == 1
+            assert second.stats()["local_hits"] == 1 and second.stats()["local_bytes"] > 0
+
+            # 其他 worker 更新後，本地副本收到廣播而失效
+            await first.set("user_avatar:1", {"avatar_url": "b.png"}, ttl=3600)
+            for _ in range(50):
+                if second.stats()["invalidations_received"]:
+                    break
+                await asyncio.sleep(0.02)
+            assert await second.get("user_avatar:1") == {"avatar_url": "b.png"}
+
+            await second.invalidate("user_avatar:1")
+            for _ in range(50):
+                if first.stats()["invalidations_received"]:
+                    break
+                await asyncio.sleep(0.02)
+            assert await first.get("user_avatar:1") is None
+            # 自己送出的訊息不會清掉自己剛寫入的值
+            assert first.stats()["invalidations_received"] == 1
+        finally:
+            await first.stop()
+            await second.stop()
+    asyncio.run(run())
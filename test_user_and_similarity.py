@@ -69,4 +69,15 @@ def test_calculate_similarity_with_target_keyword():
         
     assert similarity_with_keyword > 0  # Should have similarity due to target keyword
     assert 0 <= similarity_with_keyword <= 1  # Similarity should be between 0 and 1
-    assert similarity_with_keyword > similarity_without_keyword  # Should have higher similarity with target keyword
\ No newline at end of file
+    assert similarity_with_keyword > similarity_without_keyword  # Should have higher similarity with target keyword
+
+def test_user_with_match_diary_entries():
+    from services.diary_loader import MatchDiaryEntry
+    user = User(1)
+    user.diary_entries = [
+        MatchDiaryEntry(date="2023-01-01", content="Running with friends"),
+        MatchDiaryEntry(date="2023-01-04", content="Coffee and running")
+    ]
+    user.calculate_posting_frequency()
+    assert user.posting_frequency == 0.5  # 2 entries over 4 days
+    assert user.get_all_keywords() == {"running", "friends", "coffee"}
@@ -0,0 +1,70 @@
+import asyncio
+import json
+import fakeredis
+import pytest
+from services.two_tier_cache import TwoTierCache
+from services.user_batch import AVATAR_COLUMNS, avatar_key, forbidden_profile_ids, load_users_batch, parse_ids
+
+class FakeCursor:
+    def __init__(self, db):
+        self.db = db
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        pass
+
+    async def execute(self, query, params):
+        self.db.queries.append((query, list(params)))
+        self.result = [{"id": i, "avatar_url": f"{i}.png"} for i in params if i in self.db.users]
+
+    async def fetchall(self):
+        return self.result
+
+    async def fetchone(self):
+        return {"partner_id": self.db.partner} if self.db.partner else None
+
+class FakeDB:
+    def __init__(self, users, partner=None):
+        self.users, self.queries, self.partner = users, [], partner
+
+    def cursor(self, dictionary=False):
+        return FakeCursor(self)
+
+def test_parse_ids():
+    assert parse_ids("3, 1,3,") == [3, 1]
+    for raw in ("", "a,b", ",".join(str(i) for i in range(301))):
+        with pytest.raises(ValueError):
+            parse_ids(raw)
+
+def test_one_mget_one_query_and_backfill():
+    async def run():
+        client = fakeredis.FakeAsyncRedis(decode_responses=True)
+        cache = TwoTierCache(client, worker_id="w1")
+        await client.set(avatar_key(2), json.dumps({"avatar_url": "cached.png"}))
+        db = FakeDB({1, 3})
+        users = await load_users_batch(cache, db, [1, 2, 3, 4], AVATAR_COLUMNS, avatar_key, 3600)
+        assert users == {1: {"avatar_url": "1.png"}, 2: {"avatar_url": "cached.png"},
+                         3: {"avatar_url": "3.png"}, 4: None}
+        # 只有未命中的 ID 進入同一個 IN 查詢
+        assert len(db.queries) == 1 and db.queries[0][1] == [1, 3, 4] and "IN (%s, %s, %s)" in db.queries[0][0]
+        assert json.loads(await client.get(avatar_key(3))) == {"avatar_url": "3.png"}
+        assert 0 < await client.ttl(avatar_key(3)) <= 3600
+
+        # 寫回後再查不需要資料庫，單筆端點也共用同一個鍵
+        cache.local.clear()
+        again = await load_users_batch(cache, db, [1, 2, 3], AVATAR_COLUMNS, avatar_key, 3600)
+        assert again[3] == {"avatar_url": "3.png"} and len(db.queries) == 1
+        assert await cache.get(avatar_key(1)) == {"avatar_url": "1.png"}
+    asyncio.run(run())
+
+def test_profiles_limited_to_self_and_current_partner():
+    async def run():
+        # 只查自己時不需要查詢配對
+        db = FakeDB(set(), partner=7)
+        assert await forbidden_profile_ids(db, 1, [1]) == [] and db.queries == []
+        assert await forbidden_profile_ids(db, 1, [1, 7]) == []
+        assert await forbidden_profile_ids(db, 1, [7, 8, 9]) == [8, 9]
+        assert await forbidden_profile_ids(FakeDB(set()), 1, [7]) == [7]
+    asyncio.run(run())
@@ -0,0 +1,97 @@
+import asyncio
+import multiprocessing
+import os
+import fakeredis
+import pytest
+import redis
+import redis.asyncio as aioredis
+from services.ws_broker import WebSocketBroker, presence_key
+
+REDIS_URL = os.getenv("TEST_REDIS_URL", "redis://localhost:6379/15")
+
+def redis_available():
+    try:
+        return redis.Redis.from_url(REDIS_URL, socket_connect_timeout=0.5).ping()
+    except redis.exceptions.RedisError:
+        return False
+
+def run_worker(worker_id, user_id, send_to, inbox, ready, go):
+    async def main():
+        client = aioredis.Redis.from_url(REDIS_URL, decode_responses=True)
+
+        async def deliver(target, message):
+            inbox.put((worker_id, target, message))
+            return True
+
+        broker = WebSocketBroker(client, deliver, worker_id=worker_id)
+        await broker.start()
+        await broker.register(user_id)
+        ready.put(worker_id)
+        await asyncio.get_running_loop().run_in_executor(None, go.wait)
+        for i in range(50):
+            await broker.send(send_to, f"{worker_id}-{i}")
+        await asyncio.sleep(1)
+        await broker.stop()
+        await client.aclose()
+
+    asyncio.run(main())
+
+@pytest.mark.skipif(not redis_available(), reason="需要本機 Redis")
+def test_two_worker_processes_relay_messages():
+    ctx = multiprocessing.get_context("spawn")
+    inbox, ready, go = ctx.Queue(), ctx.Queue(), ctx.Event()
+    workers = [
+        ctx.Process(target=run_worker, args=("worker-a", 1, 2, inbox, ready, go)),
+        ctx.Process(target=run_worker, args=("worker-b", 2, 1, inbox, ready, go))
+    ]
+    for worker in workers:
+        worker.start()
+    ready.get(timeout=10)
+    ready.get(timeout=10)
+    go.set()
+    received = [inbox.get(timeout=10) for _ in range(100)]
+    for worker in workers:
+        worker.join(timeout=10)
+
+    assert sorted(m for w, u, m in received if w == "worker-a") == sorted(f"worker-b-{i}" for i in range(50))
+    assert sorted(m for w, u, m in received if w == "worker-b") == sorted(f"worker-a-{i}" for i in range(50))
+    assert all(u == (1 if w == "worker-a" else 2) for w, u, m in received)
+
+def test_brokers_share_presence_and_batch_publishes():
+    async def run():
+        server = fakeredis.FakeServer()
+        received = {"a": [], "b": []}
+
+        def collector(name):
+            async def deliver(user_id, message):
+                received[name].append((user_id, message))
+                return True
+            return deliver
+
+        a = WebSocketBroker(fakeredis.FakeAsyncRedis(server=server, decode_responses=True), collector("a"), worker_id="a")
+        b = WebSocketBroker(fakeredis.FakeAsyncRedis(server=server, decode_responses=True), collector("b"), worker_id="b")
+        await a.start()
+        await b.start()
+        await a.register(1)
+        await b.register(2)
+
+        assert await a.send(1, "local")
+        for i in range(5):
+            assert await a.send(2, f"remote-{i}")
+        assert not await a.send(3, "offline")
+        await asyncio.sleep(0.3)
+
+        assert received["a"] == [(1, "local")]
+        assert received["b"] == [(2, f"remote-{i}") for i in range(5)]
+
+        # 用戶已重連到 b 時，a 的舊連線斷開不應清掉 presence
+        await a.register(2)
+        await b.register(2)
+        await a.unregister(2)
+        assert await b.redis_client.get(presence_key(2)) == "b"
+
+        await a.stop()
+        await b.stop()
+        assert await b.redis_client.get(presence_key(2)) is None
+
+    asyncio.run(run())
@@ -0,0 +1,98 @@
+import asyncio
+import json
+import fakeredis
+from services.ws_manager import ConnectionManager, PING_MESSAGE
+
+
+class FakeWebSocket:
+    def __init__(self, delay=0):
+        self.delay = delay
+        self.sent = []
+        self.accepted = False
+        self.close_code = None
+
+    async def accept(self):
+        self.accepted = True
+
+    async def send_text(self, message):
+        await asyncio.sleep(self.delay)
+        self.sent.append(message)
+
+    async def close(self, code=1000):
+        self.close_code = code
+
+async def decode_token(token):
+    return {"id": int(token)} if token and token.isdigit() else None
+
+def make_manager(**kwargs):
+    return ConnectionManager(fakeredis.FakeAsyncRedis(decode_responses=True), decode_token, **kwargs)
+
+def diary_event(partner_id, entry_id):
+    return json.dumps({"type": "partner_diary_updated", "data": {"partner_id": partner_id, "entry_id": entry_id}})
+
+def test_token_must_match_user_id():
+    async def run():
+        manager = make_manager()
+        websocket = FakeWebSocket()
+        assert await manager.connect(websocket, 1, "2") is None
+        assert await manager.connect(FakeWebSocket(), 1, None) is None
+        assert websocket.close_code == 1008
+        assert manager.stats()["auth_failures"] == 2
+        assert await manager.connect(FakeWebSocket(), 1, "1") is not None
+        assert manager.stats()["connections"] == 1
+
+    asyncio.run(run())
+
+def test_slow_client_does_not_block_others_and_is_evicted():
+    async def run():
+        manager = make_manager(max_queue_size=5)
+        slow, fast = FakeWebSocket(delay=10), FakeWebSocket()
+        await manager.connect(slow, 1, "1")
+        await manager.connect(fast, 2, "2")
+
+        for i in range(10):
+            await manager.send_personal_message(f"slow-{i}", 1)
+            await manager.send_personal_message(f"fast-{i}", 2)
+            await asyncio.sleep(0.005)
+        await asyncio.sleep(0.05)
+
+        assert fast.sent == [f"fast-{i}" for i in range(10)]
+        assert slow.close_code == 1013
+        stats = manager.stats()
+        assert stats["evicted_slow"] == 1
+        assert stats["connections"] == 1
+
+    asyncio.run(run())
+
+def test_queued_diary_updates_are_coalesced():
+    async def run():
+        manager = make_manager()
+        websocket = FakeWebSocket(delay=0.01)
+        connection = await manager.connect(websocket, 1, "1")
+        for entry_id in range(5):
+            manager.enqueue(connection, diary_event(2, entry_id))
+        manager.enqueue(connection, diary_event(3, 9))
+        await asyncio.sleep(0.1)
+
+        entries = [(e["data"]["partner_id"], e["data"]["entry_id"]) for e in map(json.loads, websocket.sent)]
+        assert entries == [(2, 4), (3, 9)]
+        assert manager.stats()["messages_coalesced"] == 4
+
+    asyncio.run(run())
+
+def test_heartbeat_pings_and_evicts_idle_connections():
+    async def run():
+        manager = make_manager(heartbeat_interval=0.02, idle_timeout=0.1)
+        await manager.start()
+        websocket = FakeWebSocket()
+        await manager.connect(websocket, 1, "1")
+        await asyncio.sleep(0.05)
+        assert PING_MESSAGE in websocket.sent
+
+        await asyncio.sleep(0.15)
+        assert websocket.close_code == 1001
+        assert manager.stats()["evicted_idle"] == 1
+        assert manager.active_connections == {}
+        await manager.stop()
+
+    asyncio.run(run())
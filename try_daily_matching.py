@@ -65,14 +65,12 @@ async def test_daily_matching():
         users = []
         for user_data in test_users:
             user = User(user_data['id'])
-            entries = await mock_get_diary_entries(0, 100, {"id": user.id}, db)
-            for entry in entries:
-                user.add_diary_entry(entry)
+            user.diary_entries = await mock_get_diary_entries(0, 100, {"id": user.id}, db)
             user.calculate_posting_frequency()
             users.append(user)
 
         # 執行日記匹配
-        matches = await daily_matching(db)
+        matches = await daily_matching()
 
         # 輸出結果
         print(f"找到 {len(matches)} 對匹配：")